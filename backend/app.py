@@ -1,17 +1,37 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
-import joblib
 import pandas as pd
+import ipaddress
 import math
-import json
 import os
 import time
 import psutil
+import tempfile
 from datetime import datetime
 import urllib3
 from dotenv import load_dotenv
 import threading
 import random
+from explain import PriceExplainer
+from batch_jobs import OUTPUT_FORMATS, BatchJobError, BatchJobManager
+from metrics_aggregator import DEFAULT_ALLOWLIST, MetricsAggregator
+from live_metrics import DASHBOARD_STREAM_SCRIPT, MetricsBroadcaster, TooManySubscribers
+from timeseries import DASHBOARD_CHARTS_HTML, TimeSeriesStore, dashboard_series, parse_resolution
+from idempotency import IdempotencyConflict, IdempotencyIndex, IdempotencyInProgress, content_hash
+from sketches import RollingQuantiles
+from compression import CompressionMiddleware
+from traffic_recorder import RECORDED_HEADERS, TrafficRecorder
+from admission import BATCH, INTERACTIVE, AdmissionController, Rejected
+from deadlines import DEADLINE_HEADER, STAGES, DeadlineExceeded, check_deadline, parse_deadline
+from model_registry import ModelRegistry, UnknownModel
+from pricing import FEATURES, build_sweep_grid, fallback_price, predict_prices
+from vehicle_store import open_store
+from change_feed import ChangeFeed, TooManyStreams, default_path
+from vehicle_table import VehicleTable
+from suggest_index import SuggestIndex
+from market_stats import DIMENSIONS, MarketStats
+from drift_monitor import DriftMonitor, default_profile_path
+from thread_budget import ThreadBudget
 
 # Disable SSL warnings for Splunk Cloud
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -22,10 +42,21 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)  # Enable CORS for frontend connections
 
+# Compresión gzip en streaming de respuestas grandes (listados, exportaciones, batch)
+COMPRESSION_ENABLED = os.environ.get("COMPRESSION_ENABLED", "true").lower() == "true"
+compression = CompressionMiddleware(
+    app.wsgi_app,
+    level=int(os.environ.get("COMPRESSION_LEVEL", "6")),
+    min_size=int(os.environ.get("COMPRESSION_MIN_SIZE", "1024")),
+)
+if COMPRESSION_ENABLED:
+    app.wsgi_app = compression
+
 # Monitoring variables
 start_time = time.time()
 request_count = 0
 prediction_count = 0
+shed_counts = {stage: 0 for stage in STAGES}
 
 # Continuous monitoring flag
 continuous_monitoring = True
@@ -36,29 +67,12 @@ SPLUNK_REALM = "us1"
 SPLUNK_URL = f"https://ingest.{SPLUNK_REALM}.signalfx.com/v2/datapoint"
 
 
-@app.before_request
-def count_requests():
-    global request_count
-    request_count += 1
-
-
-def send_to_splunk_observability(metric_name, value, dimensions=None):
-    """Send metrics to Splunk Observability Cloud"""
+def post_to_splunk(payload):
+    """Send one batched payload of aggregated metrics to Splunk Observability Cloud"""
     try:
         import requests
 
         headers = {"X-SF-Token": SPLUNK_TOKEN, "Content-Type": "application/json"}
-
-        if dimensions is None:
-            dimensions = {}
-
-        # Add default dimensions
-        dimensions.update({"service": "car-price-backend", "environment": "development", "host": "localhost"})
-
-        payload = {
-            "gauge": [{"metric": metric_name, "value": value, "dimensions": dimensions, "timestamp": int(time.time() * 1000)}]
-        }
-
         response = requests.post(SPLUNK_URL, json=payload, headers=headers, timeout=5)
         if response.status_code != 200:
             print(f"❌ Splunk error: {response.status_code} - {response.text}")
@@ -66,6 +80,91 @@ def send_to_splunk_observability(metric_name, value, dimensions=None):
         print(f"❌ Splunk error: {e}")
 
 
+# Pre-aggregation: nothing leaves the process per request, only one batch per interval
+metrics = MetricsAggregator(
+    post_to_splunk,
+    default_dimensions={"service": "car-price-backend", "environment": "development", "host": "localhost"},
+    flush_interval=float(os.environ.get("METRICS_FLUSH_INTERVAL", "10")),
+    label_allowlist=[d for d in os.environ.get("METRICS_LABEL_ALLOWLIST", ",".join(DEFAULT_ALLOWLIST)).split(",") if d],
+    top_k=int(os.environ.get("METRICS_TOP_K", "20")),
+)
+metrics.start()
+
+# Local history for the dashboard (1s x 15 min, 1m x 24 h), independent of Splunk
+timeseries = TimeSeriesStore()
+timeseries.start()
+
+# Latency percentiles per endpoint over 1/5/15 min, merged across worker processes
+latency_sketches = RollingQuantiles(shared_dir=os.environ.get("METRICS_SHARED_DIR"), prefix="backend")
+latency_sketches.start()
+
+# Captura opcional de tráfico real para reproducirlo con scripts/replay-traffic.py
+TRAFFIC_RECORD_DIR = os.environ.get("TRAFFIC_RECORD_DIR")
+traffic_recorder = None
+if TRAFFIC_RECORD_DIR:
+    traffic_recorder = TrafficRecorder(
+        TRAFFIC_RECORD_DIR,
+        sample_rate=float(os.environ.get("TRAFFIC_SAMPLE_RATE", "0.01")),
+        prefix="backend",
+        max_file_bytes=int(os.environ.get("TRAFFIC_MAX_FILE_MB", "64")) * 1024 * 1024,
+        max_files=int(os.environ.get("TRAFFIC_MAX_FILES", "10")),
+    )
+
+PRICE_BUCKETS = (5000, 10000, 15000, 20000, 30000, 40000, 60000, 80000, 120000)
+MONTHS_BUCKETS = (3, 6, 12, 24, 36, 60, 120)
+
+
+@app.before_request
+def count_requests():
+    global request_count
+    request_count += 1
+    g.request_started = time.perf_counter()
+    if traffic_recorder is not None and traffic_recorder.should_capture(request.path):
+        # El cuerpo se guarda en caché antes de que la vista consuma el stream
+        small = (request.content_length or 0) <= traffic_recorder.max_body_bytes
+        g.captured_body = request.get_data(cache=True) if small else None
+        g.capture_traffic = True
+
+
+def capture_traffic(response, latency_ms):
+    """Entrega la petición muestreada al hilo del recorder"""
+    headers = {name: request.headers[name] for name in RECORDED_HEADERS if name in request.headers}
+    passthrough = response.is_streamed or response.direct_passthrough
+    traffic_recorder.capture(
+        request.method,
+        request.path,
+        request.query_string.decode("latin-1"),
+        headers,
+        g.get("captured_body"),
+        response.status_code,
+        latency_ms,
+        None if passthrough else response.get_data(),
+    )
+
+
+@app.after_request
+def record_latency(response):
+    started = g.get("request_started")
+    if started is not None:
+        latency_ms = (time.perf_counter() - started) * 1000
+        endpoint = request.endpoint or "unknown"
+        g.response_status = response.status_code
+        metrics.histogram("car_price.http.latency_ms", latency_ms, {"endpoint": endpoint, "status": response.status_code})
+        timeseries.record("http", latency_ms)
+        timeseries.record(f"http.{endpoint}", latency_ms)
+        latency_sketches.record(endpoint, latency_ms)
+        if response.status_code >= 500:
+            timeseries.record("http.errors")
+        if g.get("capture_traffic"):
+            capture_traffic(response, latency_ms)
+    return response
+
+
+def send_to_splunk_observability(metric_name, value, dimensions=None):
+    """Record a gauge; it is exported with the next aggregated batch"""
+    metrics.gauge(metric_name, value, dimensions)
+
+
 def send_continuous_metrics():
     """Send continuous system and business metrics to Splunk Observability Cloud"""
     while continuous_monitoring:
@@ -96,25 +195,261 @@ def send_continuous_metrics():
 monitoring_thread = threading.Thread(target=send_continuous_metrics, daemon=True)
 monitoring_thread.start()
 
-# === Cargar modelo entrenado ===
+# === Presupuesto de hilos: núcleos (afinidad y cuota cgroup) repartidos entre workers y pools nativos ===
+thread_budget = ThreadBudget(
+    workers=int(os.environ.get("WEB_CONCURRENCY", "1")),
+    native_threads=int(os.environ.get("NATIVE_THREADS", "0")),
+    pin=os.environ.get("THREAD_PIN", "false").lower() == "true",
+    slot_dir=os.environ.get("THREAD_SLOT_DIR"),
+).apply()
+
+# === Registro de modelos: MODEL_DIR con varios *.joblib, o el único MODEL_PATH ===
 model_path = os.environ.get("MODEL_PATH", "modelo/modelo.joblib")
-try:
-    modelo = joblib.load(model_path)
-except FileNotFoundError:
-    print(f"Warning: ML model not found at {model_path}, using fallback prediction")
-    modelo = None
+MODEL_DIR = os.environ.get("MODEL_DIR")
+registry_options = {
+    "default": os.environ.get("MODEL_DEFAULT"),
+    "memory_budget_bytes": int(os.environ.get("MODEL_MEMORY_BUDGET_MB", "0")) * 1024 * 1024,
+    "on_load": thread_budget.configure_model,
+}
+if MODEL_DIR:
+    model_registry = ModelRegistry.from_directory(MODEL_DIR, **registry_options)
+else:
+    model_registry = ModelRegistry({os.path.splitext(os.path.basename(model_path))[0]: model_path}, **registry_options)
+# El modelo por defecto se carga al arrancar; los demás, en su primer uso
+model_registry.get()
+
+
+def export_drift(report):
+    """Exporta el PSI por variable con el siguiente lote agregado"""
+    for feature, scores in report.get("features", {}).items():
+        metrics.gauge("car_price.drift.psi", scores["psi"], {"feature": feature})
+
+
+# === Monitor de deriva: entradas de /current_value_market frente al perfil de entrenamiento del modelo ===
+DRIFT_PROFILE_PATH = os.environ.get("DRIFT_PROFILE_PATH") or default_profile_path(model_registry.get().path)
+drift_monitor = None
+if os.environ.get("DRIFT_ENABLED", "true").lower() == "true" and os.path.exists(DRIFT_PROFILE_PATH):
+    drift_monitor = DriftMonitor.from_file(
+        DRIFT_PROFILE_PATH,
+        window_seconds=float(os.environ.get("DRIFT_WINDOW_SECONDS", "3600")),
+        min_samples=int(os.environ.get("DRIFT_MIN_SAMPLES", "200")),
+        on_report=export_drift,
+    )
+    drift_monitor.start(interval=float(os.environ.get("DRIFT_INTERVAL", "60")))
+
+
+def drift_report():
+    """Última evaluación de deriva (calculada en segundo plano, nunca por petición)"""
+    if drift_monitor is None:
+        return {"status": "sin_perfil", "profile": DRIFT_PROFILE_PATH}
+    return drift_monitor.report()
+
 
 # === Configuración de almacenamiento de vehículos ===
 DB_FILE = os.environ.get("DB_PATH", "vehiculos.json")
-if not os.path.exists(DB_FILE):
-    os.makedirs(os.path.dirname(DB_FILE), exist_ok=True)
-    with open(DB_FILE, "w") as f:
-        json.dump([], f)
+# Con VEHICLE_SHARDS > 1 los anuncios se reparten en N shards (importados de DB_FILE la primera vez)
+VEHICLE_SHARDS = int(os.environ.get("VEHICLE_SHARDS", "1"))
+vehicle_store = open_store(DB_FILE, VEHICLE_SHARDS, directory=os.environ.get("VEHICLE_SHARD_DIR"))
+VEHICLES_PAGE_MAX = 500
+
+# Registro ordenado de publicaciones para consumidores incrementales (/vehicles/changes)
+change_feed = ChangeFeed(
+    os.environ.get("CHANGE_FEED_PATH", default_path(DB_FILE)),
+    max_streams=int(os.environ.get("CHANGE_FEED_MAX_STREAMS", "100")),
+)
+CHANGES_PAGE_MAX = 1000
+CHANGES_MAX_WAIT = 60
+
+# Copia columnar en memoria para /vehicles: filtros vectorizados, al día vía change feed
+VEHICLE_TABLE_ENABLED = os.environ.get("VEHICLE_TABLE_ENABLED", "true").lower() == "true"
+vehicle_table = VehicleTable.from_store(vehicle_store, change_feed) if VEHICLE_TABLE_ENABLED else None
+
+# Autocompletado de brand_model: trie con top-K por prefijo, al día vía change feed
+SUGGEST_TOP_K = int(os.environ.get("SUGGEST_TOP_K", "10"))
+if vehicle_table is not None:
+    vehicle_table.catch_up(change_feed)
+    suggest_index = SuggestIndex.from_table(vehicle_table, top_k=SUGGEST_TOP_K)
+else:
+    suggest_index = SuggestIndex.from_store(vehicle_store, change_feed, top_k=SUGGEST_TOP_K)
+
+# Estadísticas de mercado por segmento (combustible × transmisión × año, con agregados), al día vía change feed
+if vehicle_table is not None:
+    market_stats = MarketStats.from_table(vehicle_table)
+else:
+    market_stats = MarketStats.from_store(vehicle_store, change_feed)
+
+# === Índice de idempotencia para reintentos de publish_car ===
+idempotency_index = IdempotencyIndex(
+    max_entries=int(os.environ.get("IDEMPOTENCY_MAX_KEYS", "10000")),
+    ttl_seconds=float(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "86400")),
+    content_ttl_seconds=float(os.environ.get("IDEMPOTENCY_CONTENT_TTL_SECONDS", "300")),
+)
+
+# === Explicaciones de precio (contribuciones por variable, con caché por modelo) ===
+EXPLAIN_CACHE_SIZE = int(os.environ.get("EXPLAIN_CACHE_SIZE", "4096"))
+MAX_EXPLAIN_BATCH = int(os.environ.get("MAX_EXPLAIN_BATCH", "1000"))
+
+# Límite de puntos por barrido what-if para proteger al worker
+MAX_SWEEP_POINTS = int(os.environ.get("MAX_SWEEP_POINTS", "2500"))
+
+# === Trabajos de puntuación por lotes (archivos grandes, asíncronos) ===
+batch_jobs = BatchJobManager(
+    spool_dir=os.environ.get("BATCH_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "car_price_batch")),
+    model_getter=lambda name: model_registry.get(name).model,
+    max_workers=int(os.environ.get("BATCH_WORKERS", "2")),
+    chunk_size=int(os.environ.get("BATCH_CHUNK_SIZE", "50000")),
+    max_upload_bytes=int(os.environ.get("BATCH_MAX_UPLOAD_BYTES", str(1 << 30))),
+    max_spool_bytes=int(os.environ.get("BATCH_MAX_SPOOL_BYTES", str(4 << 30))),
+    result_ttl_seconds=float(os.environ.get("BATCH_RESULT_TTL_SECONDS", "86400")),
+    max_jobs=int(os.environ.get("BATCH_MAX_JOBS", "100")),
+)
+
+
+@app.before_request
+def read_deadline():
+    """Lee el deadline del llamador y descarta la petición si ya venció al llegar"""
+    g.deadline = parse_deadline(request.headers.get(DEADLINE_HEADER))
+    check_stage("parse")
+
+
+def check_stage(stage):
+    """Frontera de etapa: lanza DeadlineExceeded si el llamador ya no espera la respuesta"""
+    check_deadline(g.get("deadline"), stage)
+
+
+@app.errorhandler(DeadlineExceeded)
+def shed_expired_request(e):
+    """Trabajo vencido: se corta sin predecir ni guardar y se cuenta como descartado"""
+    shed_counts[e.stage] += 1
+    metrics.counter("car_price.requests.shed", 1, {"endpoint": request.endpoint or "unknown", "action": e.stage})
+    return jsonify({"error": "Deadline vencido: la petición fue descartada", "etapa": e.stage}), 504
+
+
+# === Control de admisión: límite por cliente + concurrencia adaptativa ===
+ADMISSION_ENABLED = os.environ.get("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_TRUST_FORWARDED = os.environ.get("ADMISSION_TRUST_FORWARDED", "false").lower() == "true"
+# Proxies (el frontend) cuyo X-Forwarded-For identifica al usuario: sin esto todos compartirían su cubeta.
+# Por defecto sólo loopback; en despliegues con red propia se configura la dirección del frontend.
+ADMISSION_TRUSTED_PROXIES = [
+    ipaddress.ip_network(net.strip())
+    for net in os.environ.get("ADMISSION_TRUSTED_PROXIES", "127.0.0.0/8,::1/128").split(",")
+    if net.strip()
+]
+admission = AdmissionController(
+    rate=float(os.environ.get("ADMISSION_RATE_PER_CLIENT", "100")),
+    burst=float(os.environ.get("ADMISSION_BURST", "200")),
+    initial_limit=int(os.environ.get("ADMISSION_INITIAL_CONCURRENCY", "16")),
+    min_limit=int(os.environ.get("ADMISSION_MIN_CONCURRENCY", "2")),
+    max_limit=int(os.environ.get("ADMISSION_MAX_CONCURRENCY", "128")),
+    batch_share=float(os.environ.get("ADMISSION_BATCH_SHARE", "0.25")),
+)
+# Rutas protegidas y su clase; las demás (health, métricas, dashboard) no pasan por el control
+ADMISSION_ROUTES = {
+    "current_value_market": INTERACTIVE,
+    "future_prediction": INTERACTIVE,
+    "publish_car": INTERACTIVE,
+    "explain_price": INTERACTIVE,
+    "what_if": INTERACTIVE,
+    "list_vehicles": INTERACTIVE,
+    "submit_batch_job": BATCH,
+}
+
+
+def trusted_proxy(address):
+    """True si la dirección es un proxy de confianza (por defecto, sólo loopback)"""
+    try:
+        ip = ipaddress.ip_address(address or "")
+    except ValueError:
+        return False
+    return any(ip in net for net in ADMISSION_TRUSTED_PROXIES)
+
+
+def client_id():
+    """Identidad del cliente para el límite de tasa (X-Forwarded-For sólo si se confía en el proxy)
+
+    Se recorre X-Forwarded-For desde la derecha saltando proxies de confianza: el primer salto que
+    no lo es es el cliente. Lo que queda a su izquierda lo escribió el propio cliente y no se usa.
+    """
+    client = request.remote_addr or "unknown"
+    if not (ADMISSION_TRUST_FORWARDED or trusted_proxy(client)):
+        return client
+    for hop in reversed(request.headers.get("X-Forwarded-For", "").split(",")):
+        hop = hop.strip()
+        if not hop:
+            continue
+        client = hop
+        if not trusted_proxy(hop):
+            break
+    return client
+
+
+@app.before_request
+def admit_request():
+    """Admite o rechaza al instante (429/503 con Retry-After) en vez de encolar"""
+    route_priority = priority = ADMISSION_ROUTES.get(request.endpoint)
+    if not ADMISSION_ENABLED or priority is None:
+        return None
+    if request.headers.get("X-Traffic-Class", "").lower() == BATCH:
+        priority = BATCH  # La cabecera sólo puede bajar la prioridad, nunca subirla
+    try:
+        # La cubeta del cliente se cobra según la ruta: bajar a batch con la cabecera no la esquiva
+        g.admission_ticket = admission.admit(client_id(), priority, rate_limited=route_priority == INTERACTIVE)
+    except Rejected as e:
+        metrics.counter("car_price.requests.rejected", 1, {"endpoint": request.endpoint, "status": e.status})
+        response = jsonify({"error": e.reason, "reintentar_en_segundos": e.retry_after})
+        response.status_code = e.status
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response
+    return None
+
+
+@app.teardown_request
+def release_admission(exc):
+    ticket = g.pop("admission_ticket", None)
+    if ticket is not None:
+        ok = exc is None and g.get("response_status", 500) < 500
+        admission.release(ticket, time.perf_counter() - g.request_started, ok=ok)
+
+
+@app.before_request
+def select_model():
+    """Resuelve el modelo pedido por cabecera X-Model o parámetro ?model= antes de la vista"""
+    name = request.headers.get("X-Model") or request.args.get("model")
+    if name:
+        try:
+            # Arrendado hasta el teardown: el presupuesto de memoria no lo descarga a mitad de petición
+            g.model_entry = model_registry.acquire(name)
+        except UnknownModel:
+            return jsonify({"error": f"Modelo desconocido: {name}", "disponibles": model_registry.names()}), 404
+
+
+@app.teardown_request
+def release_model(exc):
+    entry = g.pop("model_entry", None)
+    if entry is not None:
+        model_registry.release(entry)
+
+
+def current_model():
+    """Modelo elegido para esta petición (o el modelo por defecto)"""
+    return g.get("model_entry") or model_registry.get()
+
+
+def price_explainer():
+    """Explicador del modelo actual, creado en su primer uso y descartado al descargarlo"""
+    entry = current_model()
+    if "explainer" not in entry.attachments:
+        entry.attachments["explainer"] = PriceExplainer.from_model(entry.model, cache_size=EXPLAIN_CACHE_SIZE)
+    return entry.attachments["explainer"]
 
 
 # === Funciones auxiliares basadas en el notebook ===
 def predict_price(data: dict):
     """Predice el precio actual del vehículo usando el modelo entrenado."""
+    check_stage("predict")
+    entry = current_model()
+    modelo = entry.model  # Una sola lectura: la predicción no depende de lo que haga el registro después
+    started = time.perf_counter()
     try:
         if modelo is not None:
             df = pd.DataFrame([data])
@@ -122,13 +457,11 @@ def predict_price(data: dict):
             return float(pred)
     except Exception as e:
         print(f"ML model error: {e}, using fallback")
+    finally:
+        model_registry.record(entry, (time.perf_counter() - started) * 1000)
 
     # Fallback calculation
-    base_price = 15000 + (data["model_year"] - 2000) * 500 - data["age"] * 800
-    fuel_bonus = {"Electric": 3000, "Hybrid": 1500, "Gasoline": 0, "Diesel": -500}.get(data["fuel_type"], 0)
-    trans_bonus = 500 if data["transmission"] == "Automatic" else 0
-    title_bonus = 1000 if data["clean_title"] == 1 else -2000
-    return max(base_price + fuel_bonus + trans_bonus + title_bonus, 5000)
+    return fallback_price(data)
 
 
 def predict_future_price(current_price, months_ahead=12, k_rate=None):
@@ -153,9 +486,28 @@ def home():
                 "GET /current_value_market": "Predice el precio actual del vehículo",
                 "GET /future_prediction": "Predice el precio futuro del vehículo en N meses",
                 "POST /publish_car": "Permite publicar un vehículo en venta",
+                "GET /vehicles": "Lista paginada de vehículos publicados (after_id, limit, filtros)",
+                "GET /vehicles/changes": "Publicaciones desde un offset (?since=), por long-poll o SSE",
+                "GET /vehicles/suggest": "Sugerencias de brand_model por prefijo (?q=), con conteos",
+                "GET /market/stats": (
+                    "Precio y precio recomendado por segmento (fuel_type, transmission, model_year, group_by)"
+                ),
+                "GET /explain_price": "Explica el precio estimado por variable de entrada",
+                "POST /explain_price": "Explica un lote de vehículos en una sola pasada",
+                "POST /what_if": "Barre una o dos variables y devuelve la matriz de precios",
+                "POST /batch_jobs": "Encola un archivo CSV/NDJSON para puntuación asíncrona",
+                "GET /batch_jobs/<job_id>": "Estado y progreso de un trabajo por lotes",
+                "GET /batch_jobs/<job_id>/result": "Descarga el resultado (CSV o NDJSON)",
                 "GET /health": "Health check endpoint",
                 "GET /dashboard": "Real-time monitoring dashboard",
                 "GET /metrics/json": "JSON metrics API",
+                "GET /metrics/stream": "Métricas en vivo por Server-Sent Events",
+                "GET /metrics/timeseries": "Historial local por serie (1s x 15 min, 1m x 24 h)",
+            },
+            "modelos": {
+                "disponibles": model_registry.names(),
+                "por_defecto": model_registry.default,
+                "seleccion": "Cabecera X-Model o parámetro ?model=",
             },
         }
     )
@@ -199,22 +551,23 @@ def current_value_market():
             "transmission": transmission,
             "clean_title": float(clean_title),
         }
+        check_stage("predict")
 
         global prediction_count
         prediction_count += 1
 
-        # Send metrics to Splunk Observability Cloud
-        send_to_splunk_observability(
-            "car_price.predictions.current_value",
-            1,
-            {"fuel_type": fuel_type, "transmission": transmission, "endpoint": "current_value_market"},
-        )
-        send_to_splunk_observability("car_price.system.cpu_percent", psutil.cpu_percent())
-        send_to_splunk_observability("car_price.system.memory_percent", psutil.virtual_memory().percent)
-        send_to_splunk_observability("car_price.requests.total", prediction_count)
+        # Aggregated metrics for Splunk Observability Cloud (CPU/memory come from the sampling thread)
+        dimensiones = {"fuel_type": fuel_type, "transmission": transmission, "endpoint": "current_value_market"}
+        metrics.counter("car_price.predictions.current_value", 1, dimensiones)
+        metrics.gauge("car_price.requests.total", prediction_count)
 
         pred = predict_price(data)
+        metrics.histogram("car_price.predictions.value", pred, dimensiones, buckets=PRICE_BUCKETS)
+        if drift_monitor is not None:
+            drift_monitor.observe(data)
         return jsonify({"datos": data, "current_value_market_estimado": round(pred, 2)})
+    except DeadlineExceeded:
+        raise
     except ValueError as e:
         return jsonify({"error": f"Error de conversión: {str(e)}"}), 400
     except Exception as e:
@@ -260,12 +613,13 @@ def future_prediction():
             "transmission": transmission,
             "clean_title": float(clean_title),
         }
+        check_stage("predict")
 
         global prediction_count
         prediction_count += 1
 
-        # Send metrics to Splunk Observability Cloud
-        send_to_splunk_observability(
+        # Aggregated metrics for Splunk Observability Cloud
+        metrics.counter(
             "car_price.predictions.future_value",
             1,
             {
@@ -275,8 +629,10 @@ def future_prediction():
                 "endpoint": "future_prediction",
             },
         )
-        send_to_splunk_observability("car_price.business.months_forecast", meses)
-        send_to_splunk_observability("car_price.requests.total", prediction_count)
+        metrics.histogram(
+            "car_price.business.months_forecast", meses, {"endpoint": "future_prediction"}, buckets=MONTHS_BUCKETS
+        )
+        metrics.gauge("car_price.requests.total", prediction_count)
 
         pred_actual = predict_price(data)
         pred_futura = predict_future_price(pred_actual, months_ahead=meses)
@@ -289,13 +645,147 @@ def future_prediction():
                 "precio_estimado_futuro": round(pred_futura, 2),
             }
         )
+    except DeadlineExceeded:
+        raise
     except ValueError as e:
         return jsonify({"error": f"Error de conversión: {str(e)}"}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
 
+# === Explicación del precio por variable ===
+def _parse_vehicle(source) -> dict:
+    """Convierte los cinco campos del modelo; KeyError/ValueError si faltan o son inválidos."""
+    return {
+        "model_year": float(source["model_year"]),
+        "age": float(source["age"]),
+        "fuel_type": str(source["fuel_type"]),
+        "transmission": str(source["transmission"]),
+        "clean_title": float(source["clean_title"]),
+    }
+
+
+@app.route("/explain_price", methods=["GET", "POST"])
+def explain_price():
+    explainer = price_explainer()
+    if explainer is None:
+        return jsonify({"error": "Explicaciones no disponibles: el modelo no está cargado"}), 503
+    try:
+        if request.method == "GET":
+            data = _parse_vehicle(request.args)
+            check_stage("predict")
+            return jsonify(dict(explainer.explain(data), datos=data))
+
+        payload = request.get_json() or {}
+        if not isinstance(payload, dict):
+            return jsonify({"error": "El cuerpo debe ser un objeto JSON con 'vehiculos'"}), 400
+        vehiculos = payload.get("vehiculos") or []
+        if not isinstance(vehiculos, list) or not vehiculos or len(vehiculos) > MAX_EXPLAIN_BATCH:
+            return jsonify({"error": f"Envíe entre 1 y {MAX_EXPLAIN_BATCH} vehículos en 'vehiculos'"}), 400
+        datos = [_parse_vehicle(v) for v in vehiculos]
+        check_stage("predict")
+        explicaciones = explainer.explain_many(datos)
+        return jsonify({"explicaciones": [dict(e, datos=d) for e, d in zip(explicaciones, datos)]})
+    except KeyError as e:
+        return jsonify({"error": f"Falta el parámetro {e}", "requeridos": FEATURES}), 400
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Error de conversión: {str(e)}"}), 400
+
+
+# === What-if: barrido de sensibilidad en una sola llamada al modelo ===
+@app.route("/what_if", methods=["POST"])
+def what_if():
+    try:
+        payload = request.get_json() or {}
+        if not isinstance(payload, dict):
+            return jsonify({"error": "El cuerpo debe ser un objeto JSON"}), 400
+        base, sweep = payload.get("base") or {}, payload.get("sweep") or {}
+        if not isinstance(base, dict) or not isinstance(sweep, dict):
+            return jsonify({"error": "'base' y 'sweep' deben ser objetos JSON"}), 400
+        features, axes, grid = build_sweep_grid(base, sweep, MAX_SWEEP_POINTS)
+
+        global prediction_count
+        prediction_count += 1
+
+        check_stage("predict")
+        entry = current_model()
+        started = time.perf_counter()
+        precios = predict_prices(entry.model, grid).round(2)
+        model_registry.record(entry, (time.perf_counter() - started) * 1000)
+        if len(features) == 2:
+            precios = precios.reshape(len(axes[features[0]]), len(axes[features[1]]))
+
+        return jsonify(
+            {
+                "base": {f: base.get(f) for f in grid.columns if f not in features},
+                "features": features,
+                "axes": axes,
+                "values": precios.tolist(),
+                "points": int(grid.shape[0]),
+            }
+        )
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+
+def _store_vehicle(data: dict):
+    """Guarda el vehículo y construye la respuesta de publicación."""
+    # Calcular precio recomendado con el modelo
+    pred = predict_price(
+        {
+            "model_year": float(data["model_year"]),
+            "age": float(data["age"]),
+            "fuel_type": data["fuel_type"],
+            "transmission": data["transmission"],
+            "clean_title": float(data["clean_title"]),
+        }
+    )
+
+    # Se guarda junto a la versión del modelo para que el backfill sepa qué re-puntuar
+    data["precio_recomendado_modelo"] = round(pred, 2)
+    data["modelo_version"] = current_model().version
+    check_stage("storage")
+    # Almacén y feed bajo el mismo lock: quien cargue el almacén encuentra la entrada al asentarse el feed
+    with change_feed.publishing() as append:
+        nuevo_id = vehicle_store.publish(data)
+        append("publish", nuevo_id, data)
+
+    return {
+        "message": "Vehículo publicado con éxito",
+        "vehiculo_id": nuevo_id,
+        "precio_publicado": data["precio"],
+        "precio_recomendado_modelo": round(pred, 2),
+        "datos": data,
+    }
+
+
 # === Endpoint 3: publish car ===
+def _publish_once(data: dict):
+    """Publica respetando la idempotencia: un reintento con la misma Idempotency-Key
+    (o el mismo contenido sin clave) devuelve la respuesta original sin tocar el
+    almacenamiento ni el modelo."""
+    idem_key = request.headers.get("Idempotency-Key")
+    digest = content_hash(data)
+    try:
+        respuesta_previa = idempotency_index.begin(idem_key, digest)
+    except IdempotencyConflict as e:
+        return jsonify({"error": str(e)}), 422
+    except IdempotencyInProgress as e:
+        return jsonify({"error": str(e)}), 409
+    if respuesta_previa is not None:
+        response = jsonify(respuesta_previa)
+        response.headers["Idempotent-Replayed"] = "true"
+        return response, 201
+
+    try:
+        respuesta = _store_vehicle(data)
+    except Exception:
+        idempotency_index.release(idem_key, digest)
+        raise
+    idempotency_index.complete(idem_key, digest, respuesta)
+    return jsonify(respuesta), 201
+
+
 @app.route("/publish_car", methods=["POST"])
 def publish_car():
     try:
@@ -312,56 +802,209 @@ def publish_car():
         if not all(campo in data for campo in campos):
             return jsonify({"error": f"Faltan campos: {', '.join(campos)}"}), 400
 
-        # Leer base
-        with open(DB_FILE, "r") as f:
-            vehiculos = json.load(f)
+        return _publish_once(data)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
 
-        nuevo_id = len(vehiculos) + 1
-        data["id"] = nuevo_id
 
-        vehiculos.append(data)
-        with open(DB_FILE, "w") as f:
-            json.dump(vehiculos, f, indent=4)
+def _filtro_vehiculos(filtros):
+    """Predicado por igualdad de campos para recorrer el almacén (None si no hay filtros)"""
+    if not filtros:
+        return None
+    return lambda vehiculo: all(vehiculo.get(campo) == valor for campo, valor in filtros.items())
 
-        # Calcular precio recomendado con el modelo
-        pred = predict_price(
-            {
-                "model_year": float(data["model_year"]),
-                "age": float(data["age"]),
-                "fuel_type": data["fuel_type"],
-                "transmission": data["transmission"],
-                "clean_title": float(data["clean_title"]),
-            }
-        )
 
-        return (
-            jsonify(
-                {
-                    "message": "Vehículo publicado con éxito",
-                    "vehiculo_id": nuevo_id,
-                    "precio_publicado": data["precio"],
-                    "precio_recomendado_modelo": round(pred, 2),
-                    "datos": data,
-                }
-            ),
-            201,
+@app.route("/vehicles", methods=["GET"])
+def list_vehicles():
+    """Página de anuncios ordenada por id, desde la tabla columnar o recorriendo el almacén (en paralelo si hay shards)"""
+    try:
+        after_id = int(request.args.get("after_id", "0"))
+        limit = int(request.args.get("limit", "50"))
+    except ValueError:
+        return jsonify({"error": "after_id y limit deben ser enteros"}), 400
+    if not 1 <= limit <= VEHICLES_PAGE_MAX:
+        return jsonify({"error": f"limit debe estar entre 1 y {VEHICLES_PAGE_MAX}"}), 400
+    filtros = {campo: request.args[campo] for campo in ("fuel_type", "transmission") if request.args.get(campo)}
+
+    if vehicle_table is not None:
+        # Incorpora lo publicado por cualquier worker desde la última consulta
+        vehicle_table.catch_up(change_feed)
+        vehiculos = vehicle_table.query(after_id=after_id, limit=limit, **filtros)
+    else:
+        vehiculos = vehicle_store.query(_filtro_vehiculos(filtros), after_id=after_id, limit=limit)
+    siguiente = vehiculos[-1]["id"] if len(vehiculos) == limit else None
+    return jsonify({"vehiculos": vehiculos, "cantidad": len(vehiculos), "siguiente_after_id": siguiente})
+
+
+@app.route("/vehicles/suggest", methods=["GET"])
+def suggest_vehicles():
+    """Autocompletado de brand_model: los más publicados con una palabra que empieza por ?q="""
+    q = request.args.get("q", "")
+    try:
+        limit = int(request.args.get("limit", str(SUGGEST_TOP_K)))
+    except ValueError:
+        return jsonify({"error": "limit debe ser entero"}), 400
+    if not 1 <= limit <= SUGGEST_TOP_K:
+        return jsonify({"error": f"limit debe estar entre 1 y {SUGGEST_TOP_K}"}), 400
+    suggest_index.catch_up(change_feed)
+    return jsonify({"q": q, "sugerencias": suggest_index.suggest(q, limit)})
+
+
+@app.route("/market/stats", methods=["GET"])
+def market_segment_stats():
+    """Estadísticas de precio de un segmento; los filtros omitidos agregan esa dimensión"""
+    filtros = {campo: request.args.get(campo) for campo in ("fuel_type", "transmission") if request.args.get(campo)}
+    group_by = [campo for campo in request.args.get("group_by", "").split(",") if campo]
+    try:
+        if request.args.get("model_year"):
+            filtros["model_year"] = int(request.args["model_year"])
+    except ValueError:
+        return jsonify({"error": "model_year debe ser entero"}), 400
+    desconocidas = set(group_by) - set(DIMENSIONS)
+    if desconocidas:
+        return jsonify({"error": f"group_by admite sólo: {', '.join(DIMENSIONS)}"}), 400
+
+    market_stats.catch_up(change_feed)
+    resumen = market_stats.get(**filtros)
+    if resumen is None:
+        return jsonify({"error": "Sin datos para el segmento", "segmento": filtros}), 404
+    if group_by:
+        resumen["segmentos"] = market_stats.breakdown(group_by, **filtros)
+    return jsonify(resumen)
+
+
+@app.route("/vehicles/changes", methods=["GET"])
+def vehicle_changes():
+    """Cambios posteriores a ?since= (o Last-Event-ID); SSE si se pide text/event-stream"""
+    try:
+        since = int(request.args.get("since") or request.headers.get("Last-Event-ID") or "0")
+        limit = int(request.args.get("limit", "100"))
+        wait = float(request.args.get("wait", "25"))
+    except ValueError:
+        return jsonify({"error": "since, limit y wait deben ser numéricos"}), 400
+    if since < 0 or not 1 <= limit <= CHANGES_PAGE_MAX:
+        return jsonify({"error": f"since debe ser >= 0 y limit estar entre 1 y {CHANGES_PAGE_MAX}"}), 400
+
+    if request.args.get("stream") == "sse" or request.accept_mimetypes.best == "text/event-stream":
+        try:
+            events = change_feed.stream(since)
+        except TooManyStreams as e:
+            return jsonify({"error": str(e)}), 503
+        response = Response(
+            stream_with_context(events),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
         )
-    except Exception as e:
-        return jsonify({"error": str(e)}), 400
+        # Libera la plaza aunque el cliente se vaya antes del primer evento
+        response.call_on_close(events.close)
+        return response
 
+    cambios = change_feed.wait(since, limit=limit, timeout=max(0.0, min(wait, CHANGES_MAX_WAIT)))
+    siguiente = cambios[-1]["offset"] if cambios else since
+    return jsonify({"cambios": cambios, "siguiente_since": siguiente, "ultimo_offset": change_feed.last_offset()})
+
+
+# === Endpoint 4: batch scoring jobs ===
+def _batch_input_format(filename, content_type):
+    """Deduce el formato de entrada por extensión o Content-Type."""
+    name = (filename or "").lower()
+    if name.endswith((".ndjson", ".jsonl")) or "ndjson" in (content_type or ""):
+        return "ndjson"
+    return "csv"
+
+
+@app.route("/batch_jobs", methods=["POST"])
+def submit_batch_job():
+    output_format = request.args.get("output_format") or request.form.get("output_format") or "csv"
+    upload = request.files.get("file")
+    modelo = current_model().name  # X-Model / ?model= se fija al crear el trabajo
+    try:
+        if upload is not None:
+            input_format = request.form.get("input_format") or _batch_input_format(upload.filename, upload.mimetype)
+            job = batch_jobs.submit(upload.stream, input_format, output_format, model=modelo)
+        else:
+            # Cuerpo crudo: evita el archivo temporal del parser multipart
+            input_format = request.args.get("input_format") or _batch_input_format(None, request.content_type)
+            job = batch_jobs.submit(request.stream, input_format, output_format, model=modelo)
+    except BatchJobError as e:
+        return jsonify({"error": str(e)}), e.status_code
+
+    body = job.to_dict()
+    body["status_url"] = f"/batch_jobs/{job.job_id}"
+    body["result_url"] = f"/batch_jobs/{job.job_id}/result"
+    return jsonify(body), 202
+
+
+@app.route("/batch_jobs/<job_id>", methods=["GET"])
+def batch_job_status(job_id):
+    job = batch_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Trabajo no encontrado o expirado"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route("/batch_jobs/<job_id>/result", methods=["GET"])
+def batch_job_result(job_id):
+    job = batch_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Trabajo no encontrado o expirado"}), 404
+    if job.status != "completed":
+        return jsonify({"error": "El resultado aún no está disponible", "status": job.status}), 409
+    return send_file(
+        job.result_path,
+        mimetype=OUTPUT_FORMATS[job.output_format],
+        as_attachment=True,
+        download_name=f"{job.job_id}.{job.output_format}",
+    )
+
+
+def live_snapshot():
+    """Single shared sample pushed to every /metrics/stream subscriber"""
+    last_minute = latency_sketches.combined(1)
+    drift = drift_report()
+    return {
+        "requests_total": request_count,
+        "predictions_total": prediction_count,
+        "cpu_percent": psutil.cpu_percent(),
+        "memory_percent": psutil.virtual_memory().percent,
+        "uptime_seconds": int(time.time() - start_time),
+        "latency_p95_ms": round(last_minute.quantile(0.95), 1),
+        "latency_p99_ms": round(last_minute.quantile(0.99), 1),
+        "drift_status": drift["status"],
+        "drift_psi_max": drift.get("psi_max", "–"),
+        **dashboard_series(timeseries),
+    }
+
+
+live_metrics = MetricsBroadcaster(
+    live_snapshot,
+    interval=float(os.environ.get("LIVE_METRICS_INTERVAL", "2")),
+    max_subscribers=int(os.environ.get("LIVE_METRICS_MAX_SUBSCRIBERS", "100")),
+)
+
+
+@app.route("/metrics/stream")
+def metrics_stream():
+    """Server-Sent Events: full snapshot on connect, then deltas from the shared sampler"""
+    try:
+        events = live_metrics.stream()
+    except TooManySubscribers as e:
+        return jsonify({"error": str(e)}), 503
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-@app.route("/dashboard")
-def dashboard():
-    uptime = time.time() - start_time
-    cpu_usage = psutil.cpu_percent()
-    memory_usage = psutil.virtual_memory().percent
 
-    return f"""
+# Static shell: values arrive through /metrics/stream, so serving it costs nothing per refresh
+DASHBOARD_HTML = f"""
     <!DOCTYPE html>
     <html>
     <head>
         <title>🔧 Backend API - Monitoring</title>
-        <meta http-equiv="refresh" content="5">
         <style>
             body {{ font-family: Arial; margin: 40px; background: #2c3e50; color: white; }}
             .metric {{ background: #34495e; padding: 20px; margin: 10px 0; border-radius: 8px; }}
@@ -373,31 +1016,47 @@ def dashboard():
     <body>
         <h1>🔧 Backend API Monitoring (Port 5002)</h1>
         <div class="metric">
-            <div class="value">{request_count}</div>
+            <div class="value" data-key="requests_total">–</div>
             <div class="label">Total API Requests</div>
         </div>
         <div class="metric">
-            <div class="value">{prediction_count}</div>
+            <div class="value" data-key="predictions_total">–</div>
             <div class="label">ML Predictions Made</div>
         </div>
         <div class="metric">
-            <div class="value">{cpu_usage:.1f}%</div>
+            <div class="value" data-key="cpu_percent">–</div>
             <div class="label">CPU Usage</div>
         </div>
         <div class="metric">
-            <div class="value">{memory_usage:.1f}%</div>
+            <div class="value" data-key="memory_percent">–</div>
             <div class="label">Memory Usage</div>
         </div>
         <div class="metric">
-            <div class="value">{int(uptime//3600)}h {int((uptime%3600)//60)}m</div>
+            <div class="value" data-key="uptime_seconds">–</div>
             <div class="label">Uptime</div>
         </div>
+        <div class="metric">
+            <div class="value"><span data-key="latency_p95_ms">–</span> / <span data-key="latency_p99_ms">–</span> ms</div>
+            <div class="label">Latency p95 / p99 (last minute)</div>
+        </div>
+        <div class="metric">
+            <div class="value"><span data-key="drift_status">–</span> (PSI max <span data-key="drift_psi_max">–</span>)</div>
+            <div class="label">Input Drift vs Training Profile</div>
+        </div>
+        {DASHBOARD_CHARTS_HTML}
+        <p><small>Live via Server-Sent Events: <span id="live-status">connecting...</span></small></p>
         <div class="splunk">
             <strong>📊 Splunk Observability:</strong> <a href="https://app.us1.signalfx.com" target="_blank" style="color: white;">View Dashboards</a>
         </div>
+        {DASHBOARD_STREAM_SCRIPT}
     </body>
     </html>
-    """
+"""
+
+
+@app.route("/dashboard")
+def dashboard():
+    return DASHBOARD_HTML, 200, {"Cache-Control": "public, max-age=300"}
 
 
 @app.route("/metrics/json")
@@ -411,13 +1070,41 @@ def metrics_json():
             "uptime_seconds": uptime,
             "requests_total": request_count,
             "predictions_total": prediction_count,
+            "requests_shed": dict(shed_counts),
+            "admission": admission.stats(),
+            "compression": compression.stats() if COMPRESSION_ENABLED else None,
             "system": {"cpu_percent": psutil.cpu_percent(), "memory_percent": psutil.virtual_memory().percent},
+            "latency_ms": latency_sketches.report(),
+            "models": model_registry.stats(),
+            "storage": vehicle_store.describe(),
+            "change_feed": change_feed.stats(),
+            "vehicle_table": vehicle_table.stats() if vehicle_table is not None else None,
+            "suggest_index": suggest_index.stats(),
+            "market_stats": market_stats.stats(),
+            "drift": drift_report(),
             "status": "healthy",
             "splunk_observability": True,
         }
     )
 
 
+@app.route("/metrics/timeseries")
+def metrics_timeseries():
+    """Recent history of one series from the in-process ring buffers"""
+    series = request.args.get("series")
+    if not series:
+        return jsonify({"series": timeseries.series_names()})
+    try:
+        step = parse_resolution(request.args.get("resolution", "1s"))
+        window = int(request.args.get("window", "300"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    result = timeseries.query(series, step=step, window=window)
+    if result is None:
+        return jsonify({"error": f"Serie o resolución desconocida: {series} @ {step}s"}), 404
+    return jsonify(result)
+
+
 @app.route("/health")
 def health_check():
     return jsonify(
@@ -425,7 +1112,10 @@ def health_check():
             "status": "healthy",
             "service": "backend-api",
             "timestamp": datetime.now().isoformat(),
-            "model_loaded": modelo is not None,
+            "model_loaded": model_registry.get().model is not None,
+            "model_version": model_registry.get().version,
+            "models": model_registry.names(),
+            "threads": thread_budget.layout(),
             "splunk_observability": f"https://app.{SPLUNK_REALM}.signalfx.com",
         }
     )
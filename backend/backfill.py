@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""Re-score every stored listing with the current model.
+
+Streams listings from the vehicle store, scores them in chunks on a process
+pool with the vectorized ``predict_prices`` and writes
+``precio_recomendado_modelo`` back tagged with ``modelo_version``. Each
+rewritten listing is also appended to the change feed as an ``update``, so
+running services refresh their in-memory copies without a restart.
+
+Progress is checkpointed next to the store, so an interrupted run resumes
+where it stopped as long as the model version has not changed:
+
+    cd backend && python backfill.py --workers 4 --chunk-size 5000
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from change_feed import ChangeFeed, default_path
+from pricing import FEATURES, load_model, model_version, predict_prices
+from thread_budget import ThreadBudget
+from vehicle_store import open_store
+
+# Modelo cargado una vez por proceso del pool
+_worker_model = None
+
+
+def _init_worker(model_path: str) -> None:
+    global _worker_model
+    _worker_model = load_model(model_path)
+    # Un hilo nativo por proceso (modelo y pools BLAS/OpenMP): el paralelismo ya lo da el pool
+    ThreadBudget(native_threads=1).apply().configure_model(_worker_model)
+
+
+def _score_chunk(chunk: Tuple[int, List[Any], List[Dict[str, Any]]]) -> Tuple[int, List[Any], List[float]]:
+    index, ids, rows = chunk
+    prices = predict_prices(_worker_model, rows)
+    return index, ids, [round(float(p), 2) for p in prices]
+
+
+class Checkpoint:
+    """Resume state: rows already scored and their results for one model version."""
+
+    def __init__(self, db_path: str, version: str):
+        self.version = version
+        self.state_path = f"{db_path}.backfill.json"
+        self.results_path = f"{db_path}.backfill.ndjson"
+        self.rows_done = 0
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                state = json.load(f)
+            if state.get("modelo_version") == version:
+                self.rows_done = state["rows_done"]
+        if self.rows_done == 0 and os.path.exists(self.results_path):
+            os.unlink(self.results_path)
+
+    def commit(self, ids: List[Any], prices: List[float], rows: int) -> None:
+        """Persist results first, then advance the offset (a crash in between only repeats work)."""
+        with open(self.results_path, "a") as f:
+            for vehiculo_id, price in zip(ids, prices):
+                f.write(json.dumps([vehiculo_id, price]) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.rows_done += rows
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"modelo_version": self.version, "rows_done": self.rows_done}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def results(self) -> Dict[Any, float]:
+        scored = {}
+        if os.path.exists(self.results_path):
+            with open(self.results_path) as f:
+                for line in f:
+                    vehiculo_id, price = json.loads(line)
+                    scored[vehiculo_id] = price
+        return scored
+
+    def clear(self) -> None:
+        for path in (self.state_path, self.results_path):
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+def _chunks(listings: Iterator[Dict[str, Any]], chunk_size: int, version: str, force: bool):
+    """Group listings into (index, ids, feature rows, rows consumed) chunks."""
+    index = 0
+    while True:
+        batch = list(islice(listings, chunk_size))
+        if not batch:
+            return
+        pending = [v for v in batch if force or v.get("modelo_version") != version]
+        ids = [v.get("id") for v in pending]
+        rows = [{k: v.get(k) for k in FEATURES} for v in pending]
+        yield index, ids, rows, len(batch)
+        index += 1
+
+
+def run_backfill(
+    db_path: str,
+    model_path: str,
+    workers: Optional[int] = None,
+    chunk_size: int = 5000,
+    force: bool = False,
+    shards: int = 1,
+    feed_path: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Re-score the store and write results back; returns run statistics."""
+    store = open_store(db_path, shards, directory=os.environ.get("VEHICLE_SHARD_DIR"))
+    feed = ChangeFeed(feed_path or default_path(db_path))
+    version = model_version(model_path)
+    checkpoint = Checkpoint(db_path, version)
+    resumed_from = checkpoint.rows_done
+    workers = workers or os.cpu_count() or 1
+
+    listings = islice(store.iter_listings(), resumed_from, None)
+    started = time.perf_counter()
+    scored_rows = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_path,)) as pool:
+        in_flight = {}
+        next_commit = 0
+        chunks = _chunks(listings, chunk_size, version, force)
+        for index, ids, rows, consumed in chunks:
+            in_flight[index] = (pool.submit(_score_chunk, (index, ids, rows)), consumed)
+            # Commit in stream order so the checkpoint offset stays contiguous
+            while next_commit in in_flight and (len(in_flight) > workers * 2 or in_flight[next_commit][0].done()):
+                future, done_rows = in_flight.pop(next_commit)
+                _, done_ids, prices = future.result()
+                checkpoint.commit(done_ids, prices, done_rows)
+                scored_rows += len(done_ids)
+                next_commit += 1
+        while next_commit in in_flight:
+            future, done_rows = in_flight.pop(next_commit)
+            _, done_ids, prices = future.result()
+            checkpoint.commit(done_ids, prices, done_rows)
+            scored_rows += len(done_ids)
+            next_commit += 1
+
+    updates = {
+        vehiculo_id: {"precio_recomendado_modelo": price, "modelo_version": version}
+        for vehiculo_id, price in checkpoint.results().items()
+    }
+    updated = store.update_many(updates)
+    # Después de escribir el almacén: quien lea la actualización ya la encuentra guardada
+    feed.append_many("update", updates.items())
+    checkpoint.clear()
+    elapsed = time.perf_counter() - started
+    return {
+        "modelo_version": version,
+        "resumed_from": resumed_from,
+        "rows_scored": scored_rows,
+        "rows_updated": updated,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(scored_rows / elapsed, 1) if elapsed > 0 else None,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Re-score stored listings with the current model")
+    parser.add_argument("--db", default=os.environ.get("DB_PATH", "vehiculos.json"), help="Vehicle store (DB_PATH)")
+    parser.add_argument("--model", default=os.environ.get("MODEL_PATH", "modelo/modelo.joblib"), help="Model (MODEL_PATH)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Listings per scoring chunk")
+    parser.add_argument("--force", action="store_true", help="Re-score listings already tagged with this version")
+    parser.add_argument(
+        "--shards", type=int, default=int(os.environ.get("VEHICLE_SHARDS", "1")), help="Store shards (VEHICLE_SHARDS)"
+    )
+    parser.add_argument(
+        "--feed", default=os.environ.get("CHANGE_FEED_PATH"), help="Change feed (CHANGE_FEED_PATH, default next to --db)"
+    )
+    args = parser.parse_args(argv)
+
+    stats = run_backfill(
+        args.db,
+        args.model,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        force=args.force,
+        shards=args.shards,
+        feed_path=args.feed,
+    )
+    print(
+        f"✅ Backfill {stats['modelo_version']}: {stats['rows_scored']} rows scored, "
+        f"{stats['rows_updated']} updated in {stats['seconds']}s ({stats['rows_per_second']} rows/sec)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""Asynchronous batch-scoring jobs.
+
+Partners upload CSV or NDJSON files that are too large for a synchronous
+request. Each upload is spooled to disk, scored on a background worker pool
+in streamed chunks with ``predict_prices`` and written to a result file that
+can be downloaded as CSV or NDJSON. Disk usage is bounded: uploads have a
+size cap, the spool directory has a total budget, inputs are deleted once
+scored and finished jobs expire after a retention period.
+"""
+
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Dict, Iterator, Optional
+
+import pandas as pd
+
+from pricing import predict_prices
+
+INPUT_FORMATS = {"csv", "ndjson"}
+OUTPUT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+PREDICTION_COLUMN = "current_value_market_estimado"
+
+
+class BatchJobError(Exception):
+    """Base error for rejected submissions; ``status_code`` is the HTTP status to return."""
+
+    status_code = 400
+
+
+class UploadTooLarge(BatchJobError):
+    status_code = 413
+
+
+class SpoolFull(BatchJobError):
+    status_code = 507
+
+
+class BatchJob:
+    """State of one scoring job, safe to serialize for polling."""
+
+    def __init__(self, job_id: str, job_dir: str, input_format: str, output_format: str, model: Optional[str] = None):
+        self.job_id = job_id
+        self.job_dir = job_dir
+        self.input_format = input_format
+        self.output_format = output_format
+        self.model = model  # Modelo elegido al crear el trabajo: todo el archivo se puntúa con él
+        self.input_path = os.path.join(job_dir, f"input.{input_format}")
+        self.result_path = os.path.join(job_dir, f"result.{output_format}")
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.input_bytes = 0
+        self.total_rows: Optional[int] = None
+        self.rows_processed = 0
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        progress = None
+        if self.total_rows:
+            progress = round(min(self.rows_processed / self.total_rows, 1.0), 4)
+        elif self.status == "completed":
+            progress = 1.0
+        elapsed = (self.finished_at or time.time()) - self.started_at if self.started_at else None
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "error": self.error,
+            "input_format": self.input_format,
+            "output_format": self.output_format,
+            "model": self.model,
+            "input_bytes": self.input_bytes,
+            "total_rows": self.total_rows,
+            "rows_processed": self.rows_processed,
+            "progress": progress,
+            "rows_per_second": round(self.rows_processed / elapsed, 1) if elapsed else None,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def _count_rows(path: str, input_format: str) -> int:
+    """Fast newline count used as the progress denominator."""
+    lines = 0
+    last = b"\n"
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            lines += block.count(b"\n")
+            last = block[-1:]
+    if last != b"\n":
+        lines += 1
+    return max(lines - 1, 0) if input_format == "csv" else lines
+
+
+def _read_chunks(path: str, input_format: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    if input_format == "csv":
+        return pd.read_csv(path, chunksize=chunk_size)
+    return pd.read_json(path, lines=True, chunksize=chunk_size)
+
+
+class BatchJobManager:
+    """Spools uploads and scores them on a bounded worker pool.
+
+    Args:
+        spool_dir: Directory holding per-job inputs and results.
+        model_getter: Returns the model to score with for a model name (None means fallback).
+        max_workers: Concurrent scoring jobs.
+        chunk_size: Rows read and scored per ``predict`` call.
+        max_upload_bytes: Largest accepted upload.
+        max_spool_bytes: Total disk budget for inputs and results.
+        result_ttl_seconds: How long finished jobs and results are kept.
+        max_jobs: Finished jobs retained before the oldest are dropped.
+    """
+
+    def __init__(
+        self,
+        spool_dir: str,
+        model_getter: Callable[[Optional[str]], Any],
+        max_workers: int = 2,
+        chunk_size: int = 50000,
+        max_upload_bytes: int = 1 << 30,
+        max_spool_bytes: int = 4 << 30,
+        result_ttl_seconds: float = 86400.0,
+        max_jobs: int = 100,
+    ):
+        self.spool_dir = spool_dir
+        self.model_getter = model_getter
+        self.chunk_size = chunk_size
+        self.max_upload_bytes = max_upload_bytes
+        self.max_spool_bytes = max_spool_bytes
+        self.result_ttl_seconds = result_ttl_seconds
+        self.max_jobs = max_jobs
+        self._jobs: Dict[str, BatchJob] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch-job")
+        os.makedirs(spool_dir, exist_ok=True)
+        self._remove_stale_dirs()
+
+    def _remove_stale_dirs(self) -> None:
+        """Drop job directories left behind by a previous process past their retention."""
+        cutoff = time.time() - self.result_ttl_seconds
+        for name in os.listdir(self.spool_dir):
+            path = os.path.join(self.spool_dir, name)
+            if os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def spool_usage(self) -> int:
+        total = 0
+        for root, _, files in os.walk(self.spool_dir):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+
+    def submit(self, stream: BinaryIO, input_format: str, output_format: str = "csv", model: Optional[str] = None) -> BatchJob:
+        """Spool an upload and queue it for scoring with ``model`` (the getter's default when None)."""
+        if input_format not in INPUT_FORMATS:
+            raise BatchJobError(f"Formato de entrada no soportado: {input_format}")
+        if output_format not in OUTPUT_FORMATS:
+            raise BatchJobError(f"Formato de salida no soportado: {output_format}")
+        self.evict_expired()
+        budget = min(self.max_upload_bytes, self.max_spool_bytes - self.spool_usage())
+        if budget <= 0:
+            raise SpoolFull("Espacio de spool agotado, intente más tarde")
+
+        job_id = uuid.uuid4().hex
+        job = BatchJob(job_id, os.path.join(self.spool_dir, job_id), input_format, output_format, model)
+        os.makedirs(job.job_dir)
+        try:
+            job.input_bytes = self._spool(stream, job.input_path, budget)
+        except BaseException:
+            shutil.rmtree(job.job_dir, ignore_errors=True)
+            raise
+
+        with self._lock:
+            self._jobs[job_id] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    def _spool(self, stream: BinaryIO, path: str, budget: int) -> int:
+        written = 0
+        with open(path, "wb") as out:
+            for block in iter(lambda: stream.read(1 << 20), b""):
+                written += len(block)
+                if written > budget:
+                    if budget < self.max_upload_bytes:
+                        raise SpoolFull("Espacio de spool agotado, intente más tarde")
+                    raise UploadTooLarge(f"El archivo supera el máximo de {self.max_upload_bytes} bytes")
+                out.write(block)
+        return written
+
+    def _run(self, job: BatchJob) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.total_rows = _count_rows(job.input_path, job.input_format)
+            modelo = self.model_getter(job.model)
+            first = True
+            with open(job.result_path, "w", encoding="utf-8", newline="") as out:
+                for chunk in _read_chunks(job.input_path, job.input_format, self.chunk_size):
+                    chunk[PREDICTION_COLUMN] = predict_prices(modelo, chunk).round(2)
+                    if job.output_format == "csv":
+                        chunk.to_csv(out, header=first, index=False)
+                    else:
+                        out.write(chunk.to_json(orient="records", lines=True, force_ascii=False))
+                    first = False
+                    job.rows_processed += len(chunk)
+            job.status = "completed"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            if os.path.exists(job.result_path):
+                os.unlink(job.result_path)
+        finally:
+            job.finished_at = time.time()
+            # La entrada ya no hace falta: libera spool en cuanto termina
+            if os.path.exists(job.input_path):
+                os.unlink(job.input_path)
+
+    def get(self, job_id: str) -> Optional[BatchJob]:
+        self.evict_expired()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def evict_expired(self) -> None:
+        """Delete expired jobs, then the oldest finished ones beyond ``max_jobs``."""
+        now = time.time()
+        with self._lock:
+            finished = sorted((j for j in self._jobs.values() if j.finished), key=lambda j: j.finished_at)
+            expired = [j for j in finished if now - j.finished_at > self.result_ttl_seconds]
+            overflow = len(self._jobs) - len(expired) - self.max_jobs
+            if overflow > 0:
+                expired += [j for j in finished if j not in expired][:overflow]
+            for job in expired:
+                del self._jobs[job.job_id]
+        for job in expired:
+            shutil.rmtree(job.job_dir, ignore_errors=True)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,322 @@
+"""Ordered change log of published and updated listings.
+
+Every successful publish appends one JSON line to ``changes.jsonl`` with an
+offset one higher than the previous entry; a re-scoring backfill appends one
+``update`` entry per listing with only the fields it rewrote. Offsets are
+allocated under an ``flock``, so several worker processes (or nodes sharing
+the volume) write one gap-free sequence. Consumers keep the last offset they
+processed and ask for everything after it, either by long-polling or over
+SSE, so a search index or cache catches up in O(changes) instead of
+re-reading the whole store.
+
+Reads locate ``since`` by binary search over byte positions (lines are
+ordered by offset), so resuming from any point costs O(log size) seeks and
+needs no index shared between processes.
+"""
+
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+TAIL_BLOCK = 1 << 16
+
+
+def default_path(db_path: str) -> str:
+    """Log kept next to the vehicle store when ``CHANGE_FEED_PATH`` is not set."""
+    return f"{os.path.splitext(db_path)[0]}.changes.jsonl"
+
+
+class TooManyStreams(Exception):
+    """The configured limit of open change streams has been reached."""
+
+
+def _encode(entry: Dict[str, Any]) -> bytes:
+    payload = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+    return f"id: {entry['offset']}\nevent: {entry['op']}\ndata: {payload}\n\n".encode("utf-8")
+
+
+class ChangeStream:
+    """SSE iterator of one change stream; holds a stream slot until ``close``.
+
+    Closing is idempotent and works before the first iteration, so the
+    response can release the slot (``Response.call_on_close``) even when
+    the client disconnects before any byte is sent.
+    """
+
+    def __init__(self, feed: "ChangeFeed", since: int):
+        self._feed = feed
+        self._events = feed._events(since)
+        self._open = True
+
+    def __iter__(self) -> "ChangeStream":
+        return self
+
+    def __next__(self) -> bytes:
+        return next(self._events)
+
+    def close(self) -> None:
+        self._events.close()
+        with self._feed._streams_lock:
+            if self._open:
+                self._open = False
+                self._feed._streams -= 1
+
+
+class ChangeFeed:
+    """Append-only, offset-addressed log with long-poll and SSE readers.
+
+    Args:
+        path: JSON Lines file holding the log.
+        poll_interval: Seconds between checks for entries written by other processes.
+        heartbeat: Seconds of silence before an SSE keep-alive comment is sent.
+        max_streams: SSE streams allowed at once (each holds a server thread).
+    """
+
+    def __init__(self, path: str, poll_interval: float = 0.5, heartbeat: float = 15.0, max_streams: int = 100):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        self.max_streams = max_streams
+        self._cond = threading.Condition()
+        self._tail: Tuple[int, int] = (-1, 0)  # (tamaño del archivo, último offset) ya leídos
+        self._streams = 0
+        self._streams_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        open(path, "ab").close()
+
+    @property
+    def streams(self) -> int:
+        return self._streams
+
+    def _last_entry_offset(self, f, size: int) -> int:
+        """Offset of the last complete line, reading backwards from ``size``."""
+        end = size
+        while end > 0:
+            start = max(0, end - TAIL_BLOCK)
+            f.seek(start)
+            block = f.read(size - start)
+            lines = block.rstrip(b"\n").split(b"\n")
+            if len(lines) > 1 or start == 0:
+                return json.loads(lines[-1])["offset"] if lines[-1] else 0
+            end = start
+        return 0
+
+    def last_offset(self) -> int:
+        """Offset of the newest entry (0 for an empty log)."""
+        size = os.path.getsize(self.path)
+        cached_size, cached_offset = self._tail
+        if size == cached_size:
+            return cached_offset
+        with open(self.path, "rb") as f:
+            # Sólo cuentan líneas completas: un append en curso aún no existe
+            f.seek(0, os.SEEK_END)
+            complete = self._complete_size(f, size)
+            offset = self._last_entry_offset(f, complete) if complete else 0
+        self._tail = (size, offset)
+        return offset
+
+    @staticmethod
+    def _complete_size(f, size: int) -> int:
+        """Length of the file up to its last newline."""
+        pos = size
+        while pos > 0:
+            start = max(0, pos - TAIL_BLOCK)
+            f.seek(start)
+            block = f.read(pos - start)
+            cut = block.rfind(b"\n")
+            if cut >= 0:
+                return start + cut + 1
+            pos = start
+        return 0
+
+    @contextmanager
+    def _locked(self, mode: int = fcntl.LOCK_EX) -> Iterator[None]:
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write(self, op: str, changes: Iterable[Tuple[Any, Dict[str, Any]]]) -> int:
+        """Append entries with the lock held; returns the last offset."""
+        with open(self.path, "rb+") as f:
+            size = f.seek(0, os.SEEK_END)
+            complete = self._complete_size(f, size)
+            if complete != size:
+                # Restos de un append interrumpido: se descartan antes de seguir
+                f.truncate(complete)
+            offset = self._last_entry_offset(f, complete) if complete else 0
+            f.seek(complete)
+            ts = round(time.time(), 3)
+            for vehicle_id, data in changes:
+                offset += 1
+                entry = {"offset": offset, "ts": ts, "op": op, "id": vehicle_id, "vehiculo": data}
+                f.write(json.dumps(entry, ensure_ascii=False, default=str).encode("utf-8") + b"\n")
+            self._tail = (f.tell(), offset)
+        return offset
+
+    def _wake(self) -> None:
+        with self._cond:
+            self._cond.notify_all()
+
+    def append(self, op: str, vehicle_id: Any, data: Dict[str, Any]) -> int:
+        """Append one change and wake up local readers; returns its offset."""
+        return self.append_many(op, [(vehicle_id, data)])
+
+    def append_many(self, op: str, changes: Iterable[Tuple[Any, Dict[str, Any]]]) -> int:
+        """Append one ``op`` entry per ``(id, data)`` under a single lock; returns the last offset."""
+        with self._locked():
+            offset = self._write(op, changes)
+        self._wake()
+        return offset
+
+    @contextmanager
+    def publishing(self) -> Iterator[Callable[[str, Any, Dict[str, Any]], int]]:
+        """Hold the append lock while a listing is stored; yields ``append(op, id, data)``.
+
+        Storing the listing inside the block means no reader of
+        ``settled_offset`` can see it in the store without its entry.
+        """
+        with self._locked():
+            yield lambda op, vehicle_id, data: self._write(op, [(vehicle_id, data)])
+        self._wake()
+
+    def settled_offset(self) -> int:
+        """``last_offset`` once every ``publishing`` block in progress has appended its entry."""
+        with self._locked(fcntl.LOCK_SH):
+            return self.last_offset()
+
+    @staticmethod
+    def _line_at_or_after(f, pos: int) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """Start and entry of the first complete line starting at or after byte ``pos``."""
+        if pos > 0:
+            f.seek(pos - 1)
+            if f.read(1) != b"\n":
+                f.readline()
+        else:
+            f.seek(0)
+        start = f.tell()
+        line = f.readline()
+        if not line.endswith(b"\n"):
+            return start, None
+        return start, json.loads(line)
+
+    def read(self, since: int = 0, limit: int = 100) -> List[Dict[str, Any]]:
+        """Up to ``limit`` entries with offsets greater than ``since``, oldest first."""
+        if self.last_offset() <= since:
+            return []
+        entries = []
+        with open(self.path, "rb") as f:
+            lo, hi = 0, f.seek(0, os.SEEK_END)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                _, entry = self._line_at_or_after(f, mid)
+                if entry is None or entry["offset"] > since:
+                    hi = mid
+                else:
+                    lo = mid + 1
+            start, _ = self._line_at_or_after(f, lo)
+            f.seek(start)
+            for line in f:
+                if len(entries) >= limit or not line.endswith(b"\n"):
+                    break
+                entries.append(json.loads(line))
+        return entries
+
+    def iter_since(self, since: int, batch: int = 1000) -> Iterator[Dict[str, Any]]:
+        """Every entry after ``since`` currently in the log, read ``batch`` at a time."""
+        while True:
+            entries = self.read(since, batch)
+            if not entries:
+                return
+            yield from entries
+            since = entries[-1]["offset"]
+
+    def wait(self, since: int, limit: int = 100, timeout: float = 25.0) -> List[Dict[str, Any]]:
+        """Long-poll: entries after ``since``, waiting up to ``timeout`` seconds for the first one."""
+        deadline = time.monotonic() + timeout
+        while True:
+            entries = self.read(since, limit)
+            remaining = deadline - time.monotonic()
+            if entries or remaining <= 0:
+                return entries
+            # Los appends locales despiertan al instante; los de otros procesos se ven al sondear
+            with self._cond:
+                self._cond.wait(min(self.poll_interval, remaining))
+
+    def stream(self, since: int) -> ChangeStream:
+        """SSE byte stream of every entry after ``since``; the event id is the offset.
+
+        The caller must ``close`` the stream to free its slot.
+
+        Raises:
+            TooManyStreams: When ``max_streams`` streams are open.
+        """
+        with self._streams_lock:
+            if self._streams >= self.max_streams:
+                raise TooManyStreams(f"Limit of {self.max_streams} change streams reached")
+            self._streams += 1
+        return ChangeStream(self, since)
+
+    def _events(self, since: int) -> Iterator[bytes]:
+        yield b"retry: 3000\n\n"
+        while True:
+            entries = self.wait(since, limit=500, timeout=self.heartbeat)
+            if not entries:
+                yield b": keepalive\n\n"
+                continue
+            since = entries[-1]["offset"]
+            yield b"".join(_encode(entry) for entry in entries)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"last_offset": self.last_offset(), "streams": self._streams, "bytes": os.path.getsize(self.path)}
+
+
+class LoadedIds:
+    """Ids a consumer loaded from the store that the change feed repeats.
+
+    A consumer built from the store resumes at the feed offset read before
+    loading, so a listing published during the load is counted from the
+    store and then again from its feed entry. Publishes store their listing
+    inside ``ChangeFeed.publishing``, so all such entries sit at or below
+    ``until``, the settled offset read after loading: only the loaded ids
+    found in that window are kept, and only until the consumer passes it.
+    """
+
+    def __init__(self):
+        self.ids: Set[Any] = set()
+        self.until = 0
+
+    @classmethod
+    def load(cls, store, feed: Optional[ChangeFeed], add: Callable[[Dict[str, Any]], None]) -> Tuple[int, "LoadedIds"]:
+        """Pass every listing in ``store`` to ``add``; returns the feed offset to resume from and the ids to skip."""
+        loaded = cls()
+        if feed is None:
+            for listing in store.iter_listings():
+                add(listing)
+            return 0, loaded
+        since = feed.last_offset()
+        seen = set()
+        for listing in store.iter_listings():
+            add(listing)
+            seen.add(listing.get("id"))
+        loaded.until = feed.settled_offset()
+        for entry in feed.iter_since(since):
+            if entry["offset"] > loaded.until:
+                break
+            if entry["op"] == "publish" and entry["id"] in seen:
+                loaded.ids.add(entry["id"])
+        return since, loaded
+
+    def repeated(self, entry: Dict[str, Any]) -> bool:
+        """True for the feed entry of a listing already loaded; call it for every entry, in order."""
+        duplicate = entry["op"] == "publish" and entry["id"] in self.ids
+        if entry["offset"] >= self.until:
+            self.ids.clear()  # Pasado el fin de la carga ya no puede repetirse ninguno
+        return duplicate
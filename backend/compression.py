@@ -0,0 +1,211 @@
+"""Streaming gzip compression for WSGI responses.
+
+``CompressionMiddleware`` wraps ``app.wsgi_app`` and gzips responses for
+clients whose ``Accept-Encoding`` allows it. The body is compressed chunk
+by chunk as the application yields it, with a sync flush after each chunk,
+so generator responses (batch downloads, exports) keep streaming and memory
+stays flat regardless of payload size.
+
+Responses are left untouched when they are small (the first chunks are
+buffered up to ``min_size`` to find out), already carry a
+``Content-Encoding``, are partial (206) or bodiless, or have a content type
+that is already compressed or must not be delayed (images, archives,
+``text/event-stream``).
+"""
+
+import threading
+import zlib
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Tipos ya comprimidos (o binarios opacos) y flujos que no deben retrasarse
+SKIP_CONTENT_TYPES = {
+    "application/gzip",
+    "application/x-gzip",
+    "application/zip",
+    "application/x-bzip2",
+    "application/x-xz",
+    "application/zstd",
+    "application/octet-stream",
+    "application/pdf",
+    "application/vnd.apache.parquet",
+    "text/event-stream",
+}
+SKIP_CONTENT_PREFIXES = ("image/", "video/", "audio/", "font/woff")
+COMPRESSIBLE_IMAGES = {"image/svg+xml"}
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """``Accept-Encoding`` header -> {coding: q}; codings with q=0 are kept so they can be refused."""
+    accepted = {}
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def accepts_gzip(header: Optional[str]) -> bool:
+    accepted = parse_accept_encoding(header)
+    q = accepted.get("gzip", accepted.get("x-gzip", accepted.get("*", 0.0)))
+    return q > 0
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    mimetype = (content_type or "").split(";")[0].strip().lower()
+    if not mimetype or mimetype in SKIP_CONTENT_TYPES:
+        return False
+    if mimetype in COMPRESSIBLE_IMAGES:
+        return True
+    return not mimetype.startswith(SKIP_CONTENT_PREFIXES)
+
+
+class CompressionMiddleware:
+    """WSGI middleware gzipping large, compressible responses in streaming chunks.
+
+    Args:
+        app: The wrapped WSGI application (``flask_app.wsgi_app``).
+        level: zlib compression level, 1 (fastest) to 9 (smallest).
+        min_size: Responses shorter than this many bytes are sent as they are.
+    """
+
+    def __init__(self, app: Callable, level: int = 6, min_size: int = 1024):
+        if not 1 <= level <= 9:
+            raise ValueError("Compression level must be between 1 and 9")
+        self.app = app
+        self.level = level
+        self.min_size = min_size
+        self._lock = threading.Lock()
+        self.responses = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def __call__(self, environ: Dict[str, Any], start_response: Callable) -> Iterable[bytes]:
+        if environ.get("REQUEST_METHOD") == "HEAD" or not accepts_gzip(environ.get("HTTP_ACCEPT_ENCODING")):
+            return self.app(environ, start_response)
+
+        captured: Dict[str, Any] = {}
+        written: List[bytes] = []
+
+        def capture_start_response(status: str, headers: List[Tuple[str, str]], exc_info=None):
+            if exc_info is not None and captured.get("sent"):
+                raise exc_info[1].with_traceback(exc_info[2])
+            captured.update(status=status, headers=headers, exc_info=exc_info)
+            return written.append
+
+        body = self.app(environ, capture_start_response)
+        return self._respond(body, captured, written, start_response)
+
+    def _should_compress(self, status: str, headers: List[Tuple[str, str]]) -> bool:
+        code = int(status.split(" ", 1)[0])
+        if code < 200 or code in (204, 206, 304):
+            return False
+        names = {name.lower(): value for name, value in headers}
+        if "content-encoding" in names or "content-range" in names:
+            return False
+        if not is_compressible(names.get("content-type")):
+            return False
+        length = names.get("content-length")
+        return not (length is not None and length.isdigit() and int(length) < self.min_size)
+
+    def _respond(self, body: Iterable[bytes], captured: Dict[str, Any], written: List[bytes], start_response: Callable):
+        iterator = iter(body)
+        head = list(written)
+        # Flask llama a start_response antes de devolver el cuerpo; si no, llega con el primer trozo
+        if "status" not in captured:
+            head.append(next(iterator, b""))
+        status, headers = captured["status"], captured["headers"]
+        compress = self._should_compress(status, headers)
+        # Se lee sólo hasta min_size para decidir sin esperar a todo el cuerpo
+        size = sum(len(chunk) for chunk in head)
+        while compress and size < self.min_size:
+            chunk = next(iterator, None)
+            if chunk is None:
+                compress = False
+                break
+            head.append(chunk)
+            size += len(chunk)
+        captured["sent"] = True
+        if not compress:
+            start_response(status, headers, captured["exc_info"])
+            # Sin nada leído se devuelve el cuerpo original (conserva wsgi.file_wrapper)
+            return body if not head else _chain(head, iterator, body)
+        start_response(status, _compressed_headers(headers), captured["exc_info"])
+        # Lo ya leído se comprime de una vez: cada flush cuesta ratio en trozos pequeños
+        return self._compress(_chain([b"".join(head)], iterator, body))
+
+    def _compress(self, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        bytes_in = bytes_out = 0
+        try:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                bytes_in += len(chunk)
+                out = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                bytes_out += len(out)
+                yield out
+            tail = compressor.flush(zlib.Z_FINISH)
+            bytes_out += len(tail)
+            yield tail
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            with self._lock:
+                self.responses += 1
+                self.bytes_in += bytes_in
+                self.bytes_out += bytes_out
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            ratio = self.bytes_out / self.bytes_in if self.bytes_in else None
+            return {
+                "level": self.level,
+                "min_size": self.min_size,
+                "responses_compressed": self.responses,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "ratio": round(ratio, 4) if ratio is not None else None,
+            }
+
+
+def _chain(head: List[bytes], iterator: Iterator[bytes], body: Iterable[bytes]) -> Iterator[bytes]:
+    """Buffered chunks followed by the rest of the body; closes the original body when done."""
+    try:
+        yield from head
+        yield from iterator
+    finally:
+        close = getattr(body, "close", None)
+        if close is not None:
+            close()
+
+
+def _compressed_headers(headers: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    result = []
+    vary = []
+    for name, value in headers:
+        lower = name.lower()
+        if lower == "content-length":
+            continue
+        if lower == "vary":
+            vary.extend(v.strip() for v in value.split(",") if v.strip())
+            continue
+        if lower == "etag" and not value.startswith("W/"):
+            # El cuerpo cambia de bytes: la ETag fuerte ya no lo identifica
+            value = "W/" + value
+        result.append((name, value))
+    if "accept-encoding" not in {v.lower() for v in vary} and "*" not in vary:
+        vary.append("Accept-Encoding")
+    result.append(("Vary", ", ".join(vary)))
+    result.append(("Content-Encoding", "gzip"))
+    return result
@@ -0,0 +1,49 @@
+"""Request deadlines propagated from the frontend.
+
+The caller sends ``X-Request-Deadline`` as an absolute Unix time in
+milliseconds, the moment after which it will no longer read the answer.
+An absolute time (rather than a relative budget) also covers the time the
+request spent queued before Flask saw it; both services share a host clock
+or NTP. Handlers check it at stage boundaries and drop expired work instead
+of spending CPU on a response nobody is waiting for.
+"""
+
+import time
+from typing import Optional
+
+DEADLINE_HEADER = "X-Request-Deadline"
+STAGES = ("parse", "predict", "storage")
+
+
+class DeadlineExceeded(Exception):
+    """The caller's deadline passed before ``stage`` started."""
+
+    def __init__(self, stage: str, late_ms: float):
+        super().__init__(f"Deadline exceeded before {stage} ({late_ms:.0f} ms late)")
+        self.stage = stage
+        self.late_ms = late_ms
+
+
+def parse_deadline(value: Optional[str], now: Optional[float] = None, max_budget_seconds: float = 300.0) -> Optional[float]:
+    """Header value -> deadline in epoch seconds, or None if absent or malformed.
+
+    Deadlines further away than ``max_budget_seconds`` are clamped so a
+    skewed or bogus header cannot disable shedding indefinitely.
+    """
+    if not value:
+        return None
+    try:
+        deadline = float(value) / 1000.0
+    except ValueError:
+        return None
+    now = time.time() if now is None else now
+    return min(deadline, now + max_budget_seconds)
+
+
+def check_deadline(deadline: Optional[float], stage: str, now: Optional[float] = None) -> None:
+    """Raise DeadlineExceeded if ``deadline`` has passed (no-op without one)."""
+    if deadline is None:
+        return
+    now = time.time() if now is None else now
+    if now >= deadline:
+        raise DeadlineExceeded(stage, (now - deadline) * 1000)
@@ -0,0 +1,346 @@
+"""Streaming feature-drift monitoring against the model's training profile.
+
+Every scored request updates constant-memory sketches of its inputs: a
+count-min sketch per categorical feature and a fixed-bin histogram per
+numeric one, with the bin edges taken from the reference profile saved
+next to the model (``modelo.drift.json``). Recording is a handful of array
+increments; the comparison runs on a background thread every ``interval``
+seconds and only its cached result is read by ``/metrics/json``.
+
+Scores per feature:
+
+* PSI (population stability index) between the reference and live bin or
+  category shares. Rule of thumb: < 0.1 stable, 0.1-0.25 moderate, > 0.25
+  significant drift.
+* KS distance (largest gap between the two CDFs) for numeric features,
+  evaluated at the bin edges.
+* For categoricals, the share of live traffic with values never seen in
+  the reference (``unseen_share``).
+
+Live sketches rotate every ``window_seconds``; scores cover the current and
+the previous window, so they follow traffic changes without unbounded growth.
+
+Build a profile from the training data (CSV, Parquet, NDJSON or a JSON
+list of listings):
+
+    cd backend && python drift_monitor.py entrenamiento.csv --output modelo/modelo.drift.json
+"""
+
+import argparse
+import bisect
+import hashlib
+import json
+import math
+import os
+import struct
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+NUMERIC_DRIFT_FEATURES = ("model_year", "age")
+CATEGORICAL_DRIFT_FEATURES = ("fuel_type", "transmission", "clean_title")
+PROFILE_VERSION = 1
+PSI_MODERATE = 0.1
+PSI_SIGNIFICANT = 0.25
+# Suavizado de proporciones vacías: evita log(0) sin inflar el PSI de bins raros
+SHARE_FLOOR = 1e-4
+
+
+def category_key(value: Any) -> Optional[str]:
+    """Canonical string for a categorical value (1, 1.0 and "1" are the same category)."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return None if isinstance(value, float) and math.isnan(value) else f"{value:g}"
+    text = str(value).strip()
+    return text or None
+
+
+def default_profile_path(model_path: str) -> str:
+    return f"{os.path.splitext(model_path)[0]}.drift.json"
+
+
+class CountMinSketch:
+    """Approximate counts of arbitrary keys in a fixed ``depth × width`` table.
+
+    Estimates never undercount; they overcount by at most ``e / width`` of
+    the total with probability ``1 - exp(-depth)``.
+    """
+
+    def __init__(self, width: int = 512, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.total = 0
+
+    def _columns(self, key: str) -> List[int]:
+        # Un único hash de 4 bytes por fila: filas independientes sin llamar depth veces
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=4 * self.depth).digest()
+        return [value % self.width for value in struct.unpack(f"<{self.depth}I", digest)]
+
+    def add(self, key: str, count: int = 1) -> None:
+        for row, column in enumerate(self._columns(key)):
+            self.table[row, column] += count
+        self.total += count
+
+    def estimate(self, key: str) -> int:
+        return min(int(self.table[row, column]) for row, column in enumerate(self._columns(key)))
+
+    def merge(self, other: "CountMinSketch") -> "CountMinSketch":
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Cannot merge count-min sketches of different shape")
+        self.table += other.table
+        self.total += other.total
+        return self
+
+
+def psi(expected: np.ndarray, actual: np.ndarray) -> float:
+    """Population stability index between two vectors of shares."""
+    expected = np.maximum(expected, SHARE_FLOOR)
+    actual = np.maximum(actual, SHARE_FLOOR)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def severity(score: float) -> str:
+    if score >= PSI_SIGNIFICANT:
+        return "significant"
+    return "moderate" if score >= PSI_MODERATE else "stable"
+
+
+def build_profile(frames: Iterable[pd.DataFrame], bins: int = 10, model: Optional[str] = None) -> Dict[str, Any]:
+    """Reference profile of the model inputs, read chunk by chunk.
+
+    Numeric features get up to ``bins`` quantile bins (fewer when values
+    repeat, e.g. integer years); categoricals keep the share of each value.
+    """
+    numeric_counts = {name: Counter() for name in NUMERIC_DRIFT_FEATURES}
+    categorical_counts = {name: Counter() for name in CATEGORICAL_DRIFT_FEATURES}
+    rows = 0
+    for frame in frames:
+        rows += len(frame)
+        for name in NUMERIC_DRIFT_FEATURES:
+            if name in frame:
+                numeric_counts[name].update(pd.to_numeric(frame[name], errors="coerce").dropna().value_counts().to_dict())
+        for name in CATEGORICAL_DRIFT_FEATURES:
+            if name in frame:
+                keys = (category_key(v) for v in frame[name].tolist())
+                categorical_counts[name].update(k for k in keys if k is not None)
+
+    profile: Dict[str, Any] = {
+        "version": PROFILE_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "model": model,
+        "rows": rows,
+        "numeric": {},
+        "categorical": {},
+    }
+    for name, counts in numeric_counts.items():
+        if not counts:
+            continue
+        values = np.array(sorted(counts), dtype=float)
+        weights = np.array([counts[v] for v in sorted(counts)], dtype=float)
+        cumulative = np.cumsum(weights) / weights.sum()
+        # Cortes en los cuantiles 1/bins..(bins-1)/bins; con valores repetidos quedan menos bins
+        cuts = values[np.searchsorted(cumulative, np.arange(1, bins) / bins, side="right").clip(max=len(values) - 1)]
+        edges = np.unique(cuts[cuts > values[0]])
+        shares = np.bincount(np.searchsorted(edges, values, side="right"), weights=weights, minlength=len(edges) + 1)
+        profile["numeric"][name] = {"edges": edges.tolist(), "shares": (shares / shares.sum()).round(6).tolist()}
+    for name, counts in categorical_counts.items():
+        total = sum(counts.values())
+        if total:
+            profile["categorical"][name] = {key: round(count / total, 6) for key, count in counts.most_common()}
+    return profile
+
+
+class _Window:
+    """Live sketches of one time window."""
+
+    def __init__(self, profile: Dict[str, Any], cms_width: int, cms_depth: int):
+        self.count = 0
+        self.histograms = {name: np.zeros(len(spec["edges"]) + 1, dtype=np.int64) for name, spec in profile["numeric"].items()}
+        self.sketches = {name: CountMinSketch(cms_width, cms_depth) for name in profile["categorical"]}
+
+    def merge(self, other: "_Window") -> "_Window":
+        self.count += other.count
+        for name, counts in other.histograms.items():
+            self.histograms[name] += counts
+        for name, sketch in other.sketches.items():
+            self.sketches[name].merge(sketch)
+        return self
+
+
+class DriftMonitor:
+    """Compares live model inputs with a reference profile.
+
+    Args:
+        profile: Output of ``build_profile`` (or the JSON file it was saved to).
+        window_seconds: Lifetime of a live window before it is rotated.
+        min_samples: Requests needed before scores are reported.
+        cms_width: Columns of each count-min sketch.
+        cms_depth: Rows (independent hashes) of each count-min sketch.
+        on_report: Called with every new report (e.g. to export gauges).
+    """
+
+    def __init__(
+        self,
+        profile: Dict[str, Any],
+        window_seconds: float = 3600.0,
+        min_samples: int = 200,
+        cms_width: int = 512,
+        cms_depth: int = 4,
+        on_report: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
+        if profile.get("version") != PROFILE_VERSION:
+            raise ValueError(f"Unsupported drift profile version: {profile.get('version')}")
+        self.profile = profile
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.cms_width = cms_width
+        self.cms_depth = cms_depth
+        self.on_report = on_report
+        self._edges = {name: [float(edge) for edge in spec["edges"]] for name, spec in profile["numeric"].items()}
+        self._lock = threading.Lock()
+        self._current = self._new_window()
+        self._previous = self._new_window()
+        self._window_started = time.monotonic()
+        self._report: Dict[str, Any] = {"status": "warming_up", "samples": 0}
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "DriftMonitor":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f), **kwargs)
+
+    def _new_window(self) -> _Window:
+        return _Window(self.profile, self.cms_width, self.cms_depth)
+
+    def observe(self, data: Dict[str, Any]) -> None:
+        """Record one request's inputs (unparseable or missing values are skipped)."""
+        bins = {}
+        for name, edges in self._edges.items():
+            try:
+                value = float(data[name])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if not math.isnan(value):
+                bins[name] = bisect.bisect_right(edges, value)
+        keys = {name: category_key(data.get(name)) for name in self.profile["categorical"]}
+        with self._lock:
+            window = self._current
+            window.count += 1
+            for name, index in bins.items():
+                window.histograms[name][index] += 1
+            for name, key in keys.items():
+                if key is not None:
+                    window.sketches[name].add(key)
+
+    def rotate(self) -> None:
+        """Start a new live window; the current one becomes the previous."""
+        with self._lock:
+            self._previous, self._current = self._current, self._new_window()
+            self._window_started = time.monotonic()
+
+    def _snapshot(self) -> _Window:
+        with self._lock:
+            if time.monotonic() - self._window_started >= self.window_seconds:
+                self._previous, self._current = self._current, self._new_window()
+                self._window_started = time.monotonic()
+            merged = self._new_window().merge(self._previous)
+            return merged.merge(self._current)
+
+    def _numeric_scores(self, name: str, counts: np.ndarray) -> Optional[Dict[str, Any]]:
+        total = counts.sum()
+        if not total:
+            return None
+        expected = np.asarray(self.profile["numeric"][name]["shares"], dtype=float)
+        actual = counts / total
+        score = psi(expected, actual)
+        ks = float(np.max(np.abs(np.cumsum(actual) - np.cumsum(expected))))
+        return {"psi": round(score, 4), "ks": round(ks, 4), "severity": severity(score), "samples": int(total)}
+
+    def _categorical_scores(self, name: str, sketch: CountMinSketch) -> Optional[Dict[str, Any]]:
+        if not sketch.total:
+            return None
+        reference = self.profile["categorical"][name]
+        estimates = np.array([sketch.estimate(key) for key in reference], dtype=float)
+        # Lo que no cae en categorías de referencia es una categoría nueva ("otros")
+        unseen = max(0.0, sketch.total - estimates.sum()) / sketch.total
+        actual = np.append(estimates / sketch.total, unseen)
+        expected = np.append(np.fromiter(reference.values(), dtype=float), 0.0)
+        score = psi(expected, actual / actual.sum())
+        return {
+            "psi": round(score, 4),
+            "unseen_share": round(float(unseen), 4),
+            "severity": severity(score),
+            "samples": sketch.total,
+        }
+
+    def evaluate(self) -> Dict[str, Any]:
+        """Score the live windows against the profile and cache the result."""
+        window = self._snapshot()
+        report: Dict[str, Any] = {"samples": window.count, "evaluated_at": datetime.now().isoformat(timespec="seconds")}
+        if window.count < self.min_samples:
+            report["status"] = "warming_up"
+        else:
+            features = {name: self._numeric_scores(name, counts) for name, counts in window.histograms.items()}
+            features.update({name: self._categorical_scores(name, sketch) for name, sketch in window.sketches.items()})
+            features = {name: scores for name, scores in features.items() if scores is not None}
+            worst = max((scores["psi"] for scores in features.values()), default=0.0)
+            report.update({"status": severity(worst), "psi_max": worst, "features": features})
+        self._report = report
+        if self.on_report is not None:
+            self.on_report(report)
+        return report
+
+    def report(self) -> Dict[str, Any]:
+        """Latest cached evaluation (never computed on the request path)."""
+        return dict(self._report, profile_rows=self.profile.get("rows"), window_seconds=self.window_seconds)
+
+    def _run(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                self.evaluate()
+            except Exception as e:
+                print(f"❌ Drift monitor error: {e}")
+
+    def start(self, interval: float = 60.0) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True, name="drift-monitor")
+            self._thread.start()
+
+
+def _reference_frames(path: str, chunk_size: int) -> Iterable[pd.DataFrame]:
+    if path.lower().endswith(".json"):
+        # Lista JSON de anuncios (p.ej. vehiculos.json)
+        with open(path, encoding="utf-8") as f:
+            yield pd.DataFrame(json.load(f))
+        return
+    from score_file import read_chunks
+
+    yield from read_chunks(path, chunk_size)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build the reference profile used by the drift monitor")
+    parser.add_argument("input", help="Training data (.csv, .ndjson/.jsonl, .parquet or a JSON list)")
+    parser.add_argument("--model", default=os.environ.get("MODEL_PATH", "modelo/modelo.joblib"), help="Model (MODEL_PATH)")
+    parser.add_argument("--output", default=None, help="Profile file (default: next to the model, *.drift.json)")
+    parser.add_argument("--bins", type=int, default=10, help="Quantile bins per numeric feature")
+    parser.add_argument("--chunk-size", type=int, default=200000, help="Rows read at a time")
+    args = parser.parse_args(argv)
+
+    output = args.output or default_profile_path(args.model)
+    profile = build_profile(_reference_frames(args.input, args.chunk_size), bins=args.bins, model=os.path.basename(args.model))
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(profile, f, ensure_ascii=False, indent=2)
+    print(f"✅ Drift profile of {profile['rows']} rows written to {output}")
+
+
+if __name__ == "__main__":
+    main()
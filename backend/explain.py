@@ -0,0 +1,120 @@
+"""Per-feature price explanations from XGBoost's native contributions.
+
+Runs the pipeline's ``ColumnTransformer`` and asks the booster for
+``pred_contribs`` (exact TreeSHAP values), then folds the one-hot columns
+back onto the five original inputs. The input domain is small and highly
+repetitive, so explanations are memoized in a bounded LRU cache and all
+cache misses of a batch are computed in a single vectorized pass.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import xgboost as xgb
+
+from pricing import FEATURES, to_feature_frame
+
+CacheKey = Tuple[Any, ...]
+
+
+def _cache_key(record: Dict[str, Any]) -> CacheKey:
+    return tuple(record.get(f) for f in FEATURES)
+
+
+def _feature_owner_matrix(preprocessor) -> np.ndarray:
+    """(n_transformed, n_inputs) 0/1 matrix mapping each output column to its input."""
+    n_out = sum(s.stop - s.start for s in preprocessor.output_indices_.values())
+    owner = np.zeros((n_out, len(FEATURES)))
+    for name, transformer, columns in preprocessor.transformers_:
+        if name == "remainder" or transformer == "drop":
+            continue
+        out = preprocessor.output_indices_[name]
+        encoder = transformer.steps[-1][1] if hasattr(transformer, "steps") else transformer
+        if hasattr(encoder, "categories_"):
+            widths = [len(c) for c in encoder.categories_]
+        else:
+            widths = [1] * len(columns)
+        position = out.start
+        for column, width in zip(columns, widths):
+            owner[position : position + width, FEATURES.index(column)] = 1.0
+            position += width
+    return owner
+
+
+class PriceExplainer:
+    """Explains model prices as a base value plus one contribution per input."""
+
+    def __init__(self, preprocessor, booster: xgb.Booster, cache_size: int = 4096, owner: Optional[np.ndarray] = None):
+        self.preprocessor = preprocessor
+        self.booster = booster
+        self.cache_size = cache_size
+        self._owner = owner if owner is not None else _feature_owner_matrix(preprocessor)
+        self._cache: "OrderedDict[CacheKey, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_model(cls, modelo, cache_size: int = 4096) -> Optional["PriceExplainer"]:
+        """Build an explainer for a fitted preprocessor + XGBoost pipeline (or a FastPricingModel), else None."""
+        if hasattr(modelo, "feature_owner"):
+            return cls(modelo, modelo.booster, cache_size=cache_size, owner=modelo.feature_owner(FEATURES))
+        try:
+            preprocessor = modelo.steps[0][1]
+            booster = modelo.steps[-1][1].get_booster()
+            return cls(preprocessor, booster, cache_size=cache_size)
+        except (AttributeError, IndexError, TypeError, ValueError):
+            return None
+
+    def _compute(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        transformed = self.preprocessor.transform(to_feature_frame(records))
+        contribs = self.booster.predict(xgb.DMatrix(transformed), pred_contribs=True)
+        per_input = contribs[:, :-1] @ self._owner
+        bias = contribs[:, -1]
+        explanations = []
+        for row, base in zip(per_input, bias):
+            explanations.append(
+                {
+                    "precio_estimado": round(float(row.sum() + base), 2),
+                    "valor_base": round(float(base), 2),
+                    "contribuciones": {f: round(float(c), 2) for f, c in zip(FEATURES, row)},
+                }
+            )
+        return explanations
+
+    def explain_many(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Explain a batch; cache misses are computed together in one pass."""
+        keys = [_cache_key(r) for r in records]
+        results: List[Optional[Dict[str, Any]]] = [None] * len(records)
+        pending: "OrderedDict[CacheKey, List[int]]" = OrderedDict()
+        with self._lock:
+            for i, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    results[i] = cached
+                    self.hits += 1
+                else:
+                    pending.setdefault(key, []).append(i)
+                    self.misses += 1
+
+        if pending:
+            computed = self._compute([records[positions[0]] for positions in pending.values()])
+            with self._lock:
+                for (key, positions), explanation in zip(pending.items(), computed):
+                    for i in positions:
+                        results[i] = explanation
+                    self._cache[key] = explanation
+                    self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return results
+
+    def explain(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        return self.explain_many([record])[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"cache_entries": len(self._cache), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,123 @@
+"""Idempotency support for POST /publish_car.
+
+Mobile clients retry publishes on timeouts. This module keeps a bounded,
+TTL-evicting index of ``Idempotency-Key`` -> original response so a retry is
+answered from memory without touching storage or re-running inference.
+Requests without a key are deduplicated by a content hash of the payload
+over a shorter window.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Marker stored while the first request for a key is still being processed
+_IN_FLIGHT = object()
+
+
+class IdempotencyConflict(Exception):
+    """The Idempotency-Key was already used with a different payload."""
+
+
+class IdempotencyInProgress(Exception):
+    """A request with the same key is still being processed."""
+
+
+def content_hash(payload: Dict[str, Any]) -> str:
+    """Return a stable SHA-256 digest of a JSON payload."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class IdempotencyIndex:
+    """Bounded LRU index of idempotency keys with per-entry expiry.
+
+    Args:
+        max_entries: Maximum number of keys kept; the least recently used
+            entry is evicted first.
+        ttl_seconds: Lifetime of entries created from an explicit key.
+        content_ttl_seconds: Lifetime of entries created from the payload
+            hash when the client sent no key.
+        clock: Monotonic time source (injectable for tests).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        ttl_seconds: float = 86400.0,
+        content_ttl_seconds: float = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.content_ttl_seconds = content_ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        # index key -> (expires_at, digest, response or _IN_FLIGHT)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, str, Any]]" = OrderedDict()
+
+    def _index_key(self, key: Optional[str], digest: str) -> Tuple[str, str]:
+        return ("key", key) if key else ("content", digest)
+
+    def _evict(self, now: float) -> None:
+        # Oldest entries sit at the front; expired ones further in are treated
+        # as missing on lookup and overwritten, so this stays O(1) amortized.
+        while self._entries:
+            oldest_key, (expires_at, _, _) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[oldest_key]
+
+    def begin(self, key: Optional[str], digest: str) -> Optional[Dict[str, Any]]:
+        """Reserve a key, or return the stored response of a previous request.
+
+        Returns:
+            The original response body if this is a retry, otherwise None
+            (the caller owns the reservation and must complete or release it).
+
+        Raises:
+            IdempotencyConflict: Key reused with a different payload.
+            IdempotencyInProgress: The original request has not finished yet.
+        """
+        index_key = self._index_key(key, digest)
+        ttl = self.ttl_seconds if key else self.content_ttl_seconds
+        with self._lock:
+            now = self._clock()
+            entry = self._entries.get(index_key)
+            if entry is not None and entry[0] > now:
+                _, stored_digest, response = entry
+                if stored_digest != digest:
+                    raise IdempotencyConflict("Idempotency-Key reutilizada con un contenido distinto")
+                if response is _IN_FLIGHT:
+                    raise IdempotencyInProgress("La solicitud original sigue en proceso")
+                self._entries.move_to_end(index_key)
+                return response
+            self._entries[index_key] = (now + ttl, digest, _IN_FLIGHT)
+            self._entries.move_to_end(index_key)
+            self._evict(now)
+            return None
+
+    def complete(self, key: Optional[str], digest: str, response: Dict[str, Any]) -> None:
+        """Store the response for a reservation made by ``begin``."""
+        index_key = self._index_key(key, digest)
+        ttl = self.ttl_seconds if key else self.content_ttl_seconds
+        with self._lock:
+            now = self._clock()
+            self._entries[index_key] = (now + ttl, digest, response)
+            self._entries.move_to_end(index_key)
+            self._evict(now)
+
+    def release(self, key: Optional[str], digest: str) -> None:
+        """Drop a reservation after a failed request so it can be retried."""
+        index_key = self._index_key(key, digest)
+        with self._lock:
+            entry = self._entries.get(index_key)
+            if entry is not None and entry[2] is _IN_FLIGHT:
+                del self._entries[index_key]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,159 @@
+"""Server-Sent Events broadcaster for the live monitoring dashboards.
+
+A single sampler thread builds one metrics snapshot per interval (so psutil
+is called once per interval, not once per viewer) and pre-encodes two SSE
+events from it: the full snapshot and the delta of changed keys. Every
+subscriber is handed the same encoded bytes, so serving N dashboards costs
+N socket writes and nothing else. Sampling pauses while nobody is watching.
+"""
+
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional
+
+
+class TooManySubscribers(Exception):
+    """The configured subscriber limit has been reached."""
+
+
+def _encode(event: str, version: int, data: Dict[str, Any]) -> bytes:
+    payload = json.dumps(data, separators=(",", ":"), default=str)
+    return f"id: {version}\nevent: {event}\ndata: {payload}\n\n".encode("utf-8")
+
+
+class MetricsBroadcaster:
+    """Shares one periodically sampled snapshot with all SSE subscribers.
+
+    Args:
+        snapshot_fn: Returns a flat dict of metric values.
+        interval: Seconds between samples while someone is subscribed.
+        heartbeat: Seconds of silence before a keep-alive comment is sent.
+        max_subscribers: Streams allowed at once (each holds a server thread).
+    """
+
+    def __init__(
+        self,
+        snapshot_fn: Callable[[], Dict[str, Any]],
+        interval: float = 2.0,
+        heartbeat: float = 15.0,
+        max_subscribers: int = 100,
+    ):
+        self.snapshot_fn = snapshot_fn
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self.max_subscribers = max_subscribers
+        self._cond = threading.Condition()
+        self._version = 0
+        self._snapshot: Dict[str, Any] = {}
+        self._snapshot_event = b""
+        self._delta_event = b""
+        self._subscribers = 0
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def subscribers(self) -> int:
+        return self._subscribers
+
+    def latest(self) -> Dict[str, Any]:
+        with self._cond:
+            return dict(self._snapshot)
+
+    def tick(self) -> None:
+        """Take one sample and publish it if anything changed."""
+        snapshot = self.snapshot_fn()
+        with self._cond:
+            delta = {k: v for k, v in snapshot.items() if self._snapshot.get(k) != v}
+            if not delta and self._version:
+                return
+            self._version += 1
+            self._snapshot = snapshot
+            self._snapshot_event = _encode("snapshot", self._version, snapshot)
+            self._delta_event = _encode("delta", self._version, delta)
+            self._cond.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._subscribers > 0)
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"❌ Live metrics error: {e}")
+            time.sleep(self.interval)
+
+    def _ensure_thread(self) -> None:
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="live-metrics")
+                self._thread.start()
+
+    def stream(self) -> Iterator[bytes]:
+        """SSE byte stream for one subscriber.
+
+        Raises:
+            TooManySubscribers: When ``max_subscribers`` streams are open.
+        """
+        if self._subscribers >= self.max_subscribers:
+            raise TooManySubscribers(f"Limit of {self.max_subscribers} live dashboards reached")
+        self._ensure_thread()
+        return self._events()
+
+    def _events(self) -> Iterator[bytes]:
+        with self._cond:
+            self._subscribers += 1
+            self._cond.notify_all()
+        try:
+            if not self._version:
+                self.tick()
+            with self._cond:
+                seen, event = self._version, self._snapshot_event
+            yield b"retry: 3000\n\n" + event
+            while True:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._version != seen, timeout=self.heartbeat)
+                    if self._version == seen:
+                        event = b": keepalive\n\n"
+                    elif self._version == seen + 1:
+                        event = self._delta_event
+                    else:
+                        # Se perdió algún delta: se reenvía la foto completa
+                        event = self._snapshot_event
+                    seen = self._version
+                yield event
+        finally:
+            with self._cond:
+                self._subscribers -= 1
+
+
+# Cliente del dashboard: aplica snapshot/delta a los elementos con data-key (y a los gráficos, si los hay)
+DASHBOARD_STREAM_SCRIPT = """
+<script>
+const liveState = {};
+const formatters = {
+    cpu_percent: (v) => `${v.toFixed(1)}%`,
+    memory_percent: (v) => `${v.toFixed(1)}%`,
+    uptime_seconds: (v) => `${Math.floor(v / 3600)}h ${Math.floor((v % 3600) / 60)}m`,
+};
+function renderLive() {
+    document.querySelectorAll("[data-key]").forEach((el) => {
+        const key = el.dataset.key;
+        if (key in liveState) {
+            el.textContent = (formatters[key] || String)(liveState[key]);
+        }
+    });
+    if (typeof renderCharts === "function") {
+        renderCharts(liveState);
+    }
+}
+const liveSource = new EventSource("/metrics/stream");
+liveSource.addEventListener("snapshot", (e) => {
+    Object.keys(liveState).forEach((k) => delete liveState[k]);
+    Object.assign(liveState, JSON.parse(e.data));
+    renderLive();
+});
+liveSource.addEventListener("delta", (e) => { Object.assign(liveState, JSON.parse(e.data)); renderLive(); });
+liveSource.onerror = () => { document.getElementById("live-status").textContent = "reconnecting..."; };
+liveSource.onopen = () => { document.getElementById("live-status").textContent = "live"; };
+</script>
+"""
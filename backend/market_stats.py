@@ -0,0 +1,273 @@
+"""Materialized market statistics by segment.
+
+Listings are aggregated by ``fuel_type × transmission × model_year`` and by
+every roll-up of those dimensions (``*`` stands for "any"), so "2018
+Petrol Manual", "all Petrol" and "the whole market" are each one dict
+lookup. A publish updates its 8 segments in O(1): count, mean and variance
+through Welford's online algorithm, plus a ``LogHistogram`` of each price
+for percentiles. Both are mergeable, so aggregates from several workers or
+rebuilds can be combined exactly (quantiles within the sketch accuracy).
+
+The views are rebuilt from the store at startup and kept current from the
+change feed. An ``update`` entry (a backfill rewriting model prices) cannot
+be subtracted from the aggregates, so it triggers one rebuild from the
+source the views were loaded from.
+"""
+
+import itertools
+import math
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from change_feed import LoadedIds
+from sketches import LogHistogram
+
+DIMENSIONS = ("fuel_type", "transmission", "model_year")
+METRICS = ("precio", "precio_recomendado_modelo")
+ANY = "*"
+PRICE_PERCENTILES = (10, 25, 50, 75, 90)
+
+SegmentKey = Tuple[Any, ...]
+
+
+class RunningStats:
+    """Count, mean, variance, min and max updated one value at a time (Welford)."""
+
+    __slots__ = ("count", "mean", "m2", "minimum", "maximum")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+
+    def merge(self, other: "RunningStats") -> "RunningStats":
+        """Combine with another partial aggregate (Chan et al. parallel update)."""
+        if not other.count:
+            return self
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.mean += delta * other.count / total
+        self.count = total
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        return self
+
+    @property
+    def variance(self) -> float:
+        """Sample variance (0.0 with fewer than two values)."""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+
+class MetricAggregate:
+    """Exact moments plus a quantile sketch of one price field."""
+
+    __slots__ = ("stats", "sketch")
+
+    def __init__(self, relative_accuracy: float):
+        self.stats = RunningStats()
+        self.sketch = LogHistogram(relative_accuracy, min_value=1.0, max_value=1e9)
+
+    def add(self, value: float) -> None:
+        self.stats.add(value)
+        self.sketch.record(value)
+
+    def merge(self, other: "MetricAggregate") -> "MetricAggregate":
+        self.stats.merge(other.stats)
+        self.sketch.merge(other.sketch)
+        return self
+
+    def summary(self) -> Dict[str, Any]:
+        stats = self.stats
+        if not stats.count:
+            return {"count": 0}
+        report = {
+            "count": stats.count,
+            "mean": round(stats.mean, 2),
+            "std": round(math.sqrt(stats.variance), 2),
+            "min": round(stats.minimum, 2),
+            "max": round(stats.maximum, 2),
+        }
+        for p in PRICE_PERCENTILES:
+            report[f"p{p}"] = round(self.sketch.quantile(p / 100.0), 2)
+        return report
+
+
+def _price(value: Any) -> Optional[float]:
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        return None
+    return price if math.isfinite(price) and price > 0 else None
+
+
+def _dimension_values(listing: Mapping[str, Any]) -> SegmentKey:
+    """Listing -> (fuel_type, transmission, model_year); None values for missing ones."""
+    fuel, transmission = listing.get("fuel_type"), listing.get("transmission")
+    try:
+        year = int(float(listing["model_year"]))
+    except (KeyError, TypeError, ValueError):
+        year = None
+    return (fuel if isinstance(fuel, str) else None, transmission if isinstance(transmission, str) else None, year)
+
+
+class MarketStats:
+    """Per-segment price aggregates with all roll-ups, updated per listing.
+
+    Args:
+        relative_accuracy: Accuracy of the price percentiles.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self.segments: Dict[SegmentKey, Dict[str, MetricAggregate]] = {}
+        self.offset = 0  # Último offset del change feed aplicado
+        self.loaded = LoadedIds()
+        # Reconstrucción desde la fuente de la carga inicial, para las actualizaciones del feed
+        self._rebuild: Optional[Callable[[Any], "MarketStats"]] = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    @classmethod
+    def from_listings(cls, listings: Iterable[Mapping[str, Any]], **kwargs) -> "MarketStats":
+        market = cls(**kwargs)
+        for listing in listings:
+            market.add(listing)
+        return market
+
+    @classmethod
+    def from_store(cls, store, feed=None, **kwargs) -> "MarketStats":
+        """Aggregate every listing in ``store``; with a change feed, remember where to resume from."""
+        market = cls(**kwargs)
+        market.offset, market.loaded = LoadedIds.load(store, feed, market.add)
+        market._rebuild = lambda feed: cls.from_store(store, feed, **kwargs)
+        return market
+
+    @classmethod
+    def from_table(cls, table, **kwargs) -> "MarketStats":
+        """Build from a ``VehicleTable`` (already deduplicated), resuming at its feed offset."""
+        market = cls.from_listings(table, **kwargs)
+        market.offset = table.offset
+
+        def rebuild(feed) -> "MarketStats":
+            table.catch_up(feed)
+            return cls.from_table(table, **kwargs)
+
+        market._rebuild = rebuild
+        return market
+
+    @staticmethod
+    def segment_keys(values: SegmentKey) -> List[SegmentKey]:
+        """The 2^3 segments a listing belongs to: every mix of its values and ``*``."""
+        keys = []
+        for mask in itertools.product((False, True), repeat=len(DIMENSIONS)):
+            key = tuple(ANY if rolled else value for rolled, value in zip(mask, values))
+            # Un valor ausente sólo cuenta en los segmentos que agregan esa dimensión
+            if None not in key:
+                keys.append(key)
+        return keys
+
+    def add(self, listing: Mapping[str, Any]) -> None:
+        prices = {metric: _price(listing.get(metric)) for metric in METRICS}
+        if all(price is None for price in prices.values()):
+            return
+        keys = self.segment_keys(_dimension_values(listing))
+        with self._lock:
+            for key in keys:
+                segment = self.segments.get(key)
+                if segment is None:
+                    segment = self.segments[key] = {m: MetricAggregate(self.relative_accuracy) for m in METRICS}
+                for metric, price in prices.items():
+                    if price is not None:
+                        segment[metric].add(price)
+
+    def merge(self, other: "MarketStats") -> "MarketStats":
+        with self._lock:
+            for key, segment in other.segments.items():
+                mine = self.segments.setdefault(key, {m: MetricAggregate(self.relative_accuracy) for m in METRICS})
+                for metric in METRICS:
+                    mine[metric].merge(segment[metric])
+        return self
+
+    def _reload(self, feed) -> None:
+        """Replace every aggregate with a fresh build from the source, resuming where it stopped."""
+        fresh = self._rebuild(feed)
+        with self._lock:
+            self.segments = fresh.segments
+            self.loaded = fresh.loaded
+        self.offset = fresh.offset
+
+    def catch_up(self, feed, batch: int = 1000) -> int:
+        """Aggregate publishes from the change feed newer than ``offset``; returns entries applied.
+
+        Listings already aggregated from the store (published between reading
+        the feed offset and loading the store) are skipped by id. An update
+        rebuilds the views once, which also covers the entries after it.
+        """
+        applied = 0
+        with self._sync_lock:
+            for entry in feed.iter_since(self.offset, batch):
+                if entry["op"] == "update" and self._rebuild is not None:
+                    self._reload(feed)
+                    break
+                if not self.loaded.repeated(entry) and entry["op"] == "publish":
+                    self.add(entry["vehiculo"])
+                    applied += 1
+                self.offset = entry["offset"]
+        return applied
+
+    @staticmethod
+    def key(fuel_type: Optional[str] = None, transmission: Optional[str] = None, model_year: Optional[int] = None):
+        return tuple(ANY if value is None else value for value in (fuel_type, transmission, model_year))
+
+    def _describe(self, key: SegmentKey) -> Optional[Dict[str, Any]]:
+        segment = self.segments.get(key)
+        if segment is None:
+            return None
+        report: Dict[str, Any] = {"segmento": dict(zip(DIMENSIONS, key))}
+        report.update({metric: segment[metric].summary() for metric in METRICS})
+        return report
+
+    def get(self, **dimensions: Any) -> Optional[Dict[str, Any]]:
+        """Summary of one segment; omitted dimensions are rolled up (None if it has no listings)."""
+        with self._lock:
+            return self._describe(self.key(**dimensions))
+
+    def breakdown(self, group_by: Sequence[str], **dimensions: Any) -> List[Dict[str, Any]]:
+        """Summaries of every segment splitting the filtered one by the ``group_by`` dimensions."""
+        unknown = set(group_by) - set(DIMENSIONS)
+        if unknown:
+            raise ValueError(f"Unknown dimensions: {', '.join(sorted(unknown))}")
+        fixed = self.key(**dimensions)
+
+        def matches(key: SegmentKey) -> bool:
+            for name, value, wanted in zip(DIMENSIONS, key, fixed):
+                if name in group_by and wanted == ANY:
+                    if value == ANY:
+                        return False
+                elif value != wanted:
+                    return False
+            return True
+
+        with self._lock:
+            keys = [key for key in self.segments if matches(key)]
+            keys.sort(key=lambda k: tuple(str(v) for v in k))
+            return [self._describe(key) for key in keys]
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.segments.get((ANY,) * len(DIMENSIONS))
+        return {
+            "segments": len(self.segments),
+            "listings": total["precio"].stats.count if total else 0,
+            "offset": self.offset,
+        }
@@ -0,0 +1,184 @@
+"""Client-side metric pre-aggregation before export to Splunk.
+
+Request handlers record events here instead of posting one datapoint each.
+Events are folded into counters, fixed-bucket histograms and last-value
+gauges per flush interval and sent as a single batched payload, so ingest
+volume depends on the number of series, not on traffic.
+
+Label cardinality is bounded twice: dimensions outside an allow-list are
+dropped, and each allowed dimension keeps only its top-K most frequent
+values (tracked with a decaying Space-Saving summary); the rest are
+reported as ``__other__``.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+OTHER_LABEL = "__other__"
+DEFAULT_LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+DEFAULT_ALLOWLIST = ("endpoint", "action", "fuel_type", "transmission", "months_ahead", "status", "feature")
+
+SeriesKey = Tuple[str, FrozenSet[Tuple[str, str]]]
+
+
+class _TopK:
+    """Space-Saving heavy hitters for one dimension, refreshed every flush."""
+
+    def __init__(self, k: int):
+        self.k = k
+        self.capacity = k * 4
+        self.counts: Dict[str, float] = {}
+        self.allowed: set = set()
+
+    def admit(self, value: str) -> str:
+        if value in self.counts:
+            self.counts[value] += 1
+        elif len(self.counts) < self.capacity:
+            self.counts[value] = 1
+        else:
+            # Reemplaza al menor, heredando su cuenta (cota superior de Space-Saving)
+            smallest = min(self.counts, key=self.counts.get)
+            self.counts[value] = self.counts.pop(smallest) + 1
+        if value in self.allowed or len(self.allowed) < self.k:
+            self.allowed.add(value)
+            return value
+        return OTHER_LABEL
+
+    def refresh(self) -> None:
+        ranked = sorted(self.counts, key=self.counts.get, reverse=True)
+        self.allowed = set(ranked[: self.k])
+        # Decaimiento para que el top-K siga al tráfico reciente
+        self.counts = {v: c / 2 for v, c in self.counts.items() if c >= 1}
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self, n_buckets: int):
+        self.counts = [0] * (n_buckets + 1)
+        self.total = 0.0
+        self.count = 0
+
+
+class MetricsAggregator:
+    """Folds per-request metric events into per-interval aggregates.
+
+    Args:
+        sender: Called with a SignalFx-style payload ({"counter": [...], "gauge": [...]}).
+        default_dimensions: Dimensions added to every datapoint (service, host...).
+        flush_interval: Seconds between flushes of the background thread.
+        label_allowlist: Dimension names that may be exported.
+        top_k: Distinct values kept per allowed dimension before folding into ``__other__``.
+    """
+
+    def __init__(
+        self,
+        sender: Callable[[Dict[str, List[Dict[str, Any]]]], None],
+        default_dimensions: Optional[Dict[str, str]] = None,
+        flush_interval: float = 10.0,
+        label_allowlist: Iterable[str] = DEFAULT_ALLOWLIST,
+        top_k: int = 20,
+    ):
+        self.sender = sender
+        self.default_dimensions = dict(default_dimensions or {})
+        self.flush_interval = flush_interval
+        self.label_allowlist = frozenset(label_allowlist)
+        self.top_k = top_k
+        self._lock = threading.Lock()
+        self._top: Dict[str, _TopK] = {}
+        self._counters: Dict[SeriesKey, float] = {}
+        self._gauges: Dict[SeriesKey, float] = {}
+        self._histograms: Dict[SeriesKey, _Histogram] = {}
+        self._buckets: Dict[str, Sequence[float]] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def _series(self, name: str, dimensions: Optional[Dict[str, Any]]) -> SeriesKey:
+        labels = []
+        for key, value in (dimensions or {}).items():
+            if key not in self.label_allowlist:
+                continue
+            top = self._top.get(key)
+            if top is None:
+                top = self._top[key] = _TopK(self.top_k)
+            labels.append((key, top.admit(str(value))))
+        return name, frozenset(labels)
+
+    def counter(self, name: str, value: float = 1, dimensions: Optional[Dict[str, Any]] = None) -> None:
+        with self._lock:
+            key = self._series(name, dimensions)
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge(self, name: str, value: float, dimensions: Optional[Dict[str, Any]] = None) -> None:
+        with self._lock:
+            self._gauges[self._series(name, dimensions)] = value
+
+    def histogram(
+        self,
+        name: str,
+        value: float,
+        dimensions: Optional[Dict[str, Any]] = None,
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS_MS,
+    ) -> None:
+        with self._lock:
+            bounds = self._buckets.setdefault(name, tuple(buckets))
+            key = self._series(name, dimensions)
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = _Histogram(len(bounds))
+            index = next((i for i, bound in enumerate(bounds) if value <= bound), len(bounds))
+            hist.counts[index] += 1
+            hist.total += value
+            hist.count += 1
+
+    def _datapoint(self, name: str, value: float, labels, timestamp: int, extra=None) -> Dict[str, Any]:
+        dimensions = dict(labels)
+        dimensions.update(extra or {})
+        dimensions.update(self.default_dimensions)
+        return {"metric": name, "value": value, "dimensions": dimensions, "timestamp": timestamp}
+
+    def collect(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Swap out the current interval and build its export payload."""
+        with self._lock:
+            counters, self._counters = self._counters, {}
+            gauges = dict(self._gauges)
+            histograms, self._histograms = self._histograms, {}
+            buckets = dict(self._buckets)
+            for top in self._top.values():
+                top.refresh()
+
+        now = int(time.time() * 1000)
+        counter_points = [self._datapoint(n, v, labels, now) for (n, labels), v in counters.items()]
+        gauge_points = [self._datapoint(n, v, labels, now) for (n, labels), v in gauges.items()]
+        for (name, labels), hist in histograms.items():
+            counter_points.append(self._datapoint(f"{name}.count", hist.count, labels, now))
+            counter_points.append(self._datapoint(f"{name}.sum", hist.total, labels, now))
+            cumulative = 0
+            for bound, count in zip(list(buckets[name]) + ["+Inf"], hist.counts):
+                cumulative += count
+                counter_points.append(self._datapoint(f"{name}.bucket", cumulative, labels, now, {"le": str(bound)}))
+        payload = {}
+        if counter_points:
+            payload["counter"] = counter_points
+        if gauge_points:
+            payload["gauge"] = gauge_points
+        return payload
+
+    def flush(self) -> None:
+        payload = self.collect()
+        if payload:
+            self.sender(payload)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌ Metrics flush error: {e}")
+
+    def start(self) -> None:
+        """Start the background flush thread (idempotent)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name="metrics-flush")
+            self._thread.start()
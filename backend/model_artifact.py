@@ -0,0 +1,322 @@
+"""Fast-loading model artifact: flat preprocessing arrays plus the native booster.
+
+``joblib.load`` of ``modelo.joblib`` imports scikit-learn, unpickles the
+whole Pipeline and deserializes the XGBoost model into private memory in
+every worker. ``export`` splits the fitted pipeline into a directory that
+needs neither pickle nor scikit-learn to load:
+
+    modelo.artifact/
+        manifest.json        columns, categories, sha256 of every file
+        num_fill.npy         SimpleImputer medians
+        num_mean.npy         StandardScaler means
+        num_scale.npy        StandardScaler scales
+        booster.ubj          XGBoost model in its native UBJSON format
+
+The ``.npy`` arrays are opened with ``mmap_mode="r"``, so every worker on the
+host reads the same page-cache copy. Each file is checked against the
+manifest's sha256 on load, and the manifest hash is the model version.
+``FastPricingModel`` reproduces the pipeline's ``predict`` (imputation, scaling,
+one-hot with unknown categories ignored) with a few array operations.
+
+    cd backend && python model_artifact.py export modelo/modelo.joblib
+    cd backend && python model_artifact.py bench modelo/modelo.joblib modelo/modelo.artifact
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+ARTIFACT_FORMAT = "car-price-artifact"
+ARTIFACT_VERSION = 1
+ARTIFACT_SUFFIX = ".artifact"
+MANIFEST_NAME = "manifest.json"
+BOOSTER_NAME = "booster.ubj"
+NUMERIC_ARRAYS = ("fill", "mean", "scale")
+
+
+class ArtifactIntegrityError(ValueError):
+    """A file of the artifact does not match the hash recorded in its manifest."""
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_artifact(path: Optional[str]) -> bool:
+    return bool(path) and os.path.isfile(os.path.join(path, MANIFEST_NAME))
+
+
+def default_artifact_path(model_path: str) -> str:
+    return f"{os.path.splitext(model_path)[0]}{ARTIFACT_SUFFIX}"
+
+
+def _steps(transformer) -> Dict[str, Any]:
+    return dict(transformer.steps) if hasattr(transformer, "steps") else {}
+
+
+def _split_pipeline(pipeline) -> Dict[str, Any]:
+    """Fitted parameters of the supported ``ColumnTransformer`` + XGBoost pipeline.
+
+    Raises:
+        ValueError: If the pipeline has another shape.
+    """
+    try:
+        preprocessor, estimator = pipeline.steps[0][1], pipeline.steps[-1][1]
+        booster = estimator.get_booster()
+    except (AttributeError, IndexError) as e:
+        raise ValueError(f"Unsupported model: {e}") from e
+    parts: Dict[str, Any] = {"blocks": [], "zero_is_missing": bool(getattr(preprocessor, "sparse_output_", False))}
+    for name, transformer, columns in preprocessor.transformers_:
+        if name == "remainder" or transformer == "drop":
+            continue
+        steps = _steps(transformer)
+        imputer, scaler, encoder = steps.get("imputer"), steps.get("scaler"), steps.get("onehot")
+        if scaler is not None and imputer is not None:
+            parts["numeric"] = {
+                "columns": list(columns),
+                "fill": np.asarray(imputer.statistics_, dtype=np.float64),
+                "mean": np.asarray(scaler.mean_ if scaler.with_mean else np.zeros(len(columns)), dtype=np.float64),
+                "scale": np.asarray(scaler.scale_ if scaler.with_std else np.ones(len(columns)), dtype=np.float64),
+            }
+            parts["blocks"].append("numeric")
+        elif encoder is not None and imputer is not None and encoder.handle_unknown == "ignore" and encoder.drop_idx_ is None:
+            parts["categorical"] = {
+                "columns": list(columns),
+                "fill": [str(v) for v in imputer.statistics_],
+                "categories": [[str(v) for v in c] for c in encoder.categories_],
+            }
+            parts["blocks"].append("categorical")
+        else:
+            raise ValueError(f"Unsupported transformer '{name}': {transformer}")
+    best = booster.attr("best_iteration")
+    parts["iteration_end"] = int(best) + 1 if best is not None else 0
+    parts["booster"] = booster
+    return parts
+
+
+def export(pipeline_path: str, output_dir: Optional[str] = None) -> str:
+    """Write the artifact for a fitted joblib pipeline; returns its directory."""
+    import joblib
+
+    output_dir = output_dir or default_artifact_path(pipeline_path)
+    parts = _split_pipeline(joblib.load(pipeline_path))
+    os.makedirs(output_dir, exist_ok=True)
+    files = {}
+    for key in NUMERIC_ARRAYS:
+        name = f"num_{key}.npy"
+        np.save(os.path.join(output_dir, name), parts["numeric"][key])
+        files[name] = file_sha256(os.path.join(output_dir, name))
+    parts["booster"].save_model(os.path.join(output_dir, BOOSTER_NAME))
+    files[BOOSTER_NAME] = file_sha256(os.path.join(output_dir, BOOSTER_NAME))
+    manifest = {
+        "format": ARTIFACT_FORMAT,
+        "version": ARTIFACT_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "source": {"file": os.path.basename(pipeline_path), "sha256": file_sha256(pipeline_path)},
+        "blocks": parts["blocks"],
+        "zero_is_missing": parts["zero_is_missing"],
+        "iteration_end": parts["iteration_end"],
+        "numeric": {"columns": parts["numeric"]["columns"]},
+        "categorical": parts["categorical"],
+        "files": files,
+    }
+    # El manifest se escribe al final: un export interrumpido no deja un artefacto cargable
+    tmp_path = os.path.join(output_dir, f".{MANIFEST_NAME}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, os.path.join(output_dir, MANIFEST_NAME))
+    return output_dir
+
+
+def artifact_version(path: str) -> str:
+    """Short hash of the manifest, which pins the hash of every other file."""
+    return file_sha256(os.path.join(path, MANIFEST_NAME))[:12]
+
+
+class FastPricingModel:
+    """Pipeline-equivalent ``predict`` over memory-mapped arrays and a native booster.
+
+    Args:
+        path: Artifact directory written by ``export``.
+        verify: Check every file against the manifest's sha256.
+    """
+
+    def __init__(self, path: str, verify: bool = True):
+        import xgboost as xgb
+
+        self.path = path
+        with open(os.path.join(path, MANIFEST_NAME), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if (self.manifest.get("format"), self.manifest.get("version")) != (ARTIFACT_FORMAT, ARTIFACT_VERSION):
+            raise ValueError(f"Unsupported artifact format in {path}")
+        if verify:
+            self.verify()
+        numeric = self.manifest["numeric"]
+        self.numeric_columns: List[str] = numeric["columns"]
+        self.arrays = {key: np.load(os.path.join(path, f"num_{key}.npy"), mmap_mode="r") for key in NUMERIC_ARRAYS}
+        categorical = self.manifest["categorical"]
+        self.categorical_columns: List[str] = categorical["columns"]
+        self.categorical_fill: List[str] = categorical["fill"]
+        self.category_index = [{value: i for i, value in enumerate(values)} for values in categorical["categories"]]
+        self.widths = {"numeric": len(self.numeric_columns), "categorical": sum(len(c) for c in self.category_index)}
+        self.booster = xgb.Booster(model_file=os.path.join(path, BOOSTER_NAME))
+        self.iteration_range = (0, self.manifest["iteration_end"])
+        self.nthread: Optional[int] = None
+
+    def verify(self) -> None:
+        """Check every file of the artifact against the manifest.
+
+        Raises:
+            ArtifactIntegrityError: If a file is missing or its sha256 differs.
+        """
+        for name, expected in self.manifest["files"].items():
+            file_path = os.path.join(self.path, name)
+            if not os.path.exists(file_path) or file_sha256(file_path) != expected:
+                raise ArtifactIntegrityError(f"{file_path} does not match its manifest hash")
+
+    def _numeric_block(self, frame: pd.DataFrame) -> np.ndarray:
+        values = frame[self.numeric_columns].to_numpy(dtype=np.float64, copy=True)
+        missing = np.isnan(values)
+        values[missing] = np.broadcast_to(self.arrays["fill"], values.shape)[missing]
+        return (values - self.arrays["mean"]) / self.arrays["scale"]
+
+    def _categorical_block(self, frame: pd.DataFrame) -> np.ndarray:
+        block = np.zeros((len(frame), self.widths["categorical"]))
+        rows = np.arange(len(frame))
+        start = 0
+        for column, fill, index in zip(self.categorical_columns, self.categorical_fill, self.category_index):
+            # Como SimpleImputer sobre object: sólo NaN cuenta como ausente
+            values = [fill if v != v else v for v in frame[column].tolist()]
+            codes = np.array([index.get(v if isinstance(v, str) else str(v), -1) for v in values], dtype=np.int64)
+            known = codes >= 0  # handle_unknown="ignore": categoría nueva => fila de ceros
+            block[rows[known], start + codes[known]] = 1.0
+            start += len(index)
+        return block
+
+    def transform(self, frame: pd.DataFrame) -> np.ndarray:
+        """Dense equivalent of the ColumnTransformer output (NaN where the sparse output stores nothing)."""
+        blocks = {"numeric": self._numeric_block, "categorical": self._categorical_block}
+        matrix = np.hstack([blocks[name](frame) for name in self.manifest["blocks"]])
+        if self.manifest["zero_is_missing"]:
+            # XGBoost trata como ausente lo no almacenado en la matriz dispersa del pipeline
+            matrix[matrix == 0.0] = np.nan
+        return matrix
+
+    def predict(self, frame: pd.DataFrame) -> np.ndarray:
+        return self.booster.inplace_predict(self.transform(frame), iteration_range=self.iteration_range)
+
+    def feature_owner(self, features: List[str]) -> np.ndarray:
+        """(n_transformed, n_inputs) 0/1 matrix mapping each output column to its input."""
+        columns = {"numeric": self.numeric_columns, "categorical": self.categorical_columns}
+        widths = {"numeric": [1] * len(self.numeric_columns), "categorical": [len(i) for i in self.category_index]}
+        owners = [
+            features.index(column)
+            for block in self.manifest["blocks"]
+            for column, width in zip(columns[block], widths[block])
+            for _ in range(width)
+        ]
+        owner = np.zeros((len(owners), len(features)))
+        owner[np.arange(len(owners)), owners] = 1.0
+        return owner
+
+    # Interfaz de estimador para ThreadBudget.configure_model
+    def get_params(self, deep: bool = True) -> Dict[str, Any]:
+        return {"nthread": self.nthread}
+
+    def set_params(self, **params: Any) -> "FastPricingModel":
+        if "nthread" in params:
+            self.nthread = params["nthread"]
+            self.booster.set_param({"nthread": self.nthread})
+        return self
+
+
+def load_artifact(path: str, verify: bool = True) -> FastPricingModel:
+    return FastPricingModel(path, verify=verify)
+
+
+# Mide arranque y memoria en un intérprete nuevo, como lo vería cada worker
+BENCH_SNIPPET = """
+import json, os, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {backend!r})
+import psutil
+import xgboost
+from model_registry import WARMUP_RECORD
+from pricing import load_model, to_feature_frame
+imported = time.perf_counter()
+model = load_model({path!r}, mmap_mode="r")
+frame = to_feature_frame([WARMUP_RECORD])
+try:
+    model.predict(frame)
+    predicts = True
+except Exception:
+    predicts = False
+loaded = time.perf_counter()
+memory = psutil.Process().memory_full_info()
+print(json.dumps({{"import_seconds": imported - started, "load_seconds": loaded - imported, "rss_mb": memory.rss / 2**20,
+                  "uss_mb": memory.uss / 2**20, "predicts": predicts}}))
+"""
+
+
+def bench(paths: List[str], runs: int = 3) -> List[Dict[str, Any]]:
+    """Startup time (shared imports, then load + first predict) and memory of each artifact, in fresh processes."""
+    backend = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for path in paths:
+        samples = []
+        for _ in range(runs):
+            output = subprocess.run(
+                [sys.executable, "-W", "ignore", "-c", BENCH_SNIPPET.format(backend=backend, path=os.path.abspath(path))],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+        best = min(samples, key=lambda s: s["load_seconds"])
+        results.append(dict(best, path=path, runs=runs))
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Export and benchmark the fast-loading model artifact")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_cmd = commands.add_parser("export", help="Write <model>.artifact from a joblib pipeline")
+    export_cmd.add_argument("model", help="Fitted joblib pipeline")
+    export_cmd.add_argument("--output", default=None, help="Artifact directory (default: next to the model)")
+    verify_cmd = commands.add_parser("verify", help="Check an artifact against its manifest hashes")
+    verify_cmd.add_argument("artifact")
+    bench_cmd = commands.add_parser("bench", help="Compare cold start and memory of several model files")
+    bench_cmd.add_argument("paths", nargs="+", help="joblib files and/or artifact directories")
+    bench_cmd.add_argument("--runs", type=int, default=3, help="Fresh processes per path (best is reported)")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        output = export(args.model, args.output)
+        print(f"✅ Artifact written to {output} (version {artifact_version(output)})")
+    elif args.command == "verify":
+        load_artifact(args.artifact)
+        print(f"✅ {args.artifact} matches its manifest (version {artifact_version(args.artifact)})")
+    else:
+        for result in bench(args.paths, args.runs):
+            print(
+                f"{result['path']}: load + first predict {result['load_seconds'] * 1000:.0f} ms "
+                f"(after {result['import_seconds'] * 1000:.0f} ms of imports), "
+                f"RSS {result['rss_mb']:.1f} MB, private {result['uss_mb']:.1f} MB"
+                f"{'' if result['predicts'] else ' (predict failed)'}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""Registry serving several pricing models from one backend process.
+
+Every ``*.joblib`` artifact in ``MODEL_DIR`` becomes a named model (its
+file stem). Models are loaded lazily on first use and warmed up with one
+prediction, so cold models cost nothing until they are asked for.
+Artifacts are loaded with ``mmap_mode="r"`` so their numpy arrays stay in
+the shared page cache, and artifacts with identical content (copies or
+symlinks under several names) share a single loaded object.
+
+When ``memory_budget_bytes`` is set, the least recently used models are
+unloaded after each load until the estimated resident size fits; the
+default model is pinned, and so is every model leased by a request in
+flight (``acquire``/``release``), so eviction never pulls a model out from
+under a running prediction. Per-model inference latency is kept in rolling
+1/5/15-minute sketches for ``/metrics/json``.
+"""
+
+import glob
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import psutil
+
+from pricing import FEATURES, load_model, model_version, to_feature_frame
+from sketches import RollingQuantiles
+
+WARMUP_RECORD = {"model_year": 2020, "age": 4, "fuel_type": "Gasoline", "transmission": "Automatic", "clean_title": 1}
+
+
+class UnknownModel(KeyError):
+    """The requested model name is not in the registry."""
+
+
+class ModelEntry:
+    """One named artifact and, while loaded, its model object."""
+
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        self.version: Optional[str] = None
+        self.model: Any = None
+        self.loaded = False
+        self.memory_bytes = 0
+        self.load_seconds = 0.0
+        self.last_used = 0.0
+        self.requests = 0
+        self.loads = 0
+        self.leases = 0  # Peticiones en curso que lo usan: no se descarga mientras sea > 0
+        # Objetos derivados del modelo (p.ej. el explicador); se descartan al descargarlo
+        self.attachments: Dict[str, Any] = {}
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    """Named models with lazy loading and LRU unloading under a memory budget.
+
+    Args:
+        paths: Model name -> artifact path.
+        default: Name served when a request does not pick a model.
+        memory_budget_bytes: Estimated resident size allowed for loaded models (0 = unlimited).
+        loader: Called with (path, mmap_mode) to load an artifact.
+        on_load: Called with each newly loaded model before its warm-up (e.g. to cap its threads).
+    """
+
+    def __init__(
+        self,
+        paths: Dict[str, str],
+        default: Optional[str] = None,
+        memory_budget_bytes: int = 0,
+        loader: Callable[..., Any] = load_model,
+        on_load: Optional[Callable[[Any], None]] = None,
+    ):
+        if not paths:
+            raise ValueError("The model registry needs at least one artifact")
+        self.entries = {name: ModelEntry(name, path) for name, path in paths.items()}
+        self.default = default if default in self.entries else sorted(self.entries)[0]
+        self.memory_budget_bytes = memory_budget_bytes
+        self.loader = loader
+        self.on_load = on_load
+        self.latency = RollingQuantiles(prefix="models")
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_directory(cls, model_dir: str, default: Optional[str] = None, **kwargs) -> "ModelRegistry":
+        # Un *.artifact exportado sustituye al *.joblib del mismo nombre (carga sin pickle, mmap)
+        found = sorted(glob.glob(os.path.join(model_dir, "*.joblib"))) + sorted(
+            glob.glob(os.path.join(model_dir, "*.artifact"))
+        )
+        paths = {os.path.splitext(os.path.basename(p))[0]: p for p in found}
+        if not paths:
+            raise ValueError(f"No *.joblib or *.artifact models found in {model_dir}")
+        return cls(paths, default=default, **kwargs)
+
+    def names(self):
+        return sorted(self.entries)
+
+    def get(self, name: Optional[str] = None) -> ModelEntry:
+        """Entry for ``name`` (or the default), loading and warming it up if needed.
+
+        Raises:
+            UnknownModel: If ``name`` is not registered.
+        """
+        entry = self.entries.get(name or self.default)
+        if entry is None:
+            raise UnknownModel(name)
+        entry.last_used = time.monotonic()
+        if not entry.loaded:
+            with entry.lock:
+                if not entry.loaded:
+                    self._load(entry)
+            self._enforce_budget(keep=entry)
+        return entry
+
+    def acquire(self, name: Optional[str] = None) -> ModelEntry:
+        """Like ``get``, but the entry cannot be unloaded until ``release`` is called.
+
+        Raises:
+            UnknownModel: If ``name`` is not registered.
+        """
+        entry = self.entries.get(name or self.default)
+        if entry is None:
+            raise UnknownModel(name)
+        with self._lock:
+            entry.leases += 1  # Antes de cargarlo: a partir de aquí el presupuesto no lo toca
+        try:
+            return self.get(entry.name)
+        except BaseException:
+            self.release(entry)
+            raise
+
+    def release(self, entry: ModelEntry) -> None:
+        with self._lock:
+            entry.leases -= 1
+
+    def _shared_model(self, version: str) -> Optional[ModelEntry]:
+        with self._lock:
+            return next((e for e in self.entries.values() if e.loaded and e.version == version and e.model is not None), None)
+
+    def _load(self, entry: ModelEntry) -> None:
+        started = time.perf_counter()
+        entry.version = model_version(entry.path)
+        twin = self._shared_model(entry.version)
+        if twin is not None:
+            entry.model, entry.memory_bytes = twin.model, 0  # Mismo artefacto: no se cuenta dos veces
+        else:
+            rss_before = psutil.Process().memory_info().rss
+            entry.model = self.loader(entry.path, mmap_mode="r")
+            if self.on_load is not None and entry.model is not None:
+                self.on_load(entry.model)
+            self._warm_up(entry)
+            grown = psutil.Process().memory_info().rss - rss_before
+            size = os.path.getsize(entry.path) if os.path.exists(entry.path) else 0
+            entry.memory_bytes = max(grown, size) if entry.model is not None else 0
+        entry.load_seconds = time.perf_counter() - started
+        entry.loads += 1
+        entry.loaded = True
+        print(f"📦 Model '{entry.name}' loaded ({entry.version}) in {entry.load_seconds:.2f}s")
+
+    @staticmethod
+    def _warm_up(entry: ModelEntry) -> None:
+        if entry.model is None:
+            return
+        try:
+            entry.model.predict(to_feature_frame([WARMUP_RECORD])[FEATURES])
+        except Exception as e:
+            print(f"Warning: warm-up of model '{entry.name}' failed: {e}")
+
+    def _unload(self, entry: ModelEntry) -> bool:
+        """Unload ``entry`` unless a request leased it meanwhile; True if it was unloaded."""
+        with self._lock:
+            if entry.leases or not entry.loaded:
+                return False
+            twin = next((e for e in self.entries.values() if e is not entry and e.loaded and e.version == entry.version), None)
+            if twin is not None:
+                # El objeto sigue vivo a través del gemelo: la memoria pasa a su cuenta
+                twin.memory_bytes = max(twin.memory_bytes, entry.memory_bytes)
+            entry.loaded = False
+            entry.model = None
+            entry.attachments.clear()
+            entry.memory_bytes = 0
+            self.evictions += 1
+        print(f"♻️  Model '{entry.name}' unloaded (memory budget)")
+        return True
+
+    def loaded_bytes(self) -> int:
+        return sum(e.memory_bytes for e in self.entries.values() if e.loaded)
+
+    def _enforce_budget(self, keep: ModelEntry) -> None:
+        if not self.memory_budget_bytes:
+            return
+        with self._lock:
+            candidates = sorted(
+                (e for e in self.entries.values() if e.loaded and not e.leases and e is not keep and e.name != self.default),
+                key=lambda e: e.last_used,
+            )
+        for entry in candidates:
+            if self.loaded_bytes() <= self.memory_budget_bytes:
+                break
+            self._unload(entry)
+
+    def record(self, entry: ModelEntry, latency_ms: float) -> None:
+        """Account one inference call served by ``entry``."""
+        entry.requests += 1
+        self.latency.record(entry.name, latency_ms)
+
+    def stats(self) -> Dict[str, Any]:
+        latency = self.latency.report()
+        models = {}
+        for name in self.names():
+            entry = self.entries[name]
+            models[name] = {
+                "loaded": entry.loaded,
+                "version": entry.version,
+                "memory_mb": round(entry.memory_bytes / (1024 * 1024), 2),
+                "load_seconds": round(entry.load_seconds, 3),
+                "loads": entry.loads,
+                "requests": entry.requests,
+                "latency_ms": latency.get(name, {}),
+            }
+        return {
+            "default": self.default,
+            "memory_budget_mb": round(self.memory_budget_bytes / (1024 * 1024), 2),
+            "loaded_mb": round(self.loaded_bytes() / (1024 * 1024), 2),
+            "evictions": self.evictions,
+            "models": models,
+        }
@@ -0,0 +1,181 @@
+"""Shared pricing logic for the API and the offline scoring jobs.
+
+Holds the fallback formula used when the ML model is unavailable, a
+vectorized variant that scores a whole DataFrame in one ``predict`` call,
+and helpers to load and fingerprint the model artifact.
+"""
+
+import hashlib
+import math
+import os
+from itertools import product
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from model_artifact import artifact_version, is_artifact, load_artifact
+
+# Entradas del modelo, en el orden del ColumnTransformer
+FEATURES = ["model_year", "age", "fuel_type", "transmission", "clean_title"]
+NUMERIC_FEATURES = ["model_year", "age", "clean_title"]
+CATEGORICAL_FEATURES = ["fuel_type", "transmission"]
+
+FUEL_BONUS = {"Electric": 3000, "Hybrid": 1500, "Gasoline": 0, "Diesel": -500}
+MIN_FALLBACK_PRICE = 5000
+
+
+def fallback_price(data: Dict[str, Any]) -> float:
+    """Cálculo de respaldo cuando el modelo no está disponible."""
+    base_price = 15000 + (data["model_year"] - 2000) * 500 - data["age"] * 800
+    fuel_bonus = FUEL_BONUS.get(data["fuel_type"], 0)
+    trans_bonus = 500 if data["transmission"] == "Automatic" else 0
+    title_bonus = 1000 if data["clean_title"] == 1 else -2000
+    return max(base_price + fuel_bonus + trans_bonus + title_bonus, MIN_FALLBACK_PRICE)
+
+
+def fallback_prices(frame: pd.DataFrame) -> np.ndarray:
+    """Vectorized ``fallback_price`` over a feature frame."""
+    base_price = 15000 + (frame["model_year"].to_numpy(dtype=float) - 2000) * 500 - frame["age"].to_numpy(dtype=float) * 800
+    fuel_bonus = frame["fuel_type"].map(FUEL_BONUS).fillna(0).to_numpy(dtype=float)
+    trans_bonus = np.where(frame["transmission"].to_numpy() == "Automatic", 500, 0)
+    title_bonus = np.where(frame["clean_title"].to_numpy(dtype=float) == 1, 1000, -2000)
+    return np.maximum(base_price + fuel_bonus + trans_bonus + title_bonus, MIN_FALLBACK_PRICE)
+
+
+def to_feature_frame(records: Union[pd.DataFrame, Iterable[Dict[str, Any]]]) -> pd.DataFrame:
+    """Build the model input frame, coercing numeric columns to float.
+
+    Values that cannot be parsed become NaN and are imputed by the model
+    pipeline, exactly as a missing value would be.
+    """
+    frame = records if isinstance(records, pd.DataFrame) else pd.DataFrame(list(records))
+    frame = frame.reindex(columns=FEATURES)
+    for column in NUMERIC_FEATURES:
+        frame[column] = pd.to_numeric(frame[column], errors="coerce").astype(float)
+    for column in CATEGORICAL_FEATURES:
+        frame[column] = frame[column].astype(object)
+    return frame
+
+
+def predict_prices(modelo, records: Union[pd.DataFrame, Iterable[Dict[str, Any]]]) -> np.ndarray:
+    """Score many vehicles in a single ``modelo.predict`` call.
+
+    Mirrors ``predict_price``: if the model is missing or fails, the whole
+    batch is priced with the fallback formula.
+    """
+    frame = to_feature_frame(records)
+    if len(frame) == 0:
+        return np.empty(0, dtype=float)
+    if modelo is not None:
+        try:
+            return np.asarray(modelo.predict(frame), dtype=float)
+        except Exception as e:
+            print(f"ML model error: {e}, using fallback")
+    return fallback_prices(frame)
+
+
+def _sweep_axis(feature: str, spec: Any, max_points: int) -> List[Any]:
+    """Expand a sweep spec: an explicit list, or {"start", "stop", "step"} for numeric features."""
+    if isinstance(spec, dict):
+        if feature not in NUMERIC_FEATURES:
+            raise ValueError(f"'{feature}' es categórica: use una lista de valores")
+        start, stop, step = float(spec["start"]), float(spec["stop"]), float(spec.get("step", 1))
+        # inf/NaN (p.ej. 1e400 en el JSON) desbordarían el conteo de puntos
+        if not all(math.isfinite(v) for v in (start, stop, step)) or step <= 0 or stop < start:
+            raise ValueError(f"Rango inválido para '{feature}'")
+        count = int(np.floor((stop - start) / step + 1e-9)) + 1
+        if count > max_points:
+            raise ValueError(f"La grilla supera el máximo de {max_points} puntos")
+        values = [round(start + i * step, 6) for i in range(count)]
+    elif isinstance(spec, list) and spec:
+        values = spec
+    else:
+        raise ValueError(f"Barrido inválido para '{feature}'")
+    if feature in NUMERIC_FEATURES:
+        numbers = [float(v) for v in values]
+        if not all(math.isfinite(v) for v in numbers):
+            raise ValueError(f"Valores no finitos en el barrido de '{feature}'")
+        return numbers
+    return [str(v) for v in values]
+
+
+def _base_values(base: Dict[str, Any], swept: List[str]) -> Dict[str, Any]:
+    """Parse the fixed (not swept) fields of the base vehicle, like a single prediction does."""
+    missing = [f for f in FEATURES if f not in swept and base.get(f) is None]
+    if missing:
+        raise ValueError(f"Faltan campos del vehículo base: {', '.join(missing)}")
+    fixed = {}
+    for feature in FEATURES:
+        if feature in swept:
+            continue
+        try:
+            # Un valor no numérico es un error, no un NaN que el modelo imputaría en silencio
+            fixed[feature] = float(base[feature]) if feature in NUMERIC_FEATURES else str(base[feature])
+        except (TypeError, ValueError):
+            raise ValueError(f"Valor inválido en el vehículo base para '{feature}': {base[feature]!r}") from None
+    return fixed
+
+
+def build_sweep_grid(
+    base: Dict[str, Any], sweep: Dict[str, Any], max_points: int
+) -> Tuple[List[str], Dict[str, List[Any]], pd.DataFrame]:
+    """Cartesian grid of one or two swept features around a base vehicle.
+
+    Returns the swept feature names, their axis values and the feature frame
+    in row-major order (first feature varies slowest).
+
+    Raises:
+        ValueError: Unknown features, a bad spec, an invalid base field or a grid above ``max_points``.
+    """
+    features = list(sweep)
+    if not 1 <= len(features) <= 2:
+        raise ValueError("Se puede barrer una o dos variables")
+    unknown = [f for f in features if f not in FEATURES]
+    if unknown:
+        raise ValueError(f"Variables desconocidas: {', '.join(unknown)}")
+    fixed = _base_values(base, features)
+
+    # Se dimensiona antes de expandir para no materializar grillas gigantes
+    axes = {}
+    size = 1
+    for feature in features:
+        axes[feature] = _sweep_axis(feature, sweep[feature], max_points)
+        size *= len(axes[feature])
+        if size > max_points:
+            raise ValueError(f"La grilla supera el máximo de {max_points} puntos")
+
+    rows = product(*(axes[f] for f in features))
+    frame = pd.DataFrame(list(rows), columns=features)
+    for feature, value in fixed.items():
+        frame[feature] = value
+    return features, axes, to_feature_frame(frame)
+
+
+def load_model(model_path: str, mmap_mode: Optional[str] = None):
+    """Load the joblib pipeline (or a ``model_artifact`` directory), returning None when missing.
+
+    ``mmap_mode="r"`` memory-maps the artifact's numpy arrays so processes
+    loading the same file share those pages.
+    """
+    if is_artifact(model_path):
+        return load_artifact(model_path)
+    try:
+        return joblib.load(model_path, mmap_mode=mmap_mode)
+    except FileNotFoundError:
+        print(f"Warning: ML model not found at {model_path}, using fallback prediction")
+        return None
+
+
+def model_version(model_path: Optional[str]) -> str:
+    """Short content hash identifying a model artifact ("fallback" if absent)."""
+    if not model_path or not os.path.exists(model_path):
+        return "fallback"
+    if os.path.isdir(model_path):
+        return artifact_version(model_path)
+    digest = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:12]
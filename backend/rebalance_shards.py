@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Change the number of shards of the vehicle store.
+
+Moves every listing to shard ``id % N`` of a new generation and switches the
+store over atomically; publishes from running backends wait on the store
+lock for the duration and continue on the new layout. Also imports the
+single-file store (``DB_PATH``) into shards, or exports the shards back to
+a JSON array file:
+
+    cd backend && python rebalance_shards.py --shards 8
+    cd backend && python rebalance_shards.py --shards 4 --import-json vehiculos.json
+    cd backend && python rebalance_shards.py --export-json vehiculos.json
+"""
+
+import argparse
+import json
+import os
+from typing import List, Optional
+
+from vehicle_store import ShardedVehicleStore, default_shard_dir, rebalance
+
+
+def export_json(directory: str, path: str) -> int:
+    """Write every listing, ordered by id, to a JSON array file; returns the count."""
+    listings = sorted(ShardedVehicleStore(directory, workers=1).iter_listings(), key=lambda v: v["id"])
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(listings, f, indent=4)
+    os.replace(tmp_path, path)
+    return len(listings)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    db_path = os.environ.get("DB_PATH", "vehiculos.json")
+    parser = argparse.ArgumentParser(description="Rebalance the sharded vehicle store")
+    parser.add_argument(
+        "--dir", default=os.environ.get("VEHICLE_SHARD_DIR") or default_shard_dir(db_path), help="Shard directory"
+    )
+    parser.add_argument("--shards", type=int, default=None, help="New number of shards")
+    parser.add_argument("--import-json", default=None, help="JSON array store to import when the directory is empty")
+    parser.add_argument("--export-json", default=None, help="Write all listings to this JSON array file instead")
+    args = parser.parse_args(argv)
+
+    if args.export_json:
+        count = export_json(args.dir, args.export_json)
+        print(f"✅ Exported {count} listings from {args.dir} to {args.export_json}")
+        return
+    if args.shards is None:
+        parser.error("--shards is required unless --export-json is given")
+    stats = rebalance(args.dir, args.shards, import_from=args.import_json)
+    print(
+        f"✅ {args.dir}: {stats['shards_before']} -> {stats['shards_after']} shards (generation {stats['generation']}), "
+        f"{stats['listings']} listings, {stats['moved']} moved"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Offline high-throughput scoring of CSV/Parquet files.
+
+Loads ``modelo.joblib`` once, reads the input in chunks, scores the chunks in
+parallel across cores with the same fallback rules as ``predict_price`` and
+writes the output incrementally in input order:
+
+    cd backend && python -m score_file autos.csv precios.csv --workers 8
+
+The output format follows the output extension (.csv, .ndjson/.jsonl or
+.parquet). Parquet input/output requires ``pyarrow``.
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from pricing import load_model, predict_prices
+from thread_budget import ThreadBudget
+
+PREDICTION_COLUMN = "current_value_market_estimado"
+
+# Modelo heredado por fork (o cargado por el initializer) en cada worker
+_worker_model = None
+
+
+def _file_format(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".parquet", ".pq"):
+        return "parquet"
+    if ext in (".ndjson", ".jsonl"):
+        return "ndjson"
+    return "csv"
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet as pq
+    except ImportError:
+        sys.exit("❌ Parquet requiere pyarrow: pip install pyarrow")
+    return pq
+
+
+def read_chunks(path: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Yield the input file as DataFrames of at most ``chunk_size`` rows."""
+    input_format = _file_format(path)
+    if input_format == "parquet":
+        pq = _require_pyarrow()
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    elif input_format == "ndjson":
+        yield from pd.read_json(path, lines=True, chunksize=chunk_size)
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+def _init_worker(model_path: Optional[str]) -> None:
+    global _worker_model
+    if model_path is not None:
+        _worker_model = load_model(model_path)
+    # El paralelismo lo da el pool: un hilo nativo por proceso (modelo y pools BLAS/OpenMP)
+    ThreadBudget(native_threads=1).apply().configure_model(_worker_model)
+
+
+def _score_chunk(chunk: pd.DataFrame, output_format: str, header: bool):
+    """Score one chunk; text formats are also serialized in the worker."""
+    prices = np.round(predict_prices(_worker_model, chunk), 2)
+    if output_format == "parquet":
+        return len(chunk), prices
+    chunk[PREDICTION_COLUMN] = prices
+    if output_format == "ndjson":
+        return len(chunk), chunk.to_json(orient="records", lines=True, force_ascii=False)
+    return len(chunk), chunk.to_csv(header=header, index=False)
+
+
+class _OutputWriter:
+    """Incremental writer for the three supported output formats."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.format = _file_format(path)
+        self._parquet = None
+        self._text = None if self.format == "parquet" else open(path, "w", encoding="utf-8", newline="")
+
+    def write(self, chunk: Optional[pd.DataFrame], payload: Any) -> None:
+        if self._text is not None:
+            self._text.write(payload)
+            return
+        import pyarrow as pa
+
+        chunk[PREDICTION_COLUMN] = payload
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if self._parquet is None:
+            pq = _require_pyarrow()
+            self._parquet = pq.ParquetWriter(self.path, table.schema)
+        self._parquet.write_table(table)
+
+    def close(self) -> None:
+        if self._text is not None:
+            self._text.close()
+        if self._parquet is not None:
+            self._parquet.close()
+
+
+def _peak_rss_mb() -> Dict[str, float]:
+    # ru_maxrss está en KiB en Linux
+    return {
+        "parent": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "largest_worker": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+
+def score_file(
+    input_path: str,
+    output_path: str,
+    model_path: Optional[str],
+    workers: Optional[int] = None,
+    chunk_size: int = 200000,
+) -> Dict[str, Any]:
+    """Score ``input_path`` into ``output_path``; returns throughput statistics."""
+    global _worker_model
+    workers = workers or os.cpu_count() or 1
+    output_format = _file_format(output_path)
+    if output_format == "parquet" or _file_format(input_path) == "parquet":
+        _require_pyarrow()
+
+    # Se carga una sola vez: con fork los workers comparten las páginas del padre
+    methods = multiprocessing.get_all_start_methods()
+    if "fork" in methods:
+        _worker_model = load_model(model_path) if model_path else None
+        context, initargs = multiprocessing.get_context("fork"), (None,)
+    else:
+        context, initargs = multiprocessing.get_context(), (model_path,)
+
+    writer = _OutputWriter(output_path)
+    started = time.perf_counter()
+    rows = 0
+    try:
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=initargs) as pool:
+            window: List[Any] = []
+            for index, chunk in enumerate(read_chunks(input_path, chunk_size)):
+                future = pool.submit(_score_chunk, chunk, output_format, index == 0)
+                window.append((future, chunk if output_format == "parquet" else None))
+                # Ventana acotada: memoria constante y salida en el orden de entrada
+                while len(window) > workers * 2:
+                    rows += _drain(window.pop(0), writer)
+            while window:
+                rows += _drain(window.pop(0), writer)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "rows": rows,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed, 1) if elapsed > 0 else None,
+        "workers": workers,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _drain(entry, writer: _OutputWriter) -> int:
+    future, chunk = entry
+    n_rows, payload = future.result()
+    writer.write(chunk, payload)
+    return n_rows
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Score a CSV/Parquet file of vehicles offline")
+    parser.add_argument("input", help="Input file (.csv, .ndjson/.jsonl or .parquet)")
+    parser.add_argument("output", help="Output file; format follows the extension")
+    parser.add_argument("--model", default=os.environ.get("MODEL_PATH", "modelo/modelo.joblib"), help="Model (MODEL_PATH)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--chunk-size", type=int, default=200000, help="Rows per scoring chunk")
+    args = parser.parse_args(argv)
+
+    stats = score_file(args.input, args.output, args.model, workers=args.workers, chunk_size=args.chunk_size)
+    peak = stats["peak_rss_mb"]
+    print(
+        f"✅ {stats['rows']} rows in {stats['seconds']}s ({stats['rows_per_second']} rows/sec, {stats['workers']} workers) | "
+        f"peak RSS parent {peak['parent']} MB, largest worker {peak['largest_worker']} MB"
+    )
+
+
+if __name__ == "__main__":
+    main()
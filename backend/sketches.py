@@ -0,0 +1,275 @@
+"""Mergeable latency sketches over sliding 1/5/15-minute windows.
+
+``LogHistogram`` buckets values logarithmically (DDSketch layout): every
+quantile it reports is within ``relative_accuracy`` of the true value, it
+occupies a fixed array whatever the traffic, and two sketches merge by
+adding their bucket counts. Merging is what makes percentiles from several
+worker processes meaningful, where averaging per-worker p99s is not.
+
+``RollingQuantiles`` keeps one sketch per (series, 10-second slot) in a
+ring covering the longest window; a window is the merge of the slots that
+started within it, so "1m" always spans the last 50-60 seconds rather than
+whatever part of the current minute has elapsed. With ``shared_dir`` set,
+each process periodically dumps its live slots to ``<prefix>-<pid>.json``
+there and reports merge the files of every live peer.
+"""
+
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_WINDOWS_MINUTES = (1, 5, 15)
+DEFAULT_PERCENTILES = (50, 95, 99)
+
+
+class LogHistogram:
+    """Fixed-memory log-bucketed histogram with bounded relative error.
+
+    Args:
+        relative_accuracy: Maximum relative error of any reported quantile.
+        min_value: Values below this share the first bucket.
+        max_value: Values above this share the last bucket.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 0.01, max_value: float = 3_600_000.0):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+        gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._gamma = gamma
+        self._log_gamma = math.log(gamma)
+        self._offset = math.ceil(math.log(min_value) / self._log_gamma)
+        size = math.ceil(math.log(max_value) / self._log_gamma) - self._offset + 1
+        self.counts = np.zeros(size, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def _index(self, value: float) -> int:
+        value = min(max(value, self.min_value), self.max_value)
+        return min(math.ceil(math.log(value) / self._log_gamma) - self._offset, len(self.counts) - 1)
+
+    def record(self, value: float) -> None:
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.maximum:
+            self.maximum = float(value)
+
+    def _compatible(self, other: "LogHistogram") -> bool:
+        return (other.relative_accuracy, other.min_value, other.max_value) == (
+            self.relative_accuracy,
+            self.min_value,
+            self.max_value,
+        )
+
+    def merge(self, other: "LogHistogram") -> "LogHistogram":
+        if not self._compatible(other):
+            raise ValueError("Cannot merge sketches with different accuracy or range")
+        self.counts += other.counts
+        self.count += other.count
+        self.total += other.total
+        self.maximum = max(self.maximum, other.maximum)
+        return self
+
+    def quantile(self, q: float) -> float:
+        """Estimated value at quantile ``q`` in [0, 1] (0.0 when empty)."""
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        index = int(np.searchsorted(np.cumsum(self.counts), rank, side="right"))
+        # Punto medio del bucket en escala logarítmica => error relativo <= accuracy
+        value = 2 * self._gamma ** (index + self._offset) / (self._gamma + 1)
+        return min(value, self.maximum)
+
+    def summary(self, percentiles: Iterable[float] = DEFAULT_PERCENTILES) -> Dict[str, float]:
+        report = {"count": self.count}
+        for p in percentiles:
+            report[f"p{p:g}"] = round(self.quantile(p / 100.0), 3)
+        report["mean"] = round(self.total / self.count, 3) if self.count else 0.0
+        report["max"] = round(self.maximum, 3)
+        return report
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Sparse, JSON-serializable form used to share sketches between processes."""
+        nonzero = np.flatnonzero(self.counts)
+        return {
+            "accuracy": self.relative_accuracy,
+            "range": [self.min_value, self.max_value],
+            "buckets": {str(int(i)): int(self.counts[i]) for i in nonzero},
+            "count": self.count,
+            "total": self.total,
+            "max": self.maximum,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LogHistogram":
+        sketch = cls(data["accuracy"], *data["range"])
+        for index, count in data["buckets"].items():
+            sketch.counts[int(index)] = count
+        sketch.count = data["count"]
+        sketch.total = data["total"]
+        sketch.maximum = data["max"]
+        return sketch
+
+
+class RollingQuantiles:
+    """Per-series sketches in a ring of short slots, merged into sliding windows.
+
+    Args:
+        windows: Window lengths in minutes reported by ``report``.
+        slot_seconds: Width of one ring slot; a window spans between its length minus one slot and its length.
+        relative_accuracy: Accuracy of every sketch.
+        shared_dir: Directory where worker processes exchange their sketches.
+        prefix: File prefix in ``shared_dir`` (one per service).
+        max_series: Hard cap on distinct series; extra series are ignored.
+    """
+
+    def __init__(
+        self,
+        windows: Iterable[int] = DEFAULT_WINDOWS_MINUTES,
+        slot_seconds: int = 10,
+        relative_accuracy: float = 0.01,
+        shared_dir: Optional[str] = None,
+        prefix: str = "latency",
+        max_series: int = 64,
+    ):
+        self.windows = tuple(sorted(windows))
+        self.slot_seconds = slot_seconds
+        self.slots = self.windows[-1] * 60 // slot_seconds
+        self.relative_accuracy = relative_accuracy
+        self.shared_dir = shared_dir
+        self.prefix = prefix
+        self.max_series = max_series
+        self._series: Dict[str, List[Tuple[int, Optional[LogHistogram]]]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def _epoch(self, now: float) -> int:
+        return int(now // self.slot_seconds)
+
+    def record(self, series: str, value: float, now: Optional[float] = None) -> None:
+        epoch = self._epoch(time.time() if now is None else now)
+        slot = epoch % self.slots
+        with self._lock:
+            ring = self._series.get(series)
+            if ring is None:
+                if len(self._series) >= self.max_series:
+                    return
+                ring = self._series[series] = [(-1, None)] * self.slots
+            slot_epoch, sketch = ring[slot]
+            if slot_epoch != epoch or sketch is None:
+                sketch = LogHistogram(self.relative_accuracy)
+                ring[slot] = (epoch, sketch)
+            sketch.record(value)
+
+    def export(self, now: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """Live slots as {series: {epoch: sketch dict}} for the shared directory."""
+        oldest = self._epoch(time.time() if now is None else now) - self.slots + 1
+        with self._lock:
+            return {
+                series: {str(epoch): sketch.to_dict() for epoch, sketch in ring if sketch is not None and epoch >= oldest}
+                for series, ring in self._series.items()
+            }
+
+    def _own_file(self) -> str:
+        return os.path.join(self.shared_dir, f"{self.prefix}-{os.getpid()}.json")
+
+    def publish(self) -> None:
+        """Atomically write this process's live slots to the shared directory."""
+        if not self.shared_dir:
+            return
+        os.makedirs(self.shared_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.shared_dir, prefix=".tmp-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.export(), f)
+        os.replace(tmp_path, self._own_file())
+
+    def _peer_exports(self, now: float) -> List[Dict[str, Dict[str, Any]]]:
+        if not self.shared_dir or not os.path.isdir(self.shared_dir):
+            return []
+        own = os.path.basename(self._own_file())
+        stale_after = self.slots * self.slot_seconds
+        exports = []
+        for name in os.listdir(self.shared_dir):
+            if name == own or not (name.startswith(f"{self.prefix}-") and name.endswith(".json")):
+                continue
+            path = os.path.join(self.shared_dir, name)
+            try:
+                if now - os.path.getmtime(path) > stale_after:
+                    os.remove(path)  # Worker muerto: sus datos ya salieron de la ventana
+                    continue
+                with open(path) as f:
+                    exports.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return exports
+
+    def _window_sketches(self, now: float) -> Dict[str, Dict[int, LogHistogram]]:
+        """{series: {minutes: merged sketch}} across this process and its peers."""
+        current = self._epoch(now)
+        merged: Dict[str, Dict[int, LogHistogram]] = {}
+
+        def add(series: str, epoch: int, sketch: LogHistogram) -> None:
+            age_minutes = (current - epoch) * self.slot_seconds / 60
+            for minutes in self.windows:
+                if 0 <= age_minutes < minutes:
+                    merged[series].setdefault(minutes, LogHistogram(self.relative_accuracy)).merge(sketch)
+
+        # Los slots propios se fusionan en memoria; sólo los de otros procesos pasan por JSON
+        with self._lock:
+            for series, ring in self._series.items():
+                merged.setdefault(series, {})
+                for epoch, sketch in ring:
+                    if sketch is not None:
+                        add(series, epoch, sketch)
+        for export in self._peer_exports(now):
+            for series, slots in export.items():
+                merged.setdefault(series, {})
+                for epoch, data in slots.items():
+                    add(series, int(epoch), LogHistogram.from_dict(data))
+        return merged
+
+    def window(self, series: str, minutes: int, now: Optional[float] = None) -> LogHistogram:
+        """Merged sketch of one series over the last ``minutes`` (all processes)."""
+        merged = self._window_sketches(time.time() if now is None else now)
+        return merged.get(series, {}).get(minutes, LogHistogram(self.relative_accuracy))
+
+    def combined(self, minutes: int, now: Optional[float] = None) -> LogHistogram:
+        """Merged sketch of every series over the last ``minutes``."""
+        total = LogHistogram(self.relative_accuracy)
+        for windows in self._window_sketches(time.time() if now is None else now).values():
+            if minutes in windows:
+                total.merge(windows[minutes])
+        return total
+
+    def report(
+        self, now: Optional[float] = None, percentiles: Iterable[float] = DEFAULT_PERCENTILES
+    ) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """{series: {"1m": {count, p50, p95, p99, mean, max}, "5m": ..., "15m": ...}}."""
+        merged = self._window_sketches(time.time() if now is None else now)
+        empty = LogHistogram(self.relative_accuracy)
+        return {
+            series: {f"{m}m": windows.get(m, empty).summary(percentiles) for m in self.windows}
+            for series, windows in sorted(merged.items())
+        }
+
+    def _run(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                self.publish()
+            except Exception as e:
+                print(f"❌ Latency sketch publish error: {e}")
+
+    def start(self, interval: float = 5.0) -> None:
+        """Start publishing to ``shared_dir`` in the background (idempotent, no-op without it)."""
+        if self.shared_dir and self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True, name="latency-sketches")
+            self._thread.start()
@@ -0,0 +1,149 @@
+"""As-you-type suggestions for ``brand_model``.
+
+A case-insensitive prefix trie over the distinct ``brand_model`` values.
+Each value is inserted once per word start ("toyota corolla" and
+"corolla"), so "Cor" finds "Toyota Corolla" as well as "Toy". Every node
+keeps its own top-K values by listing count, so a lookup walks
+``len(prefix)`` nodes and copies at most K entries, independently of how
+many listings or distinct values exist.
+
+Counts only grow (listings are appended), so the per-node top-K stays exact
+under incremental updates: a value can only enter a node's list by
+overtaking its current minimum.
+"""
+
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from change_feed import LoadedIds
+
+
+def normalize(text: str) -> str:
+    """Case- and whitespace-insensitive form used as the trie key."""
+    return " ".join(text.casefold().split())
+
+
+class _Node:
+    __slots__ = ("children", "top")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.top: List[str] = []
+
+
+class SuggestIndex:
+    """Prefix trie over one text field with per-node top-K by frequency.
+
+    Args:
+        top_k: Suggestions kept (and returned at most) per prefix.
+        field: Listing field indexed.
+    """
+
+    def __init__(self, top_k: int = 10, field: str = "brand_model"):
+        self.top_k = top_k
+        self.field = field
+        self.root = _Node()
+        self.counts: Dict[str, int] = {}
+        # Grafía mostrada por clave normalizada (la primera vista)
+        self.display: Dict[str, str] = {}
+        self.offset = 0  # Último offset del change feed aplicado
+        self.loaded = LoadedIds()
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    @classmethod
+    def from_counts(cls, counts: Iterable[Tuple[str, int]], **kwargs) -> "SuggestIndex":
+        index = cls(**kwargs)
+        for value, count in counts:
+            index.add(value, count)
+        return index
+
+    @classmethod
+    def from_listings(cls, listings: Iterable[Dict[str, Any]], **kwargs) -> "SuggestIndex":
+        index = cls(**kwargs)
+        for listing in listings:
+            index.add(listing.get(index.field))
+        return index
+
+    @classmethod
+    def from_store(cls, store, feed=None, **kwargs) -> "SuggestIndex":
+        """Count every listing in ``store``; with a change feed, remember where to resume from."""
+        index = cls(**kwargs)
+        index.offset, index.loaded = LoadedIds.load(store, feed, lambda listing: index.add(listing.get(index.field)))
+        return index
+
+    @classmethod
+    def from_table(cls, table, **kwargs) -> "SuggestIndex":
+        """Build from a ``VehicleTable``: one vectorized count over the dictionary codes."""
+        index = cls(**kwargs)
+        codes, categories = table.categorical(index.field)
+        counts = np.bincount(codes[codes >= 0], minlength=len(categories))
+        for value, count in zip(categories, counts.tolist()):
+            index.add(value, count)
+        for extra in table.overflow.values():
+            index.add(extra.get(index.field))
+        index.offset = table.offset
+        return index
+
+    def _paths(self, key: str) -> List[str]:
+        """Key suffixes starting at each word: every place a prefix may match."""
+        words = key.split(" ")
+        return [" ".join(words[i:]) for i in range(len(words))]
+
+    def _promote(self, node: _Node, key: str) -> None:
+        top = node.top
+        if key not in top:
+            if len(top) >= self.top_k and self.counts[key] <= self.counts[top[-1]]:
+                return
+            top.append(key)
+        top.sort(key=lambda k: (-self.counts[k], k))
+        if len(top) > self.top_k:
+            top.pop()
+
+    def add(self, value: Optional[str], count: int = 1) -> None:
+        """Count ``count`` more listings with ``value`` (non-strings and blanks are ignored)."""
+        if not isinstance(value, str) or count <= 0:
+            return
+        key = normalize(value)
+        if not key:
+            return
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + count
+            self.display.setdefault(key, value.strip())
+            self._promote(self.root, key)
+            for path in self._paths(key):
+                node = self.root
+                for char in path:
+                    node = node.children.setdefault(char, _Node())
+                    self._promote(node, key)
+
+    def suggest(self, prefix: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Most frequent values with a word starting with ``prefix``; an empty prefix gives the overall top."""
+        node = self.root
+        for char in normalize(prefix):
+            node = node.children.get(char)
+            if node is None:
+                return []
+        with self._lock:
+            keys = node.top[: limit or self.top_k]
+            return [{self.field: self.display[k], "count": self.counts[k]} for k in keys]
+
+    def catch_up(self, feed, batch: int = 1000) -> int:
+        """Count publishes from the change feed newer than ``offset``; returns entries applied.
+
+        Listings already counted from the store (published between reading the
+        feed offset and loading the store) are skipped by id.
+        """
+        applied = 0
+        with self._sync_lock:
+            for entry in feed.iter_since(self.offset, batch):
+                if not self.loaded.repeated(entry) and entry["op"] == "publish":
+                    self.add(entry["vehiculo"].get(self.field))
+                    applied += 1
+                self.offset = entry["offset"]
+        return applied
+
+    def stats(self) -> Dict[str, Any]:
+        return {"values": len(self.counts), "listings": sum(self.counts.values()), "top_k": self.top_k, "offset": self.offset}
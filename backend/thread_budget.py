@@ -0,0 +1,169 @@
+"""CPU thread budget shared between web workers and native compute pools.
+
+XGBoost, OpenMP and BLAS each default to one thread per core *per process*,
+so N web workers on a host start N × cores compute threads and thrash under
+load. At startup every worker detects the cores it may really use (CPU
+affinity and the cgroup CPU quota, not ``os.cpu_count()``), divides them by
+the number of workers (``WEB_CONCURRENCY``) and caps its native pools to
+its share:
+
+* the model's ``n_jobs`` / ``nthread`` parameters, applied on every load;
+* BLAS/OpenMP pools already loaded in the process, through ``threadpoolctl``;
+* ``OMP_NUM_THREADS`` and friends, for libraries loaded afterwards.
+
+With pinning enabled each worker claims a free slot (a non-blocking
+``flock`` on ``cpu-slot-N.lock``) and binds itself to that slot's cores, so
+workers do not migrate across each other's caches. The chosen layout is
+reported on ``/health``.
+"""
+
+import fcntl
+import math
+import os
+import tempfile
+from typing import Any, Dict, List, Optional
+
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "BLIS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+# Parámetros de hilos de los estimadores (sklearn/xgboost) dentro del pipeline
+THREAD_PARAMS = ("n_jobs", "nthread")
+CGROUP_V2_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+CGROUP_V1_QUOTA = "/sys/fs/cgroup/cpu/cpu.cfs_quota_us"
+CGROUP_V1_PERIOD = "/sys/fs/cgroup/cpu/cpu.cfs_period_us"
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_limit() -> Optional[float]:
+    """CPUs allowed by the cgroup quota (v2 ``cpu.max`` or v1 CFS), or None when unlimited."""
+    cpu_max = _read(CGROUP_V2_CPU_MAX)
+    if cpu_max:
+        quota, _, period = cpu_max.partition(" ")
+        if quota != "max" and period:
+            return int(quota) / int(period)
+        return None
+    quota, period = _read(CGROUP_V1_QUOTA), _read(CGROUP_V1_PERIOD)
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def affinity_cpus() -> List[int]:
+    """CPU ids this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def available_cpus() -> Dict[str, Any]:
+    """Usable cores: the affinity mask, capped by the cgroup quota (rounded up)."""
+    cpus = affinity_cpus()
+    quota = cgroup_cpu_limit()
+    usable = len(cpus)
+    source = "affinity"
+    if quota is not None and math.ceil(quota) < usable:
+        usable, source = max(1, math.ceil(quota)), "cgroup_quota"
+    return {"cpus": usable, "source": source, "affinity": cpus, "cgroup_quota": quota, "host_cpus": os.cpu_count()}
+
+
+def _claim_slot(slot_dir: str, slots: int):
+    """Lock the first free worker slot; (slot, open lock file) or (None, None) if all are taken."""
+    os.makedirs(slot_dir, exist_ok=True)
+    for slot in range(slots):
+        lock_file = open(os.path.join(slot_dir, f"cpu-slot-{slot}.lock"), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return slot, lock_file
+        except BlockingIOError:
+            lock_file.close()
+    return None, None
+
+
+class ThreadBudget:
+    """Per-worker share of the host's cores for native thread pools.
+
+    Args:
+        workers: Web worker processes sharing the cores (``WEB_CONCURRENCY``).
+        native_threads: Explicit threads per worker (0 = cores / workers).
+        pin: Bind this worker to its own slice of cores.
+        slot_dir: Directory where workers claim their pinning slot.
+    """
+
+    def __init__(self, workers: int = 1, native_threads: int = 0, pin: bool = False, slot_dir: Optional[str] = None):
+        self.detected = available_cpus()
+        self.workers = max(1, workers)
+        cpus = self.detected["cpus"]
+        self.native_threads = native_threads if native_threads > 0 else max(1, cpus // self.workers)
+        self.pin = pin
+        self.slot_dir = slot_dir or os.path.join(tempfile.gettempdir(), "car-price-cpu-slots")
+        self.slot: Optional[int] = None
+        self.pinned_cpus: Optional[List[int]] = None
+        self.pools: List[Dict[str, Any]] = []
+        self._slot_lock = None  # Abierto mientras viva el proceso: libera el slot al salir
+
+    @property
+    def oversubscribed(self) -> bool:
+        return self.workers * self.native_threads > self.detected["cpus"]
+
+    def apply(self) -> "ThreadBudget":
+        """Cap native pools (and pin, if enabled) in the current process."""
+        for name in THREAD_ENV_VARS:
+            os.environ[name] = str(self.native_threads)
+        self._limit_pools()
+        if self.pin:
+            self._pin()
+        return self
+
+    def _limit_pools(self) -> None:
+        """Cap the BLAS/OpenMP pools loaded so far (threadpoolctl is optional)."""
+        try:
+            from threadpoolctl import threadpool_info, threadpool_limits
+        except ImportError:
+            return
+        threadpool_limits(limits=self.native_threads)
+        self.pools = [
+            {"api": pool["user_api"], "library": pool["internal_api"], "threads": pool["num_threads"]}
+            for pool in threadpool_info()
+        ]
+
+    def _pin(self) -> None:
+        cpus = self.detected["affinity"]
+        per_worker = len(cpus) // self.workers
+        if per_worker < 1 or not hasattr(os, "sched_setaffinity"):
+            return  # Menos núcleos que workers: fijarlos sólo los amontonaría
+        self.slot, self._slot_lock = _claim_slot(self.slot_dir, self.workers)
+        if self.slot is None:
+            return
+        self.pinned_cpus = [cpu for i, cpu in enumerate(cpus) if i // per_worker == self.slot]
+        os.sched_setaffinity(0, self.pinned_cpus)
+
+    def configure_model(self, model: Any) -> None:
+        """Set ``n_jobs``/``nthread`` on every estimator of a loaded model (pipelines included).
+
+        Loading the model may have loaded new OpenMP runtimes, so the pools are capped again.
+        """
+        if model is None or not hasattr(model, "get_params"):
+            return
+        params = {key: self.native_threads for key in model.get_params(deep=True) if key.rsplit("__", 1)[-1] in THREAD_PARAMS}
+        if params:
+            model.set_params(**params)
+        self._limit_pools()
+
+    def layout(self) -> Dict[str, Any]:
+        return {
+            "cpus": self.detected["cpus"],
+            "source": self.detected["source"],
+            "cgroup_quota": self.detected["cgroup_quota"],
+            "host_cpus": self.detected["host_cpus"],
+            "web_workers": self.workers,
+            "native_threads_per_worker": self.native_threads,
+            "oversubscribed": self.oversubscribed,
+            "pinned_cpus": self.pinned_cpus,
+            "slot": self.slot,
+            "pools": self.pools,
+        }
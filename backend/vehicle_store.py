@@ -0,0 +1,432 @@
+"""Vehicle listing storage.
+
+Listings live in a JSON array file (``DB_PATH``). Writers serialize through
+an ``flock`` on a sidecar lock file so the API and offline jobs such as the
+re-scoring backfill can share the file safely, and rewrites go through a
+temporary file plus ``os.replace`` so readers never see a partial array.
+
+With ``VEHICLE_SHARDS`` > 1 the listings are instead hash-partitioned by id
+across N append-only JSON Lines shards (``ShardedVehicleStore``), each with
+its own lock and id sequence, so concurrent publishes — from several
+workers or several nodes sharing the volume — only contend when they land
+on the same shard. ``rebalance_shards.py`` changes N.
+"""
+
+import fcntl
+import heapq
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+_SEPARATORS = " \t\r\n,"
+SHARD_META = "store.json"
+Predicate = Callable[[Dict[str, Any]], bool]
+
+
+def _skip_separators(buffer: str, pos: int) -> int:
+    while pos < len(buffer) and buffer[pos] in _SEPARATORS:
+        pos += 1
+    return pos
+
+
+def _read_array_start(f, chunk_size: int, path: str) -> Optional[str]:
+    """Read up to the opening bracket; None for an empty file."""
+    buffer = ""
+    while not buffer.strip():
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return None
+        buffer += chunk
+    buffer = buffer.lstrip()
+    if not buffer.startswith("["):
+        raise ValueError(f"{path} no contiene un arreglo JSON")
+    return buffer
+
+
+def iter_json_array(path: str, chunk_size: int = 1 << 16) -> Iterator[Dict[str, Any]]:
+    """Yield the elements of a top-level JSON array without loading it whole."""
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = _read_array_start(f, chunk_size, path)
+        if buffer is None:
+            return
+        pos = 1
+        eof = False
+        while True:
+            pos = _skip_separators(buffer, pos)
+            if buffer.startswith("]", pos):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+                # A value ending exactly at the buffer edge may be truncated
+                complete = end < len(buffer) or eof
+            except json.JSONDecodeError:
+                if eof:
+                    if buffer[pos:].strip():
+                        raise
+                    return
+                complete = False
+            if not complete:
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            yield item
+            pos = end
+
+
+@contextmanager
+def _flock(path: str, mode: int):
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file, mode)
+        try:
+            yield lock_file
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _page(
+    listings: Iterable[Dict[str, Any]], after_id: int, limit: int, predicate: Optional[Predicate]
+) -> List[Dict[str, Any]]:
+    """The ``limit`` listings with the smallest ids above ``after_id`` that match ``predicate``."""
+    matching = (v for v in listings if v.get("id", 0) > after_id and (predicate is None or predicate(v)))
+    return heapq.nsmallest(limit, matching, key=lambda v: v["id"])
+
+
+class JsonVehicleStore:
+    """Listings stored as a single JSON array file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w") as f:
+                json.dump([], f)
+
+    def locked(self):
+        """Exclusive cross-process lock for read-modify-write cycles."""
+        return _flock(self.lock_path, fcntl.LOCK_EX)
+
+    def load(self) -> List[Dict[str, Any]]:
+        with open(self.path, "r") as f:
+            return json.load(f)
+
+    def iter_listings(self) -> Iterator[Dict[str, Any]]:
+        """Stream every listing in storage order."""
+        return iter_json_array(self.path)
+
+    def get(self, vehicle_id: int) -> Optional[Dict[str, Any]]:
+        return next((v for v in self.iter_listings() if v.get("id") == vehicle_id), None)
+
+    def query(self, predicate: Optional[Predicate] = None, after_id: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+        """One page of matching listings ordered by id, starting after ``after_id``."""
+        return _page(self.iter_listings(), after_id, limit, predicate)
+
+    def describe(self) -> Dict[str, Any]:
+        return {"type": "json", "path": self.path}
+
+    def _write(self, vehiculos: List[Dict[str, Any]]) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".vehiculos-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(vehiculos, f, indent=4)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def publish(self, data: Dict[str, Any]) -> int:
+        """Append a listing, assigning and returning its id."""
+        with self.locked():
+            vehiculos = self.load()
+            nuevo_id = len(vehiculos) + 1
+            data["id"] = nuevo_id
+            vehiculos.append(data)
+            self._write(vehiculos)
+        return nuevo_id
+
+    def update_many(self, updates: Dict[int, Dict[str, Any]]) -> int:
+        """Merge ``updates[id]`` into every listing with that id; returns rows touched."""
+        touched = 0
+        with self.locked():
+            vehiculos = self.load()
+            for vehiculo in vehiculos:
+                cambios = updates.get(vehiculo.get("id"))
+                if cambios:
+                    vehiculo.update(cambios)
+                    touched += 1
+            self._write(vehiculos)
+        return touched
+
+
+def _read_meta(directory: str) -> Optional[Dict[str, int]]:
+    try:
+        with open(os.path.join(directory, SHARD_META)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_atomic(path: str, text: str) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    with os.fdopen(fd, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _iter_lines(path: str) -> Iterator[Dict[str, Any]]:
+    try:
+        f = open(path, "r", encoding="utf-8")
+    except FileNotFoundError:
+        return
+    with f:
+        for line in f:
+            # Una línea sin salto final es un append en curso de otro proceso
+            if not line.endswith("\n"):
+                return
+            if line.strip():
+                yield json.loads(line)
+
+
+class ShardedVehicleStore:
+    """Listings hash-partitioned by id across N JSON Lines shards.
+
+    A listing's id is ``local_seq * N + shard``: every shard allocates its
+    own sequence under its own lock, ids stay globally unique, and the shard
+    holding any id is ``id % N``. Publishes append one line to the first
+    shard whose lock is free. The layout (N and a generation number) lives in
+    ``store.json``. Every operation, reads included, holds a shared lock on
+    the directory for its whole duration (a scan until it is exhausted or
+    closed); ``rebalance`` takes it exclusively, so it waits for them before
+    swapping in a new generation and deleting the old one.
+
+    Args:
+        directory: Directory holding ``store.json`` and the shard generations.
+        workers: Threads used to scan shards in parallel for ``query``.
+    """
+
+    def __init__(self, directory: str, workers: Optional[int] = None):
+        self.directory = directory
+        self.layout_lock_path = os.path.join(directory, "store.lock")
+        if _read_meta(directory) is None:
+            raise ValueError(f"{directory} no contiene un almacén particionado (falta {SHARD_META})")
+        self._meta_stamp: Optional[Tuple[int, int]] = None
+        self._meta: Dict[str, int] = {}
+        self._meta_lock = threading.Lock()
+        self._cursor = random.randrange(1 << 16)
+        self.pool = ThreadPoolExecutor(max_workers=workers or min(8, self.shards), thread_name_prefix="shard-scan")
+
+    def _layout(self) -> Dict[str, int]:
+        """Current ``store.json``, re-read only when the file changed (another process rebalanced)."""
+        stat = os.stat(os.path.join(self.directory, SHARD_META))
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        with self._meta_lock:
+            if stamp != self._meta_stamp:
+                self._meta = _read_meta(self.directory)
+                self._meta_stamp = stamp
+            return self._meta
+
+    @property
+    def shards(self) -> int:
+        return self._layout()["shards"]
+
+    def _shard_path(self, layout: Dict[str, int], shard: int, suffix: str = ".jsonl") -> str:
+        return os.path.join(self.directory, f"gen-{layout['generation']:06d}", f"shard-{shard:04d}{suffix}")
+
+    def _acquire_shard(self, layout: Dict[str, int]):
+        """Lock the first free shard in round-robin order (blocking on one only if all are busy)."""
+        n = layout["shards"]
+        self._cursor += 1
+        order = [(self._cursor + i) % n for i in range(n)]
+        for shard in order:
+            lock_file = open(self._shard_path(layout, shard, ".lock"), "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return shard, lock_file
+            except BlockingIOError:
+                lock_file.close()
+        lock_file = open(self._shard_path(layout, order[0], ".lock"), "a")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return order[0], lock_file
+
+    def _next_seq(self, layout: Dict[str, int], shard: int) -> int:
+        seq_path = self._shard_path(layout, shard, ".seq")
+        try:
+            with open(seq_path) as f:
+                last = int(f.read())
+        except (OSError, ValueError):
+            # Secuencia perdida o truncada: se reconstruye desde el propio shard
+            last = max((v["id"] // layout["shards"] for v in _iter_lines(self._shard_path(layout, shard))), default=0)
+        # La secuencia se guarda antes del append: un corte deja un hueco, nunca un id repetido
+        _write_atomic(seq_path, str(last + 1))
+        return last + 1
+
+    def publish(self, data: Dict[str, Any]) -> int:
+        """Append a listing to a free shard, assigning and returning its id."""
+        with _flock(self.layout_lock_path, fcntl.LOCK_SH):
+            layout = self._layout()
+            shard, lock_file = self._acquire_shard(layout)
+            try:
+                nuevo_id = self._next_seq(layout, shard) * layout["shards"] + shard
+                data["id"] = nuevo_id
+                with open(self._shard_path(layout, shard), "a", encoding="utf-8") as f:
+                    f.write(json.dumps(data, ensure_ascii=False) + "\n")
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+        return nuevo_id
+
+    def _scan(self, layout: Dict[str, int]) -> Iterator[Dict[str, Any]]:
+        for shard in range(layout["shards"]):
+            yield from _iter_lines(self._shard_path(layout, shard))
+
+    def iter_listings(self) -> Iterator[Dict[str, Any]]:
+        """Stream every listing, shard by shard (a stable order for resumable jobs)."""
+        # Sin el lock, un rebalanceo borraría la generación a mitad del recorrido y lo truncaría
+        with _flock(self.layout_lock_path, fcntl.LOCK_SH):
+            yield from self._scan(self._layout())
+
+    def load(self) -> List[Dict[str, Any]]:
+        return list(self.iter_listings())
+
+    def get(self, vehicle_id: int) -> Optional[Dict[str, Any]]:
+        with _flock(self.layout_lock_path, fcntl.LOCK_SH):
+            layout = self._layout()
+            shard_path = self._shard_path(layout, vehicle_id % layout["shards"])
+            return next((v for v in _iter_lines(shard_path) if v.get("id") == vehicle_id), None)
+
+    def query(self, predicate: Optional[Predicate] = None, after_id: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+        """Scatter the page query to every shard in parallel and merge the partial pages."""
+        with _flock(self.layout_lock_path, fcntl.LOCK_SH):
+            layout = self._layout()
+            partials = self.pool.map(
+                lambda shard: _page(_iter_lines(self._shard_path(layout, shard)), after_id, limit, predicate),
+                range(layout["shards"]),
+            )
+            return heapq.nsmallest(limit, (v for page in partials for v in page), key=lambda v: v["id"])
+
+    def update_many(self, updates: Dict[int, Dict[str, Any]]) -> int:
+        """Merge ``updates[id]`` into matching listings, rewriting only the shards involved."""
+        touched = 0
+        with _flock(self.layout_lock_path, fcntl.LOCK_SH):
+            layout = self._layout()
+            by_shard: Dict[int, Dict[int, Dict[str, Any]]] = {}
+            for vehicle_id, cambios in updates.items():
+                by_shard.setdefault(vehicle_id % layout["shards"], {})[vehicle_id] = cambios
+            for shard, shard_updates in sorted(by_shard.items()):
+                with _flock(self._shard_path(layout, shard, ".lock"), fcntl.LOCK_EX):
+                    touched += self._rewrite_shard(layout, shard, shard_updates)
+        return touched
+
+    def _rewrite_shard(self, layout: Dict[str, int], shard: int, updates: Dict[int, Dict[str, Any]]) -> int:
+        path = self._shard_path(layout, shard)
+        touched = 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".shard-", suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as out:
+            for vehiculo in _iter_lines(path):
+                cambios = updates.get(vehiculo.get("id"))
+                if cambios:
+                    vehiculo.update(cambios)
+                    touched += 1
+                out.write(json.dumps(vehiculo, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, path)
+        return touched
+
+    def describe(self) -> Dict[str, Any]:
+        layout = self._layout()
+        return {"type": "sharded", "path": self.directory, "shards": layout["shards"], "generation": layout["generation"]}
+
+
+def rebalance(
+    directory: str, shards: int, import_from: Optional[str] = None, if_missing: bool = False
+) -> Optional[Dict[str, Any]]:
+    """Rewrite the store in ``directory`` into ``shards`` shards; returns move statistics.
+
+    Every listing keeps its id and moves to shard ``id % shards``; each
+    shard's sequence restarts above the largest id it holds, so new ids stay
+    unique. The new layout is written as a fresh generation and switched in
+    by replacing ``store.json``, so an interrupted run leaves the old layout
+    intact. Listings from ``import_from`` (a JSON array file, e.g. the old
+    ``DB_PATH``) are added when the directory holds no store yet; with
+    ``if_missing`` an existing store is left alone and None is returned.
+    """
+    if shards < 1:
+        raise ValueError("El número de shards debe ser al menos 1")
+    os.makedirs(directory, exist_ok=True)
+    with _flock(os.path.join(directory, "store.lock"), fcntl.LOCK_EX):
+        old = _read_meta(directory)
+        if old is not None and if_missing:
+            return None
+        if old is None:
+            source: Iterable[Dict[str, Any]] = (
+                iter_json_array(import_from) if import_from and os.path.exists(import_from) else []
+            )
+            generation = 1
+        else:
+            old_store = ShardedVehicleStore(directory, workers=1)
+            # Ya bajo el lock exclusivo: se recorre sin pedir el compartido
+            source = old_store._scan(old)
+            generation = old["generation"] + 1
+
+        gen_dir = os.path.join(directory, f"gen-{generation:06d}")
+        shutil.rmtree(gen_dir, ignore_errors=True)  # Restos de un rebalanceo interrumpido
+        os.makedirs(gen_dir)
+        outputs = [open(os.path.join(gen_dir, f"shard-{i:04d}.jsonl"), "w", encoding="utf-8") for i in range(shards)]
+        last_seq = [0] * shards
+        moved = listings = 0
+        try:
+            for vehiculo in source:
+                vehicle_id = vehiculo["id"]
+                shard = vehicle_id % shards
+                outputs[shard].write(json.dumps(vehiculo, ensure_ascii=False) + "\n")
+                last_seq[shard] = max(last_seq[shard], vehicle_id // shards)
+                listings += 1
+                if old is None or vehicle_id % old["shards"] != shard:
+                    moved += 1
+        finally:
+            for f in outputs:
+                f.close()
+        for shard, seq in enumerate(last_seq):
+            _write_atomic(os.path.join(gen_dir, f"shard-{shard:04d}.seq"), str(seq))
+
+        _write_atomic(os.path.join(directory, SHARD_META), json.dumps({"shards": shards, "generation": generation}))
+        if old is not None:
+            shutil.rmtree(os.path.join(directory, f"gen-{old['generation']:06d}"), ignore_errors=True)
+    return {
+        "shards_before": old["shards"] if old else 0,
+        "shards_after": shards,
+        "generation": generation,
+        "listings": listings,
+        "moved": moved,
+    }
+
+
+def default_shard_dir(path: str) -> str:
+    return f"{os.path.splitext(path)[0]}.shards"
+
+
+def open_store(path: str, shards: int = 1, directory: Optional[str] = None) -> Union[JsonVehicleStore, ShardedVehicleStore]:
+    """Store selected by configuration: the JSON file, or N shards (created from it on first use)."""
+    if shards <= 1:
+        return JsonVehicleStore(path)
+    directory = directory or default_shard_dir(path)
+    if _read_meta(directory) is None:
+        stats = rebalance(directory, shards, import_from=path, if_missing=True)
+        if stats is not None:
+            print(f"🗂️  Sharded store created in {directory}: {stats['listings']} listings imported into {shards} shards")
+    store = ShardedVehicleStore(directory)
+    if store.shards != shards:
+        print(
+            f"Warning: {directory} has {store.shards} shards (VEHICLE_SHARDS={shards}); run rebalance_shards.py to change it"
+        )
+    return store
@@ -0,0 +1,323 @@
+"""Columnar in-memory table of vehicle listings.
+
+A list of dicts repeats every key string per listing and boxes every
+number (~1 KB per listing). ``VehicleTable`` instead keeps one NumPy array
+per numeric field and dictionary-encodes the categorical ones (an
+``int16`` code per row plus one shared list of distinct values), so a
+listing costs well under 100 bytes and filters run as vectorized array
+comparisons. Values that do not fit their column's type, and fields
+outside the schema, go to a sparse per-row overflow map so every listing
+reads back with equal values (numbers in float columns come back as floats).
+
+Rows are exposed through ``VehicleRow``, a ``__slots__`` mapping view that
+reads the columns on access. The table loads from a vehicle store and is
+kept current from the change feed: publishes are appended and updates
+overwrite the fields they carry in the row with that id.
+"""
+
+import threading
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Campos numéricos y su dtype; los enteros usan un centinela como "ausente", los reales NaN
+NUMERIC_COLUMNS = {
+    "id": np.int64,
+    "model_year": np.int16,
+    "age": np.int16,
+    "kilometers_driven": np.int32,
+    "mileage": np.float64,
+    "engine": np.int16,
+    "power": np.float32,
+    "seats": np.int8,
+    "clean_title": np.int8,
+    "precio": np.float64,
+    "precio_recomendado_modelo": np.float64,
+}
+CATEGORICAL_COLUMNS = ("brand_model", "fuel_type", "transmission", "owner_type", "modelo_version")
+CODE_DTYPE = np.int16
+MISSING_CODE = -1
+INITIAL_CAPACITY = 1024
+
+
+def _missing(dtype) -> Any:
+    return np.nan if np.issubdtype(dtype, np.floating) else np.iinfo(dtype).min
+
+
+def _fits(value: Any, dtype) -> bool:
+    """Whether ``value`` can be stored in a ``dtype`` column and read back as an equal value."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+    if np.issubdtype(dtype, np.floating):
+        # float32 sólo guarda valores que vuelven idénticos (p.ej. 90 o 88.5, no 88.3)
+        return float(dtype(value)) == value
+    info = np.iinfo(dtype)
+    return isinstance(value, int) and info.min < value <= info.max
+
+
+class VehicleRow(Mapping):
+    """Read-only mapping view of one table row; holds no per-row dict."""
+
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table: "VehicleTable", index: int):
+        self._table = table
+        self._index = index
+
+    def __getitem__(self, key: str) -> Any:
+        value = self._table.value(self._index, key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._table.row_keys(self._index))
+
+    def __len__(self) -> int:
+        return len(self._table.row_keys(self._index))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: self._table.value(self._index, key) for key in self._table.row_keys(self._index)}
+
+    def __repr__(self) -> str:
+        return f"VehicleRow({self.to_dict()!r})"
+
+
+class VehicleTable:
+    """Listings stored column by column, with dictionary-encoded categoricals.
+
+    Args:
+        capacity: Rows allocated up front; arrays double when full.
+    """
+
+    def __init__(self, capacity: int = INITIAL_CAPACITY):
+        self.size = 0
+        self.capacity = max(1, capacity)
+        self.numeric = {name: np.full(self.capacity, _missing(dtype), dtype=dtype) for name, dtype in NUMERIC_COLUMNS.items()}
+        self.codes = {name: np.full(self.capacity, MISSING_CODE, dtype=CODE_DTYPE) for name in CATEGORICAL_COLUMNS}
+        self.categories: Dict[str, List[str]] = {name: [] for name in CATEGORICAL_COLUMNS}
+        self._category_codes: Dict[str, Dict[str, int]] = {name: {} for name in CATEGORICAL_COLUMNS}
+        # Valores fuera de esquema o de tipo inesperado: fila -> {campo: valor}
+        self.overflow: Dict[int, Dict[str, Any]] = {}
+        self.offset = 0  # Último offset del change feed aplicado
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    @classmethod
+    def from_listings(cls, listings: Iterable[Dict[str, Any]]) -> "VehicleTable":
+        table = cls()
+        table.extend(listings)
+        return table
+
+    @classmethod
+    def from_store(cls, store, feed=None) -> "VehicleTable":
+        """Load every listing from ``store``; with a change feed, remember where to resume from."""
+        offset = feed.last_offset() if feed is not None else 0
+        table = cls.from_listings(store.iter_listings())
+        table.offset = offset
+        return table
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _grow(self, needed: int) -> None:
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        if capacity == self.capacity:
+            return
+        for name, column in self.numeric.items():
+            grown = np.full(capacity, _missing(column.dtype), dtype=column.dtype)
+            grown[: self.size] = column[: self.size]
+            self.numeric[name] = grown
+        for name, column in self.codes.items():
+            grown = np.full(capacity, MISSING_CODE, dtype=CODE_DTYPE)
+            grown[: self.size] = column[: self.size]
+            self.codes[name] = grown
+        self.capacity = capacity
+
+    def _encode(self, name: str, value: str) -> Optional[int]:
+        """Code of ``value`` in its dictionary, adding it if new (None once the code space is full)."""
+        code = self._category_codes[name].get(value)
+        if code is None:
+            if len(self.categories[name]) > np.iinfo(CODE_DTYPE).max:
+                return None
+            code = self._category_codes[name][value] = len(self.categories[name])
+            self.categories[name].append(value)
+        return code
+
+    def _store_row(self, index: int, listing: Dict[str, Any]) -> None:
+        extra = {}
+        for key, value in listing.items():
+            if value is None:
+                continue
+            dtype = NUMERIC_COLUMNS.get(key)
+            if dtype is not None and _fits(value, dtype):
+                self.numeric[key][index] = value
+            elif key in self._category_codes and isinstance(value, str) and self._encode(key, value) is not None:
+                self.codes[key][index] = self._category_codes[key][value]
+            else:
+                extra[key] = value
+        if extra:
+            self.overflow.setdefault(index, {}).update(extra)
+
+    def _clear_fields(self, index: int, keys: Iterable[str]) -> None:
+        extra = self.overflow.get(index, {})
+        for key in keys:
+            extra.pop(key, None)
+            if key in self.numeric:
+                self.numeric[key][index] = _missing(self.numeric[key].dtype)
+            elif key in self.codes:
+                self.codes[key][index] = MISSING_CODE
+        if not extra:
+            self.overflow.pop(index, None)
+
+    def append(self, listing: Dict[str, Any]) -> int:
+        """Add one listing; returns its row index."""
+        with self._lock:
+            self._grow(self.size + 1)
+            index = self.size
+            self._store_row(index, listing)
+            self.size += 1
+        return index
+
+    def extend(self, listings: Iterable[Dict[str, Any]]) -> int:
+        added = 0
+        for listing in listings:
+            self.append(listing)
+            added += 1
+        return added
+
+    def update(self, index: int, changes: Dict[str, Any]) -> None:
+        """Overwrite the fields in ``changes`` of row ``index``; the others keep their values."""
+        with self._lock:
+            self._clear_fields(index, changes)
+            self._store_row(index, changes)
+
+    def _id_index(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(sorted ids, their rows) over the current rows, to find many ids by binary search."""
+        ids = self.column("id")
+        order = np.argsort(ids, kind="stable")
+        return ids[order], order
+
+    def _find(self, vehicle_id: Any, id_index: Tuple[np.ndarray, np.ndarray]) -> Optional[int]:
+        """Row holding ``vehicle_id``; rows appended after ``id_index`` was built are scanned directly."""
+        if not isinstance(vehicle_id, int):
+            return None
+        sorted_ids, order = id_index
+        pos = int(np.searchsorted(sorted_ids, vehicle_id))
+        if pos < len(sorted_ids) and sorted_ids[pos] == vehicle_id:
+            return int(order[pos])
+        indexed = len(order)
+        newer = np.flatnonzero(self.column("id")[indexed:] == vehicle_id)
+        return indexed + int(newer[0]) if len(newer) else None
+
+    def catch_up(self, feed, batch: int = 1000) -> int:
+        """Apply change-feed entries newer than ``offset``; returns rows added.
+
+        Publishes are appended, skipping listings already present (published
+        between reading the feed offset and loading the store). Updates
+        overwrite their fields in the row with that id.
+        """
+        added = 0
+        id_index = None
+        with self._sync_lock:
+            while True:
+                entries = feed.read(self.offset, batch)
+                if not entries:
+                    return added
+                ids = np.array([e["id"] for e in entries if isinstance(e["id"], int)], dtype=np.int64)
+                known = set(ids[np.isin(ids, self.column("id"))].tolist())
+                for entry in entries:
+                    if entry["op"] == "publish" and entry["id"] not in known:
+                        self.append(dict(entry["vehiculo"], id=entry["id"]))
+                        added += 1
+                    elif entry["op"] == "update":
+                        # Un índice por llamada: un backfill trae una actualización por anuncio
+                        id_index = id_index if id_index is not None else self._id_index()
+                        index = self._find(entry["id"], id_index)
+                        if index is not None:
+                            self.update(index, entry["vehiculo"])
+                self.offset = entries[-1]["offset"]
+
+    def column(self, name: str) -> np.ndarray:
+        """Read-only view of a numeric column (missing values: NaN or the dtype minimum)."""
+        view = self.numeric[name][: self.size]
+        view.flags.writeable = False
+        return view
+
+    def categorical(self, name: str) -> Tuple[np.ndarray, List[str]]:
+        """(codes, categories) of a dictionary-encoded column; code -1 means missing."""
+        return self.codes[name][: self.size], list(self.categories[name])
+
+    def mask(self, **equals: Any) -> np.ndarray:
+        """Boolean row mask where every given field equals the given value."""
+        mask = np.ones(self.size, dtype=bool)
+        for name, value in equals.items():
+            if name in self.codes:
+                code = self._category_codes[name].get(value)
+                mask &= self.codes[name][: self.size] == code if code is not None else False
+            elif name in self.numeric:
+                mask &= self.numeric[name][: self.size] == value
+            else:
+                raise KeyError(name)
+        return mask
+
+    def query(self, after_id: int = 0, limit: int = 50, **equals: Any) -> List[Dict[str, Any]]:
+        """One page of matching listings ordered by id, starting after ``after_id`` (all vectorized)."""
+        # Bajo el lock: un append concurrente no cambia el tamaño entre columnas
+        with self._lock:
+            ids = self.column("id")
+            rows = np.flatnonzero(self.mask(**equals) & (ids > after_id))
+        if len(rows) > limit:
+            rows = rows[np.argpartition(ids[rows], limit - 1)[:limit]]
+        rows = rows[np.argsort(ids[rows], kind="stable")]
+        return [VehicleRow(self, int(i)).to_dict() for i in rows]
+
+    def value(self, index: int, key: str) -> Any:
+        extra = self.overflow.get(index)
+        if extra is not None and key in extra:
+            return extra[key]
+        column = self.numeric.get(key)
+        if column is not None:
+            value = column[index]
+            if np.issubdtype(column.dtype, np.floating):
+                return None if np.isnan(value) else float(value)
+            return None if value == np.iinfo(column.dtype).min else int(value)
+        codes = self.codes.get(key)
+        if codes is not None:
+            code = codes[index]
+            return None if code == MISSING_CODE else self.categories[key][code]
+        return None
+
+    def row_keys(self, index: int) -> List[str]:
+        keys = [key for key in NUMERIC_COLUMNS if self.value(index, key) is not None]
+        keys += [key for key in CATEGORICAL_COLUMNS if self.codes[key][index] != MISSING_CODE]
+        extra = self.overflow.get(index)
+        if extra:
+            keys += [key for key in extra if key not in keys]
+        return keys
+
+    def __getitem__(self, index: int) -> VehicleRow:
+        if not -self.size <= index < self.size:
+            raise IndexError(index)
+        return VehicleRow(self, index % self.size)
+
+    def __iter__(self) -> Iterator[VehicleRow]:
+        return (VehicleRow(self, i) for i in range(self.size))
+
+    def nbytes(self) -> int:
+        """Bytes held by the used part of the columns (dictionaries and overflow excluded)."""
+        per_row = sum(c.dtype.itemsize for c in self.numeric.values()) + np.dtype(CODE_DTYPE).itemsize * len(self.codes)
+        return per_row * self.size
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rows": self.size,
+            "capacity": self.capacity,
+            "column_bytes": self.nbytes(),
+            "overflow_rows": len(self.overflow),
+            "categories": {name: len(values) for name, values in self.categories.items()},
+            "offset": self.offset,
+        }
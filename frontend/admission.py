@@ -0,0 +1,198 @@
+"""Admission control for the prediction and publish routes.
+
+Two independent gates run before a guarded request is handled, and both
+reject immediately instead of queueing:
+
+* A token bucket per client (``rate`` requests/s, ``burst`` deep) answers
+  429 with the exact wait in ``Retry-After``.
+* A concurrency limit that adapts to measured latency (gradient algorithm:
+  the limit shrinks when recent latency rises above the long-term baseline
+  and grows again while it stays close) answers 503 when all slots are busy.
+
+Requests belong to a priority class. ``critical`` traffic (health checks,
+metrics) never reaches the controller; ``interactive`` traffic uses the
+whole limit; ``batch`` traffic may only occupy ``batch_share`` of the
+concurrency limit, so it yields to users. Batch routes skip the per-client
+buckets, but an interactive request that lowers itself to batch (the
+``X-Traffic-Class`` header) is still charged to its client's bucket, so the
+header cannot be used to dodge the rate limit.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+CRITICAL = "critical"
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+
+class Rejected(Exception):
+    """The request was not admitted; carries the HTTP status and Retry-After seconds."""
+
+    def __init__(self, status: int, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity: float, now: float):
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, rate: float, capacity: float, now: float) -> float:
+        """Consume one token; returns 0.0 on success or the seconds until one is available."""
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / rate
+
+
+class GradientLimit:
+    """Concurrency limit driven by the ratio of long-term to recent latency.
+
+    Args:
+        initial: Starting limit.
+        min_limit: Floor of the limit.
+        max_limit: Ceiling of the limit.
+        tolerance: Recent latency may exceed the baseline by this factor before the limit shrinks.
+        smoothing: Weight of each new estimate in the limit.
+    """
+
+    def __init__(
+        self,
+        initial: int = 16,
+        min_limit: int = 2,
+        max_limit: int = 128,
+        tolerance: float = 1.5,
+        smoothing: float = 0.2,
+    ):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.short_rtt: Optional[float] = None
+        self.long_rtt: Optional[float] = None
+
+    def update(self, rtt: float, inflight: int) -> None:
+        if self.short_rtt is None:
+            self.short_rtt = self.long_rtt = rtt
+        self.short_rtt += (rtt - self.short_rtt) * 0.1
+        self.long_rtt += (rtt - self.long_rtt) / 600
+        if self.long_rtt > 2 * self.short_rtt:
+            # La línea base quedó alta tras una racha lenta: se acerca más rápido
+            self.long_rtt *= 0.95
+        # Sólo se crece si el límite está realmente en uso
+        if inflight < self.limit / 2:
+            return
+        gradient = max(0.5, min(1.0, self.tolerance * self.long_rtt / self.short_rtt))
+        estimate = self.limit * gradient + math.sqrt(self.limit)
+        self.limit = self.limit * (1 - self.smoothing) + estimate * self.smoothing
+        self.limit = max(self.min_limit, min(self.max_limit, self.limit))
+
+
+class AdmissionController:
+    """Per-client rate limits plus an adaptive, priority-aware concurrency limit.
+
+    Args:
+        rate: Sustained requests per second allowed per client (0 disables).
+        burst: Bucket depth per client.
+        initial_limit / min_limit / max_limit: Bounds of the adaptive concurrency limit.
+        batch_share: Fraction of the concurrency limit batch traffic may use.
+        max_clients: Buckets kept (least recently seen clients are forgotten).
+    """
+
+    def __init__(
+        self,
+        rate: float = 20.0,
+        burst: float = 40.0,
+        initial_limit: int = 16,
+        min_limit: int = 2,
+        max_limit: int = 128,
+        batch_share: float = 0.25,
+        max_clients: int = 10000,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.batch_share = batch_share
+        self.max_clients = max_clients
+        self.limiter = GradientLimit(initial_limit, min_limit, max_limit)
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._inflight = {INTERACTIVE: 0, BATCH: 0}
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.rejected = {"rate_limited": 0, "over_capacity": 0}
+
+    def _check_rate(self, client: str, now: float) -> None:
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = TokenBucket(self.burst, now)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        wait = bucket.take(self.rate, self.burst, now)
+        if wait > 0:
+            self.rejected["rate_limited"] += 1
+            raise Rejected(429, max(1, math.ceil(wait)), "Rate limit exceeded")
+
+    def _check_capacity(self, priority: str) -> None:
+        limit = int(self.limiter.limit)
+        full = self._inflight[INTERACTIVE] + self._inflight[BATCH] >= limit
+        if priority == BATCH:
+            full = full or self._inflight[BATCH] >= max(1, int(limit * self.batch_share))
+        if full:
+            self.rejected["over_capacity"] += 1
+            raise Rejected(503, 1, "Server at capacity")
+
+    def admit(
+        self, client: str, priority: str = INTERACTIVE, now: Optional[float] = None, rate_limited: Optional[bool] = None
+    ) -> str:
+        """Reserve a slot or raise Rejected; returns the ticket to pass to ``release``.
+
+        Args:
+            client: Identity whose token bucket is charged.
+            priority: Class the request is admitted under.
+            now: Monotonic time (defaults to the current one).
+            rate_limited: Charge the client's bucket; by default only interactive traffic is.
+                Pass True for requests downgraded to batch by the caller.
+        """
+        now = time.monotonic() if now is None else now
+        if rate_limited is None:
+            rate_limited = priority == INTERACTIVE
+        with self._lock:
+            if rate_limited and self.rate > 0:
+                self._check_rate(client, now)
+            self._check_capacity(priority)
+            self._inflight[priority] += 1
+            self.admitted += 1
+        return priority
+
+    def release(self, ticket: str, latency_seconds: float, ok: bool = True) -> None:
+        """Free the slot; successful interactive latencies feed the adaptive limit."""
+        with self._lock:
+            inflight = self._inflight[INTERACTIVE] + self._inflight[BATCH]
+            self._inflight[ticket] -= 1
+            # Las subidas batch son lentas por naturaleza y no deben encoger el límite
+            if ok and ticket == INTERACTIVE:
+                self.limiter.update(latency_seconds, inflight)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "concurrency_limit": round(self.limiter.limit, 2),
+                "inflight": dict(self._inflight),
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "clients_tracked": len(self._buckets),
+                "rate_per_client": self.rate,
+            }
@@ -17,16 +17,38 @@ import random
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 import requests
-from flask import Flask, render_template, request, jsonify
+from flask import (
+    Flask,
+    Response,
+    abort,
+    g,
+    has_request_context,
+    render_template,
+    request,
+    jsonify,
+    send_file,
+    stream_with_context,
+    url_for,
+)
 from requests.exceptions import RequestException, Timeout
 from dotenv import load_dotenv
 
+from metrics_aggregator import DEFAULT_ALLOWLIST, MetricsAggregator
+from live_metrics import DASHBOARD_STREAM_SCRIPT, MetricsBroadcaster, TooManySubscribers
+from timeseries import DASHBOARD_CHARTS_HTML, TimeSeriesStore, dashboard_series, parse_resolution
+from sketches import RollingQuantiles
+from compression import CompressionMiddleware
+from traffic_recorder import RECORDED_HEADERS, TrafficRecorder
+from admission import BATCH, INTERACTIVE, AdmissionController, Rejected
+from static_assets import IMMUTABLE_CACHE_CONTROL, AssetManifest, mimetype_for
+
 # Load environment variables from .env file
 load_dotenv()
 
 # Configuration constants
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:5002")
 API_TIMEOUT = 10
+DEADLINE_HEADER = "X-Request-Deadline"
 DEFAULT_MONTHS = 12
 
 # Form validation constants
@@ -38,6 +60,40 @@ MIN_PRICE = 1000
 
 app = Flask(__name__)
 
+# Streaming gzip compression of large responses, negotiated by Accept-Encoding
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+compression = CompressionMiddleware(
+    app.wsgi_app,
+    level=int(os.getenv("COMPRESSION_LEVEL", "6")),
+    min_size=int(os.getenv("COMPRESSION_MIN_SIZE", "1024")),
+)
+if COMPRESSION_ENABLED:
+    app.wsgi_app = compression
+
+# Assets fingerprinted and precompressed by build_static.py (optional in development)
+asset_manifest = AssetManifest()
+
+
+@app.template_global()
+def asset_url(path: str) -> str:
+    """URL of a static asset: fingerprinted when built, plain /static otherwise."""
+    return asset_manifest.url(path) or url_for("static", filename=path)
+
+
+@app.route("/assets/<path:filename>")
+def serve_asset(filename: str) -> Response:
+    resolved = asset_manifest.resolve(filename, request.headers.get("Accept-Encoding"))
+    if resolved is None:
+        abort(404)
+    path, encoding = resolved
+    response = send_file(path, mimetype=mimetype_for(filename), conditional=True)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
 # Monitoring variables
 start_time = time.time()
 request_count = 0
@@ -53,32 +109,146 @@ SPLUNK_REALM = "us1"
 SPLUNK_URL = f"https://ingest.{SPLUNK_REALM}.signalfx.com/v2/datapoint"
 
 
+def post_to_splunk(payload: Dict[str, Any]) -> None:
+    """Send one batched payload of aggregated metrics to Splunk Observability Cloud"""
+    try:
+        headers = {"X-SF-Token": SPLUNK_TOKEN, "Content-Type": "application/json"}
+        response = requests.post(SPLUNK_URL, json=payload, headers=headers, timeout=5)
+        if response.status_code != 200:
+            print(f"❌ Splunk error: {response.status_code} - {response.text}")
+    except Exception as e:
+        print(f"❌ Splunk error: {e}")
+
+
+# Pre-aggregation: per-request events are folded and exported once per interval.
+metrics = MetricsAggregator(
+    post_to_splunk,
+    default_dimensions={"service": "car-price-frontend", "environment": "development", "host": "localhost"},
+    flush_interval=float(os.getenv("METRICS_FLUSH_INTERVAL", "10")),
+    label_allowlist=[d for d in os.getenv("METRICS_LABEL_ALLOWLIST", ",".join(DEFAULT_ALLOWLIST)).split(",") if d],
+    top_k=int(os.getenv("METRICS_TOP_K", "20")),
+)
+metrics.start()
+
+# Local history for the dashboard (1s x 15 min, 1m x 24 h), independent of Splunk
+timeseries = TimeSeriesStore()
+timeseries.start()
+
+# Latency percentiles per endpoint over 1/5/15 min, merged across worker processes
+latency_sketches = RollingQuantiles(shared_dir=os.getenv("METRICS_SHARED_DIR"), prefix="frontend")
+latency_sketches.start()
+
+# Opt-in capture of real traffic for scripts/replay-traffic.py
+TRAFFIC_RECORD_DIR = os.getenv("TRAFFIC_RECORD_DIR")
+traffic_recorder: Optional[TrafficRecorder] = None
+if TRAFFIC_RECORD_DIR:
+    traffic_recorder = TrafficRecorder(
+        TRAFFIC_RECORD_DIR,
+        sample_rate=float(os.getenv("TRAFFIC_SAMPLE_RATE", "0.01")),
+        prefix="frontend",
+        max_file_bytes=int(os.getenv("TRAFFIC_MAX_FILE_MB", "64")) * 1024 * 1024,
+        max_files=int(os.getenv("TRAFFIC_MAX_FILES", "10")),
+    )
+
+
 @app.before_request
 def count_requests():
     global request_count
     request_count += 1
+    g.request_started = time.perf_counter()
+    if traffic_recorder is not None and traffic_recorder.should_capture(request.path):
+        # Cache the body now; form parsing reuses the cached bytes
+        small = (request.content_length or 0) <= traffic_recorder.max_body_bytes
+        g.captured_body = request.get_data(cache=True) if small else None
+        g.capture_traffic = True
+
+
+def capture_traffic(response: Response, latency_ms: float) -> None:
+    """Hand a sampled request over to the recorder thread."""
+    headers = {name: request.headers[name] for name in RECORDED_HEADERS if name in request.headers}
+    passthrough = response.is_streamed or response.direct_passthrough
+    traffic_recorder.capture(
+        request.method,
+        request.path,
+        request.query_string.decode("latin-1"),
+        headers,
+        g.get("captured_body"),
+        response.status_code,
+        latency_ms,
+        None if passthrough else response.get_data(),
+    )
 
 
-def send_to_splunk_observability(metric_name, value, dimensions=None):
-    """Send metrics to Splunk Observability Cloud"""
-    try:
-        headers = {"X-SF-Token": SPLUNK_TOKEN, "Content-Type": "application/json"}
+# Admission control: per-client token buckets plus an adaptive concurrency limit
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_TRUST_FORWARDED = os.getenv("ADMISSION_TRUST_FORWARDED", "false").lower() == "true"
+admission = AdmissionController(
+    rate=float(os.getenv("ADMISSION_RATE_PER_CLIENT", "20")),
+    burst=float(os.getenv("ADMISSION_BURST", "40")),
+    initial_limit=int(os.getenv("ADMISSION_INITIAL_CONCURRENCY", "16")),
+    min_limit=int(os.getenv("ADMISSION_MIN_CONCURRENCY", "2")),
+    max_limit=int(os.getenv("ADMISSION_MAX_CONCURRENCY", "128")),
+    batch_share=float(os.getenv("ADMISSION_BATCH_SHARE", "0.25")),
+)
+# Guarded routes and their class; everything else (health, metrics, pages) bypasses admission
+ADMISSION_ROUTES = {"predict": INTERACTIVE, "predict_future": INTERACTIVE, "publish_vehicle": INTERACTIVE}
 
-        if dimensions is None:
-            dimensions = {}
 
-        # Add default dimensions
-        dimensions.update({"service": "car-price-frontend", "environment": "development", "host": "localhost"})
+def client_id() -> str:
+    """Client identity for rate limiting (X-Forwarded-For only behind a trusted proxy)."""
+    forwarded = request.headers.get("X-Forwarded-For") if ADMISSION_TRUST_FORWARDED else None
+    hops = [hop.strip() for hop in (forwarded or "").split(",") if hop.strip()]
+    # The rightmost hop is the one our proxy appended; anything left of it is client-supplied
+    return hops[-1] if hops else request.remote_addr or "unknown"
 
-        payload = {
-            "gauge": [{"metric": metric_name, "value": value, "dimensions": dimensions, "timestamp": int(time.time() * 1000)}]
-        }
 
-        response = requests.post(SPLUNK_URL, json=payload, headers=headers, timeout=5)
-        if response.status_code != 200:
-            print(f"❌ Splunk error: {response.status_code} - {response.text}")
-    except Exception as e:
-        print(f"❌ Splunk error: {e}")
+@app.before_request
+def admit_request() -> Optional[Tuple[str, int, Dict[str, str]]]:
+    """Admit or reject right away (429/503 with Retry-After) instead of queueing."""
+    route_priority = priority = ADMISSION_ROUTES.get(request.endpoint)
+    if not ADMISSION_ENABLED or priority is None:
+        return None
+    if request.headers.get("X-Traffic-Class", "").lower() == BATCH:
+        priority = BATCH  # The header can only lower priority, never raise it
+    try:
+        # The bucket is charged by route, so downgrading with the header does not skip it
+        g.admission_ticket = admission.admit(client_id(), priority, rate_limited=route_priority == INTERACTIVE)
+    except Rejected as e:
+        metrics.counter("car_price.frontend.rejected", 1, {"endpoint": request.endpoint, "status": e.status})
+        error = f"{e.reason} - please retry in {e.retry_after}s"
+        return render_template("index.html", error=error), e.status, {"Retry-After": str(e.retry_after)}
+    return None
+
+
+@app.teardown_request
+def release_admission(exc: Optional[BaseException]) -> None:
+    ticket = g.pop("admission_ticket", None)
+    if ticket is not None:
+        ok = exc is None and g.get("response_status", 500) < 500
+        admission.release(ticket, time.perf_counter() - g.request_started, ok=ok)
+
+
+@app.after_request
+def record_latency(response):
+    started = g.get("request_started")
+    if started is not None:
+        latency_ms = (time.perf_counter() - started) * 1000
+        endpoint = request.endpoint or "unknown"
+        g.response_status = response.status_code
+        metrics.histogram("car_price.frontend.latency_ms", latency_ms, {"endpoint": endpoint, "status": response.status_code})
+        timeseries.record("http", latency_ms)
+        timeseries.record(f"http.{endpoint}", latency_ms)
+        latency_sketches.record(endpoint, latency_ms)
+        if response.status_code >= 500:
+            timeseries.record("http.errors")
+        if g.get("capture_traffic"):
+            capture_traffic(response, latency_ms)
+    return response
+
+
+def send_to_splunk_observability(metric_name, value, dimensions=None):
+    """Record a gauge; it is exported with the next aggregated batch"""
+    metrics.gauge(metric_name, value, dimensions)
 
 
 def send_continuous_metrics():
@@ -134,6 +304,22 @@ def extract_vehicle_data(form_data: Dict[str, Any]) -> Dict[str, Any]:
         raise ValueError(f"Invalid form data: {e}") from e
 
 
+def request_deadline() -> float:
+    """Absolute deadline (epoch seconds) for a backend call.
+
+    It is the client-side timeout, or an earlier deadline propagated to us
+    by an upstream caller in the same header.
+    """
+    deadline = time.time() + API_TIMEOUT
+    incoming = request.headers.get(DEADLINE_HEADER) if has_request_context() else None
+    if incoming:
+        try:
+            deadline = min(deadline, float(incoming) / 1000.0)
+        except ValueError:
+            pass
+    return deadline
+
+
 def call_backend_api(
     endpoint: str, data: Dict[str, Any], method: str = "GET"
 ) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
@@ -148,12 +334,21 @@ def call_backend_api(
         Tuple of (response_data, error_message)
     """
     url = f"{BACKEND_URL}/{endpoint}"
+    deadline = request_deadline()
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        return None, "Request timeout - deadline exceeded before calling backend"
+    # The backend drops the work once we stop waiting for it
+    headers = {DEADLINE_HEADER: str(int(deadline * 1000))}
+    if has_request_context() and request.remote_addr:
+        # Lets the backend rate-limit per end user when it trusts this hop
+        headers["X-Forwarded-For"] = request.remote_addr
 
     try:
         if method == "GET":
-            response = requests.get(url, params=data, timeout=API_TIMEOUT)
+            response = requests.get(url, params=data, headers=headers, timeout=remaining)
         else:
-            response = requests.post(url, json=data, timeout=API_TIMEOUT)
+            response = requests.post(url, json=data, headers=headers, timeout=remaining)
 
         if response.ok:
             return response.json(), None
@@ -180,11 +375,9 @@ def predict() -> str:
     global prediction_requests
     prediction_requests += 1
 
-    # Send metrics to Splunk Observability Cloud
-    send_to_splunk_observability(
-        "car_price.frontend.predictions", 1, {"user_ip": request.remote_addr or "unknown", "action": "current_prediction"}
-    )
-    send_to_splunk_observability("car_price.frontend.requests.total", prediction_requests)
+    # Aggregated metrics for Splunk Observability Cloud
+    metrics.counter("car_price.frontend.predictions", 1, {"action": "current_prediction"})
+    metrics.gauge("car_price.frontend.requests.total", prediction_requests)
 
     try:
         car_data = extract_vehicle_data(request.form)
@@ -202,11 +395,9 @@ def predict_future() -> str:
     global prediction_requests
     prediction_requests += 1
 
-    # Send metrics to Splunk Observability Cloud
-    send_to_splunk_observability(
-        "car_price.frontend.predictions", 1, {"user_ip": request.remote_addr or "unknown", "action": "future_prediction"}
-    )
-    send_to_splunk_observability("car_price.frontend.requests.total", prediction_requests)
+    # Aggregated metrics for Splunk Observability Cloud
+    metrics.counter("car_price.frontend.predictions", 1, {"action": "future_prediction"})
+    metrics.gauge("car_price.frontend.requests.total", prediction_requests)
 
     try:
         car_data = extract_vehicle_data(request.form)
@@ -226,11 +417,9 @@ def publish_vehicle() -> str:
     global publish_requests
     publish_requests += 1
 
-    # Send metrics to Splunk Observability Cloud
-    send_to_splunk_observability(
-        "car_price.frontend.publishes", 1, {"user_ip": request.remote_addr or "unknown", "action": "vehicle_publish"}
-    )
-    send_to_splunk_observability("car_price.frontend.publish.total", publish_requests)
+    # Aggregated metrics for Splunk Observability Cloud
+    metrics.counter("car_price.frontend.publishes", 1, {"action": "vehicle_publish"})
+    metrics.gauge("car_price.frontend.publish.total", publish_requests)
 
     try:
         vehicle_data = extract_vehicle_data(request.form)
@@ -246,18 +435,49 @@ def publish_vehicle() -> str:
         return render_template("index.html", error=str(e), active_tab="tab3")
 
 
-@app.route("/dashboard")
-def dashboard():
-    uptime = time.time() - start_time
-    cpu_usage = psutil.cpu_percent()
-    memory_usage = psutil.virtual_memory().percent
+def live_snapshot() -> Dict[str, Any]:
+    """Single shared sample pushed to every /metrics/stream subscriber"""
+    last_minute = latency_sketches.combined(1)
+    return {
+        "requests_total": request_count,
+        "prediction_requests": prediction_requests,
+        "publish_requests": publish_requests,
+        "cpu_percent": psutil.cpu_percent(),
+        "memory_percent": psutil.virtual_memory().percent,
+        "uptime_seconds": int(time.time() - start_time),
+        "latency_p95_ms": round(last_minute.quantile(0.95), 1),
+        "latency_p99_ms": round(last_minute.quantile(0.99), 1),
+        **dashboard_series(timeseries),
+    }
+
+
+live_metrics = MetricsBroadcaster(
+    live_snapshot,
+    interval=float(os.getenv("LIVE_METRICS_INTERVAL", "2")),
+    max_subscribers=int(os.getenv("LIVE_METRICS_MAX_SUBSCRIBERS", "100")),
+)
+
+
+@app.route("/metrics/stream")
+def metrics_stream():
+    """Server-Sent Events: full snapshot on connect, then deltas from the shared sampler"""
+    try:
+        events = live_metrics.stream()
+    except TooManySubscribers as e:
+        return jsonify({"error": str(e)}), 503
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    return f"""
+
+# Static shell: values arrive through /metrics/stream, so serving it costs nothing per refresh
+DASHBOARD_HTML = f"""
     <!DOCTYPE html>
     <html>
     <head>
         <title>🌐 Frontend Web - Monitoring</title>
-        <meta http-equiv="refresh" content="5">
         <style>
             body {{ font-family: Arial; margin: 40px; background: #8e44ad; color: white; }}
             .metric {{ background: #9b59b6; padding: 20px; margin: 10px 0; border-radius: 8px; }}
@@ -269,35 +489,47 @@ def dashboard():
     <body>
         <h1>🌐 Frontend Web Monitoring (Port 3000)</h1>
         <div class="metric">
-            <div class="value">{request_count}</div>
+            <div class="value" data-key="requests_total">–</div>
             <div class="label">Total Web Requests</div>
         </div>
         <div class="metric">
-            <div class="value">{prediction_requests}</div>
+            <div class="value" data-key="prediction_requests">–</div>
             <div class="label">Prediction Requests</div>
         </div>
         <div class="metric">
-            <div class="value">{publish_requests}</div>
+            <div class="value" data-key="publish_requests">–</div>
             <div class="label">Publish Requests</div>
         </div>
         <div class="metric">
-            <div class="value">{cpu_usage:.1f}%</div>
+            <div class="value" data-key="cpu_percent">–</div>
             <div class="label">CPU Usage</div>
         </div>
         <div class="metric">
-            <div class="value">{memory_usage:.1f}%</div>
+            <div class="value" data-key="memory_percent">–</div>
             <div class="label">Memory Usage</div>
         </div>
         <div class="metric">
-            <div class="value">{int(uptime//3600)}h {int((uptime%3600)//60)}m</div>
+            <div class="value" data-key="uptime_seconds">–</div>
             <div class="label">Uptime</div>
         </div>
+        <div class="metric">
+            <div class="value"><span data-key="latency_p95_ms">–</span> / <span data-key="latency_p99_ms">–</span> ms</div>
+            <div class="label">Latency p95 / p99 (last minute)</div>
+        </div>
+        {DASHBOARD_CHARTS_HTML}
+        <p><small>Live via Server-Sent Events: <span id="live-status">connecting...</span></small></p>
         <div class="splunk">
             <strong>📊 Splunk Observability:</strong> <a href="https://app.us1.signalfx.com" target="_blank" style="color: white;">View Dashboards</a>
         </div>
+        {DASHBOARD_STREAM_SCRIPT}
     </body>
     </html>
-    """
+"""
+
+
+@app.route("/dashboard")
+def dashboard():
+    return DASHBOARD_HTML, 200, {"Cache-Control": "public, max-age=300"}
 
 
 @app.route("/metrics/json")
@@ -312,13 +544,33 @@ def metrics_json():
             "requests_total": request_count,
             "prediction_requests": prediction_requests,
             "publish_requests": publish_requests,
+            "admission": admission.stats(),
+            "compression": compression.stats() if COMPRESSION_ENABLED else None,
             "system": {"cpu_percent": psutil.cpu_percent(), "memory_percent": psutil.virtual_memory().percent},
+            "latency_ms": latency_sketches.report(),
             "status": "healthy",
             "splunk_observability": True,
         }
     )
 
 
+@app.route("/metrics/timeseries")
+def metrics_timeseries():
+    """Recent history of one series from the in-process ring buffers"""
+    series = request.args.get("series")
+    if not series:
+        return jsonify({"series": timeseries.series_names()})
+    try:
+        step = parse_resolution(request.args.get("resolution", "1s"))
+        window = int(request.args.get("window", "300"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    result = timeseries.query(series, step=step, window=window)
+    if result is None:
+        return jsonify({"error": f"Unknown series or resolution: {series} @ {step}s"}), 404
+    return jsonify(result)
+
+
 @app.route("/health")
 def health_check():
     return jsonify(
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Build fingerprinted, precompressed copies of the frontend static assets.
+
+Every file under ``static/`` (except ``static/dist`` itself) is copied to
+``static/dist/<name>.<sha256[:10]><ext>`` together with a gzip variant
+(``.gz``) and, when the optional ``brotli`` package is installed, a brotli
+variant (``.br``). ``static/dist/manifest.json`` maps the logical path used
+in templates (``css/style.css``) to the fingerprinted one; ``asset_url``
+reads it, so templates never hard-code a hash.
+
+Usage:
+    python build_static.py            # run from frontend/ (the Dockerfile does it at build time)
+    python build_static.py --clean    # remove static/dist
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sys
+from typing import Dict, Optional
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+from static_assets import COMPRESSIBLE_TYPES, DIST_DIR, MANIFEST_NAME, STATIC_DIR, mimetype_for
+
+FINGERPRINT_LENGTH = 10
+# Variants that do not save at least this fraction are dropped
+MIN_SAVING = 0.05
+
+
+def fingerprint(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:FINGERPRINT_LENGTH]
+
+
+def write_variant(path: str, original_size: int, data: Optional[bytes]) -> Optional[int]:
+    """Write ``data`` to ``path`` if it is worth serving; returns its size or None."""
+    if data is None or len(data) > original_size * (1 - MIN_SAVING):
+        return None
+    with open(path, "wb") as f:
+        f.write(data)
+    return len(data)
+
+
+def build_asset(logical: str, source: str, dist_dir: str) -> Dict[str, object]:
+    with open(source, "rb") as f:
+        data = f.read()
+    stem, ext = os.path.splitext(logical)
+    hashed = f"{stem}.{fingerprint(data)}{ext}"
+    target = os.path.join(dist_dir, hashed)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, "wb") as f:
+        f.write(data)
+
+    entry: Dict[str, object] = {"path": hashed, "size": len(data), "encodings": {}}
+    if mimetype_for(logical) in COMPRESSIBLE_TYPES:
+        # mtime=0 keeps the .gz byte-identical across builds of the same content
+        gz_size = write_variant(target + ".gz", len(data), gzip.compress(data, compresslevel=9, mtime=0))
+        if gz_size is not None:
+            entry["encodings"]["gzip"] = gz_size
+        br_data = brotli.compress(data, quality=11) if brotli is not None else None
+        br_size = write_variant(target + ".br", len(data), br_data)
+        if br_size is not None:
+            entry["encodings"]["br"] = br_size
+    return entry
+
+
+def build(static_dir: str = STATIC_DIR, dist_dir: str = DIST_DIR) -> Dict[str, Dict[str, object]]:
+    """Rebuild ``dist_dir`` from ``static_dir`` and write the manifest."""
+    shutil.rmtree(dist_dir, ignore_errors=True)
+    os.makedirs(dist_dir)
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != dist_dir)
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            logical = os.path.relpath(source, static_dir).replace(os.sep, "/")
+            manifest[logical] = build_asset(logical, source, dist_dir)
+    with open(os.path.join(dist_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Fingerprint and precompress the frontend static assets")
+    parser.add_argument("--clean", action="store_true", help="Remove the built assets and exit")
+    args = parser.parse_args()
+
+    if args.clean:
+        shutil.rmtree(DIST_DIR, ignore_errors=True)
+        print(f"🗑️  Removed {DIST_DIR}")
+        return 0
+    if brotli is None:
+        print("Warning: 'brotli' is not installed; only gzip variants will be built")
+    manifest = build()
+    for logical, entry in manifest.items():
+        encodings = ", ".join(f"{name} {size}B" for name, size in entry["encodings"].items()) or "uncompressed"
+        print(f"📦 {logical} -> {entry['path']} ({entry['size']}B; {encodings})")
+    print(f"✅ {len(manifest)} assets written to {DIST_DIR}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""In-process, fixed-memory time-series store for the monitoring dashboards.
+
+Each series is kept in ring buffers at several resolutions (by default 1s
+for 15 minutes and 1m for 24 hours). Every bucket holds count, sum and max,
+so throughput, mean and peak latency can be charted locally even when
+Splunk is unreachable. Memory is fixed: a series costs
+``sum(slots) * 4 * 8`` bytes, about 75 KB with the defaults.
+
+The request path only appends to a bounded ``deque`` (atomic in CPython, no
+lock taken); a roller thread drains it into the rings once per second, and
+queries drain it first so results are always current. Coarser rings are the
+downsampled view: every event is folded into one bucket per resolution and
+the fine ring simply ages out sooner.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_RESOLUTIONS = ((1, 900), (60, 1440))
+
+
+class _Ring:
+    """Fixed-size ring of buckets for one resolution."""
+
+    def __init__(self, step: int, slots: int):
+        self.step = step
+        self.slots = slots
+        self.epoch = np.full(slots, -1, dtype=np.int64)
+        self.count = np.zeros(slots, dtype=np.int64)
+        self.total = np.zeros(slots, dtype=np.float64)
+        self.maximum = np.zeros(slots, dtype=np.float64)
+
+    def add(self, timestamp: float, value: float) -> None:
+        bucket = int(timestamp // self.step)
+        slot = bucket % self.slots
+        if self.epoch[slot] != bucket:
+            self.epoch[slot] = bucket
+            self.count[slot] = 0
+            self.total[slot] = 0.0
+            self.maximum[slot] = value
+        self.count[slot] += 1
+        self.total[slot] += value
+        if value > self.maximum[slot]:
+            self.maximum[slot] = value
+
+    def window(self, now: float, points: int) -> Tuple[int, np.ndarray, np.ndarray, np.ndarray]:
+        points = min(points, self.slots)
+        last = int(now // self.step)
+        buckets = np.arange(last - points + 1, last + 1, dtype=np.int64)
+        slots = buckets % self.slots
+        live = self.epoch[slots] == buckets
+        count = np.where(live, self.count[slots], 0)
+        total = np.where(live, self.total[slots], 0.0)
+        maximum = np.where(live, self.maximum[slots], 0.0)
+        return int(buckets[0] * self.step), count, total, maximum
+
+
+class TimeSeriesStore:
+    """Multi-resolution ring-buffer store fed lock-free from request handlers.
+
+    Args:
+        resolutions: (step_seconds, slots) per ring, finest first.
+        max_series: Hard cap on distinct series; extra series are ignored.
+        max_pending: Bound on undrained events; the oldest are dropped under overload.
+    """
+
+    def __init__(
+        self,
+        resolutions: Sequence[Tuple[int, int]] = DEFAULT_RESOLUTIONS,
+        max_series: int = 64,
+        max_pending: int = 100000,
+    ):
+        self.resolutions = tuple(resolutions)
+        self.max_series = max_series
+        self._pending: deque = deque(maxlen=max_pending)
+        self._series: Dict[str, List[_Ring]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, series: str, value: float = 1.0, timestamp: Optional[float] = None) -> None:
+        """Hot path: enqueue one observation without taking a lock."""
+        self._pending.append((timestamp if timestamp is not None else time.time(), series, value))
+
+    def drain(self) -> int:
+        """Fold pending observations into the rings; returns how many were folded."""
+        folded = 0
+        with self._lock:
+            pending = self._pending
+            while True:
+                try:
+                    timestamp, series, value = pending.popleft()
+                except IndexError:
+                    break
+                rings = self._series.get(series)
+                if rings is None:
+                    if len(self._series) >= self.max_series:
+                        continue
+                    rings = self._series[series] = [_Ring(step, slots) for step, slots in self.resolutions]
+                for ring in rings:
+                    ring.add(timestamp, value)
+                folded += 1
+        return folded
+
+    def series_names(self) -> List[str]:
+        with self._lock:
+            return sorted(self._series)
+
+    def query(self, series: str, step: int = 1, window: int = 300, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Recent buckets of a series at the ring whose step matches ``step``.
+
+        Returns a compact dict of parallel arrays (count, rate per second,
+        mean and max per bucket), or None if the series or step is unknown.
+        """
+        self.drain()
+        now = time.time() if now is None else now
+        with self._lock:
+            rings = self._series.get(series)
+            ring = next((r for r in rings or [] if r.step == step), None)
+            if ring is None:
+                return None
+            start, count, total, maximum = ring.window(now, max(1, window // step))
+        mean = np.divide(total, count, out=np.zeros_like(total), where=count > 0)
+        return {
+            "series": series,
+            "start": start,
+            "step": step,
+            "count": count.tolist(),
+            "rate": np.round(count / step, 3).tolist(),
+            "mean": np.round(mean, 3).tolist(),
+            "max": np.round(maximum, 3).tolist(),
+        }
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(1)
+            self.drain()
+
+    def start(self) -> None:
+        """Start the background roller thread (idempotent)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name="timeseries-roller")
+            self._thread.start()
+
+
+def parse_resolution(value: str) -> int:
+    """'1s' / '1m' / '60' -> bucket step in seconds."""
+    value = (value or "1s").strip().lower()
+    if value.endswith("m"):
+        return int(value[:-1]) * 60
+    if value.endswith("s"):
+        return int(value[:-1])
+    return int(value)
+
+
+def dashboard_series(store: "TimeSeriesStore", series: str = "http", window: int = 900) -> Dict[str, List[float]]:
+    """Chart arrays for the live dashboard snapshot (throughput and mean latency per second)."""
+    result = store.query(series, step=1, window=window) or {}
+    return {"chart_rate": result.get("rate", []), "chart_latency": result.get("mean", [])}
+
+
+# Gráficos del dashboard: las series llegan en el mismo stream SSE (claves chart_*) y se dibujan en SVG
+DASHBOARD_CHARTS_HTML = """
+<div class="metric">
+    <div class="label">Throughput (req/s, last 15 min)</div>
+    <svg id="ts-rate" viewBox="0 0 900 120" preserveAspectRatio="none" style="width:100%;height:120px"></svg>
+</div>
+<div class="metric">
+    <div class="label">Mean latency (ms, last 15 min)</div>
+    <svg id="ts-latency" viewBox="0 0 900 120" preserveAspectRatio="none" style="width:100%;height:120px"></svg>
+</div>
+<script>
+function drawSeries(id, values, color) {
+    const svg = document.getElementById(id);
+    const top = Math.max(1, ...values);
+    const step = 900 / Math.max(1, values.length - 1);
+    const points = values.map((v, i) => `${(i * step).toFixed(1)},${(118 - (v / top) * 110).toFixed(1)}`).join(" ");
+    svg.innerHTML = `<polyline fill="none" stroke="${color}" stroke-width="2" points="${points}"/>` +
+        `<text x="4" y="12" fill="#ecf0f1" font-size="12">max ${top.toFixed(2)}</text>`;
+}
+function renderCharts(state) {
+    drawSeries("ts-rate", state.chart_rate || [], "#3498db");
+    drawSeries("ts-latency", state.chart_latency || [], "#e67e22");
+}
+</script>
+"""
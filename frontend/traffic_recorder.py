@@ -0,0 +1,220 @@
+"""Opt-in, sampled capture of real requests for deterministic replay.
+
+The request thread only decides whether to sample and, if so, puts one
+small tuple on a bounded queue (dropping it when full); a writer thread does
+the encoding, compression and file rotation. Logs are gzip files of binary
+frames::
+
+    >II  meta_len, body_len
+    meta JSON (method, path, query, headers, status, latency, response...)
+    raw request body
+
+Files rotate at ``max_file_bytes`` of uncompressed frames and only the
+newest ``max_files`` are kept. ``read_traffic`` streams captured records in
+order for ``scripts/replay-traffic.py``, merging the files lazily so a
+capture of any size replays in bounded memory.
+"""
+
+import glob
+import gzip
+import heapq
+import itertools
+import json
+import os
+import queue
+import random
+import struct
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+FRAME_HEADER = struct.Struct(">II")
+DEFAULT_EXCLUDE_PREFIXES = ("/metrics", "/dashboard", "/health")
+# Cabeceras que cambian la respuesta o su coste: sin ellas la repetición no sería la misma petición
+RECORDED_HEADERS = ("Content-Type", "Accept", "Idempotency-Key", "X-Model", "X-Traffic-Class", "X-Request-Deadline")
+REORDER_WINDOW = 4096
+
+
+class TrafficRecorder:
+    """Samples requests and writes them to a rotating, compressed binary log.
+
+    Args:
+        directory: Where the ``<prefix>-*.bin.gz`` files are written.
+        sample_rate: Fraction of requests captured (0..1).
+        prefix: File name prefix (one per service).
+        max_file_bytes: Uncompressed bytes per file before rotating.
+        max_files: Files kept; older ones are deleted.
+        max_body_bytes: Larger request/response bodies are not stored.
+        queue_size: Pending captures before new ones are dropped.
+        exclude_prefixes: Paths never captured (monitoring traffic).
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        sample_rate: float = 0.01,
+        prefix: str = "traffic",
+        max_file_bytes: int = 64 * 1024 * 1024,
+        max_files: int = 10,
+        max_body_bytes: int = 64 * 1024,
+        queue_size: int = 10000,
+        exclude_prefixes: Iterable[str] = DEFAULT_EXCLUDE_PREFIXES,
+    ):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.prefix = prefix
+        self.max_file_bytes = max_file_bytes
+        self.max_files = max_files
+        self.max_body_bytes = max_body_bytes
+        self.exclude_prefixes = tuple(exclude_prefixes)
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=queue_size)
+        self._random = random.Random()
+        self._file = None
+        self._file_bytes = 0
+        self._sequence = 0
+        self._thread: Optional[threading.Thread] = None
+        self.recorded = 0
+        self.dropped = 0
+
+    def should_capture(self, path: str) -> bool:
+        """Sampling decision, taken before the request is handled."""
+        if path.startswith(self.exclude_prefixes):
+            return False
+        return self._random.random() < self.sample_rate
+
+    def capture(
+        self,
+        method: str,
+        path: str,
+        query: str,
+        headers: Dict[str, str],
+        body: Optional[bytes],
+        status: int,
+        latency_ms: float,
+        response_body: Optional[bytes] = None,
+    ) -> None:
+        """Hand one finished request to the writer thread (never blocks).
+
+        ``body`` is None when the request body was too large to buffer; such
+        records are kept for the latency profile but flagged as not replayable.
+        """
+        self._ensure_thread()
+        item = (time.time(), method, path, query, headers, body, status, latency_ms, response_body)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def _encode(self, item: tuple) -> bytes:
+        timestamp, method, path, query, headers, body, status, latency_ms, response_body = item
+        meta = {
+            "seq": self._sequence,
+            "ts": timestamp,
+            "method": method,
+            "path": path,
+            "query": query,
+            "headers": headers,
+            "status": status,
+            "latency_ms": round(latency_ms, 3),
+        }
+        if body is None or len(body) > self.max_body_bytes:
+            meta["body_truncated"] = True
+            body = b""
+        if response_body is not None and len(response_body) <= self.max_body_bytes:
+            meta["response"] = response_body.decode("utf-8", errors="replace")
+        self._sequence += 1
+        encoded = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+        return FRAME_HEADER.pack(len(encoded), len(body)) + encoded + body
+
+    def _open_file(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{self.prefix}-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{self._sequence}.bin.gz"
+        self._file = gzip.open(os.path.join(self.directory, name), "wb", compresslevel=6)
+        self._file_bytes = 0
+        files = sorted(glob.glob(os.path.join(self.directory, f"{self.prefix}-*.bin.gz")), key=os.path.getmtime)
+        for old in files[: max(0, len(files) - self.max_files)]:
+            os.remove(old)
+
+    def _write(self, item: tuple) -> None:
+        if self._file is None or self._file_bytes >= self.max_file_bytes:
+            self.close()
+            self._open_file()
+        frame = self._encode(item)
+        self._file.write(frame)
+        self._file_bytes += len(frame)
+        self.recorded += 1
+
+    def _run(self) -> None:
+        while True:
+            try:
+                item = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                # Sin tráfico: se vacía el buffer para que el archivo sea legible
+                if self._file is not None:
+                    self._file.flush()
+                continue
+            if item is None:
+                break
+            try:
+                self._write(item)
+            except Exception as e:
+                print(f"❌ Traffic recorder error: {e}")
+        self.close()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name="traffic-recorder")
+            self._thread.start()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Write everything still queued and close the current file."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"sample_rate": self.sample_rate, "recorded": self.recorded, "dropped": self.dropped}
+
+
+def _read_frames(path: str) -> Iterator[Dict[str, Any]]:
+    with gzip.open(path, "rb") as f:
+        while True:
+            try:
+                header = f.read(FRAME_HEADER.size)
+                if len(header) < FRAME_HEADER.size:
+                    return
+                meta_len, body_len = FRAME_HEADER.unpack(header)
+                meta = json.loads(f.read(meta_len))
+                meta["body"] = f.read(body_len)
+            except (EOFError, OSError, ValueError):
+                return  # Archivo aún abierto por el writer: se lee hasta el último frame completo
+            yield meta
+
+
+def read_traffic(paths: Iterable[str], reorder_window: int = REORDER_WINDOW) -> Iterator[Dict[str, Any]]:
+    """Captured records from log files (or directories), in capture order, read lazily.
+
+    Each file is already close to capture order (one writer per process), so
+    the files are merged as streams and a heap of ``reorder_window`` records
+    fixes the small inversions between request threads.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(path, "*.bin.gz")))
+        else:
+            files.append(path)
+    order = itertools.count()  # Desempate: (ts, seq) puede repetirse entre procesos
+    pending: List[Tuple[float, int, int, Dict[str, Any]]] = []
+    for record in heapq.merge(*(_read_frames(path) for path in files), key=lambda r: (r["ts"], r["seq"])):
+        heapq.heappush(pending, (record["ts"], record["seq"], next(order), record))
+        if len(pending) > reorder_window:
+            yield heapq.heappop(pending)[-1]
+    while pending:
+        yield heapq.heappop(pending)[-1]
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""Synthetic load generator for the Car Price Predictor services.
+
+Grown out of ``data_flow_demo.py``: instead of posting random metrics to
+Splunk, it drives the real endpoints (backend ``/current_value_market``,
+``/future_prediction``, ``/publish_car`` and frontend ``/predict``) with
+realistically skewed vehicles, for capacity planning.
+
+Modes:
+    open    Constant arrival rate (``--rate`` req/s) regardless of how fast the
+            services answer. Latency is measured from each request's intended
+            start time, so queueing is never hidden (no coordinated omission).
+    closed  ``--concurrency`` workers that each wait for their previous
+            answer. With ``--rate`` each worker follows a paced schedule and
+            the corrected latency is again taken from the intended start.
+
+Latencies go into HDR-style log-linear histograms (3 significant digits) and
+are reported as raw and corrected percentiles plus throughput; ``--json``
+exports the full report. Timeouts and connection errors are recorded at the
+time they took to fail (the timeout, for a timeout), so a stalled service
+shows up in the tail instead of vanishing from it.
+
+Examples:
+    python load_generator.py --mode open --rate 200 --duration 60 --json open.json
+    python load_generator.py --mode closed --concurrency 32 --duration 60
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+# === Distribuciones sesgadas de vehículos ===
+FUEL_TYPES = [("Gasoline", 0.70), ("Hybrid", 0.10), ("Diesel", 0.08), ("E85 Flex Fuel", 0.05), ("Plug-In Hybrid", 0.04)]
+FUEL_TYPES += [("Electric", 0.03)]
+TRANSMISSIONS = [("Automatic", 0.45), ("A/T", 0.25), ("8-Speed A/T", 0.10), ("6-Speed A/T", 0.08), ("Manual", 0.07)]
+TRANSMISSIONS += [("CVT Transmission", 0.05)]
+DEFAULT_MIX = "current=70,future=20,publish=5,predict=5"
+
+
+class VehicleSampler:
+    """Draws vehicles whose feature mix resembles a used-car marketplace."""
+
+    def __init__(self, seed: Optional[int] = None, current_year: Optional[int] = None):
+        self.random = random.Random(seed)
+        self.current_year = current_year or datetime.now().year
+
+    def _weighted(self, choices: List[Tuple[str, float]]) -> str:
+        values, weights = zip(*choices)
+        return self.random.choices(values, weights=weights)[0]
+
+    def vehicle(self) -> Dict[str, Any]:
+        # Antigüedad sesgada hacia autos recientes (gamma, cola larga de autos viejos)
+        age = min(int(self.random.gammavariate(2.0, 2.5)), 30)
+        return {
+            "model_year": self.current_year - age,
+            "age": age,
+            "fuel_type": self._weighted(FUEL_TYPES),
+            "transmission": self._weighted(TRANSMISSIONS),
+            "clean_title": 1 if self.random.random() < 0.9 else 0,
+        }
+
+    def asking_price(self, vehicle: Dict[str, Any]) -> int:
+        base = 32000 * (0.88 ** vehicle["age"])
+        return int(max(1500, base * self.random.lognormvariate(0, 0.25)))
+
+    def months(self) -> int:
+        return self.random.choice([6, 12, 12, 12, 24, 36])
+
+
+class LatencyHistogram:
+    """Log-linear histogram in microseconds with ~3 significant digits (HdrHistogram layout)."""
+
+    SUB_BUCKET_BITS = 11
+    SUB_BUCKET_HALF = 1 << (SUB_BUCKET_BITS - 1)
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+        self.total = 0
+        self.max_value = 0
+        self.min_value: Optional[int] = None
+        self.sum_value = 0
+
+    def _index(self, value: int) -> int:
+        exponent = max(0, value.bit_length() - self.SUB_BUCKET_BITS)
+        return exponent * self.SUB_BUCKET_HALF + (value >> exponent)
+
+    def _highest_equivalent(self, index: int) -> int:
+        if index < 2 * self.SUB_BUCKET_HALF:
+            return index
+        exponent = index // self.SUB_BUCKET_HALF - 1
+        sub = index - exponent * self.SUB_BUCKET_HALF
+        return ((sub + 1) << exponent) - 1
+
+    def record(self, seconds: float) -> None:
+        value = max(0, int(seconds * 1_000_000))
+        self.counts[self._index(value)] += 1
+        self.total += 1
+        self.sum_value += value
+        self.max_value = max(self.max_value, value)
+        self.min_value = value if self.min_value is None else min(self.min_value, value)
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        self.counts.update(other.counts)
+        self.total += other.total
+        self.sum_value += other.sum_value
+        self.max_value = max(self.max_value, other.max_value)
+        if other.min_value is not None:
+            self.min_value = other.min_value if self.min_value is None else min(self.min_value, other.min_value)
+
+    def percentile(self, pct: float) -> float:
+        """Value in ms at the given percentile (upper edge of its bucket)."""
+        if not self.total:
+            return 0.0
+        target = max(1, int(round(pct / 100.0 * self.total + 0.5 - 1e-9)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self._highest_equivalent(index), self.max_value) / 1000.0
+        return self.max_value / 1000.0
+
+    def summary(self) -> Dict[str, float]:
+        report = {f"p{p:g}": round(self.percentile(p), 3) for p in (50, 90, 95, 99, 99.9, 99.99)}
+        report.update(
+            {
+                "count": self.total,
+                "min": round((self.min_value or 0) / 1000.0, 3),
+                "mean": round(self.sum_value / self.total / 1000.0, 3) if self.total else 0.0,
+                "max": round(self.max_value / 1000.0, 3),
+            }
+        )
+        return report
+
+
+class HttpConnection:
+    """Minimal HTTP/1.1 client connection over asyncio streams (keep-alive aware)."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def open(self) -> None:
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    @property
+    def is_open(self) -> bool:
+        return self.writer is not None and not self.writer.is_closing()
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def request(self, method: str, target: str, body: bytes = b"", content_type: str = "") -> Tuple[int, bytes]:
+        if not self.is_open:
+            await self.open()
+        head = [f"{method} {target} HTTP/1.1", f"Host: {self.host}:{self.port}", "Connection: keep-alive"]
+        if body:
+            head += [f"Content-Type: {content_type}", f"Content-Length: {len(body)}"]
+        self.writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed by server")
+        version, status = status_line.decode("latin-1").split(" ", 2)[:2]
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        payload = await self._read_body(headers)
+        if version == "HTTP/1.0" or headers.get("connection", "").lower() == "close" or "content-length" not in headers:
+            if headers.get("transfer-encoding", "").lower() != "chunked":
+                self.close()
+        return int(status), payload
+
+    async def _read_body(self, headers: Dict[str, str]) -> bytes:
+        if "content-length" in headers:
+            return await self.reader.readexactly(int(headers["content-length"]))
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0].strip(), 16)
+                if size == 0:
+                    await self.reader.readline()
+                    return b"".join(chunks)
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+        return await self.reader.read()
+
+
+class ConnectionPool:
+    """Bounded pool of keep-alive connections to one host."""
+
+    def __init__(self, base_url: str, max_connections: int):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 80
+        self._idle: List[HttpConnection] = []
+        self._slots = asyncio.Semaphore(max_connections)
+
+    async def request(self, method: str, target: str, body: bytes = b"", content_type: str = "") -> Tuple[int, bytes]:
+        async with self._slots:
+            connection = self._idle.pop() if self._idle else HttpConnection(self.host, self.port)
+            try:
+                result = await connection.request(method, target, body, content_type)
+            except BaseException:
+                connection.close()
+                raise
+            if connection.is_open:
+                self._idle.append(connection)
+            return result
+
+    def close(self) -> None:
+        for connection in self._idle:
+            connection.close()
+        self._idle.clear()
+
+
+class LoadReport:
+    """Accumulates raw and corrected latencies per endpoint."""
+
+    def __init__(self):
+        self.raw: Dict[str, LatencyHistogram] = {}
+        self.corrected: Dict[str, LatencyHistogram] = {}
+        self.status_codes: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def record(self, endpoint: str, intended: float, sent: float, done: float, status: int) -> None:
+        self.raw.setdefault(endpoint, LatencyHistogram()).record(done - sent)
+        self.corrected.setdefault(endpoint, LatencyHistogram()).record(done - intended)
+        self.status_codes[str(status)] += 1
+
+    def record_error(self, endpoint: str, error: BaseException, intended: float, sent: float, done: float) -> None:
+        # Un fallo también es una espera del usuario: cuenta en la cola de latencia, no sólo en errores
+        self.raw.setdefault(endpoint, LatencyHistogram()).record(done - sent)
+        self.corrected.setdefault(endpoint, LatencyHistogram()).record(done - intended)
+        self.errors[f"{endpoint}: {type(error).__name__}"] += 1
+
+    @staticmethod
+    def _combined(histograms: Dict[str, LatencyHistogram]) -> LatencyHistogram:
+        total = LatencyHistogram()
+        for histogram in histograms.values():
+            total.merge(histogram)
+        return total
+
+    def to_dict(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        completed = sum(self.status_codes.values())
+        return {
+            "config": config,
+            "duration_seconds": round(elapsed, 3),
+            "requests_completed": completed,
+            "errors": sum(self.errors.values()),
+            "error_breakdown": dict(self.errors),
+            "throughput_rps": round(completed / elapsed, 2) if elapsed > 0 else 0.0,
+            "status_codes": dict(self.status_codes),
+            "latency_ms": {
+                "raw": self._combined(self.raw).summary(),
+                "corrected": self._combined(self.corrected).summary(),
+            },
+            "per_endpoint": {
+                name: {"raw": self.raw[name].summary(), "corrected": self.corrected[name].summary()}
+                for name in sorted(self.raw)
+            },
+        }
+
+
+class LoadGenerator:
+    """Builds requests from the endpoint mix and runs them in open or closed loop."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.sampler = VehicleSampler(seed=args.seed)
+        self.mix = parse_mix(args.mix)
+        self.mix_random = random.Random(args.seed)
+        self.backend = ConnectionPool(args.backend, args.max_connections)
+        self.frontend = ConnectionPool(args.frontend, args.max_connections)
+        self.report = LoadReport()
+
+    def _next_request(self) -> Tuple[str, ConnectionPool, str, str, bytes, str]:
+        names, weights = zip(*self.mix.items())
+        endpoint = self.mix_random.choices(names, weights=weights)[0]
+        vehicle = self.sampler.vehicle()
+        if endpoint == "current":
+            return endpoint, self.backend, "GET", f"/current_value_market?{urlencode(vehicle)}", b"", ""
+        if endpoint == "future":
+            query = urlencode(dict(vehicle, meses=self.sampler.months()))
+            return endpoint, self.backend, "GET", f"/future_prediction?{query}", b"", ""
+        if endpoint == "publish":
+            # Precio y marca únicos para no chocar con la deduplicación de publish_car
+            body = dict(vehicle, precio=self.sampler.asking_price(vehicle), load_test_id=uuid.uuid4().hex)
+            return endpoint, self.backend, "POST", "/publish_car", json.dumps(body).encode(), "application/json"
+        form = urlencode(vehicle).encode()
+        return endpoint, self.frontend, "POST", "/predict", form, "application/x-www-form-urlencoded"
+
+    async def _fire(self, intended: float) -> None:
+        endpoint, pool, method, target, body, content_type = self._next_request()
+        sent = time.perf_counter()
+        try:
+            status, _ = await asyncio.wait_for(pool.request(method, target, body, content_type), self.args.timeout)
+        except Exception as e:
+            self.report.record_error(endpoint, e, intended, sent, time.perf_counter())
+            return
+        self.report.record(endpoint, intended, sent, time.perf_counter(), status)
+
+    async def run_open(self) -> None:
+        interval = 1.0 / self.args.rate
+        start = time.perf_counter()
+        end = start + self.args.duration
+        tasks = set()
+        index = 0
+        while True:
+            intended = start + index * interval
+            if intended >= end:
+                break
+            delay = intended - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            task = asyncio.ensure_future(self._fire(intended))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            index += 1
+        if tasks:
+            await asyncio.wait(tasks)  # Cada petición ya está acotada por --timeout y registra su resultado
+
+    async def _closed_worker(self, end: float, interval: Optional[float]) -> None:
+        intended = time.perf_counter()
+        while time.perf_counter() < end:
+            if interval is not None:
+                delay = intended - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                intended = time.perf_counter()
+            await self._fire(intended)
+            if interval is not None:
+                intended += interval
+
+    async def run_closed(self) -> None:
+        end = time.perf_counter() + self.args.duration
+        interval = self.args.concurrency / self.args.rate if self.args.rate else None
+        await asyncio.gather(*(self._closed_worker(end, interval) for _ in range(self.args.concurrency)))
+
+    async def run(self) -> Dict[str, Any]:
+        try:
+            if self.args.mode == "open":
+                await self.run_open()
+            else:
+                await self.run_closed()
+        finally:
+            self.report.finished = time.perf_counter()
+            self.backend.close()
+            self.frontend.close()
+        config = {k: v for k, v in vars(self.args).items() if k != "json"}
+        return self.report.to_dict(config)
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """'current=70,future=20' -> weights, validating endpoint names."""
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("current", "future", "publish", "predict"):
+            raise ValueError(f"Unknown endpoint in mix: {name}")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise ValueError("Endpoint mix needs at least one positive weight")
+    return mix
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print("\n📈 Load test results")
+    print("=" * 60)
+    print(f"⏱️  Duration:   {report['duration_seconds']}s")
+    print(f"✅ Completed:  {report['requests_completed']}  ({report['throughput_rps']} req/s)")
+    print(f"❌ Errors:     {report['errors']}")
+    print(f"📊 Status:     {report['status_codes']}")
+    header = f"{'':>15}" + "".join(f"{k:>10}" for k in ("p50", "p90", "p99", "p99.9", "max"))
+    print(header)
+    for kind in ("raw", "corrected"):
+        stats = report["latency_ms"][kind]
+        print(f"{kind + ' (ms)':>15}" + "".join(f"{stats[k]:>10.2f}" for k in ("p50", "p90", "p99", "p99.9", "max")))
+    for name, stats in report["per_endpoint"].items():
+        corrected = stats["corrected"]
+        print(f"   • {name:<8} n={corrected['count']:<7} p50={corrected['p50']:.2f}ms p99={corrected['p99']:.2f}ms")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Drive the Car Price Predictor services with synthetic load")
+    parser.add_argument("--backend", default="http://localhost:5002", help="Backend base URL")
+    parser.add_argument("--frontend", default="http://localhost:3000", help="Frontend base URL")
+    parser.add_argument("--mode", choices=["open", "closed"], default="open", help="Open-loop rate or closed-loop workers")
+    parser.add_argument("--rate", type=float, default=None, help="Target req/s (required for open mode)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Workers in closed mode")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to generate load")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Endpoint weights, e.g. current=70,future=20,publish=5,predict=5")
+    parser.add_argument("--max-connections", type=int, default=256, help="Connection cap per service")
+    parser.add_argument("--timeout", type=float, default=10, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible traffic")
+    parser.add_argument("--json", default=None, help="Write the full report to this JSON file")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+    if args.mode == "open" and not args.rate:
+        sys.exit("❌ --rate is required in open mode")
+    try:
+        parse_mix(args.mix)
+    except ValueError as e:
+        sys.exit(f"❌ {e}")
+
+    print(f"🚀 {args.mode}-loop load for {args.duration}s against {args.backend} / {args.frontend}")
+    report = asyncio.run(LoadGenerator(args).run())
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
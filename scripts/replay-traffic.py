@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""Replay traffic captured by TRAFFIC_RECORD_DIR against a local instance.
+
+Requests are re-issued in capture order, at the original pace scaled by
+--speed (--speed 0 sends them as fast as --concurrency allows). The report
+compares recorded vs replayed latency percentiles per path and diffs every
+response against the captured one (status code, then JSON body ignoring
+volatile keys, or raw text). The capture is streamed, with at most a few
+requests per worker queued, so its size is not limited by memory. A captured
+X-Request-Deadline (absolute epoch ms) is rebased to the replay clock, so each
+request keeps the budget it originally had.
+
+Usage:
+    python scripts/replay-traffic.py /tmp/traffic --target http://localhost:5002 --speed 4
+    python scripts/replay-traffic.py /tmp/traffic/frontend-*.bin.gz --target http://localhost:3000 --json replay.json
+
+Note: writes such as /publish_car are replayed too; point it at a disposable instance.
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+# Los módulos compartidos viven en backend/ (copias idénticas en frontend/)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from sketches import LogHistogram  # noqa: E402
+from traffic_recorder import read_traffic  # noqa: E402
+
+DEFAULT_IGNORE_KEYS = "timestamp,id,vehiculo_id,request_id,uptime_seconds"
+DEADLINE_HEADER = "X-Request-Deadline"
+
+
+def strip_keys(value, ignore):
+    """Drop volatile keys recursively before comparing JSON responses."""
+    if isinstance(value, dict):
+        return {k: strip_keys(v, ignore) for k, v in value.items() if k not in ignore}
+    if isinstance(value, list):
+        return [strip_keys(v, ignore) for v in value]
+    return value
+
+
+def replay_headers(record, now=None):
+    """Captured headers with the deadline moved to the replay clock (same budget from arrival)."""
+    headers = record["headers"]
+    if DEADLINE_HEADER not in headers:
+        return headers
+    try:
+        deadline_ms = float(headers[DEADLINE_HEADER])
+    except ValueError:
+        return {k: v for k, v in headers.items() if k != DEADLINE_HEADER}
+    # ts se toma al terminar: la llegada fue latency_ms antes
+    arrived_ms = record["ts"] * 1000.0 - record["latency_ms"]
+    now_ms = (time.time() if now is None else now) * 1000.0
+    return dict(headers, **{DEADLINE_HEADER: str(round(now_ms + deadline_ms - arrived_ms))})
+
+
+def diff_response(record, response, ignore):
+    """Short description of how the replayed response differs, or None."""
+    if response.status_code != record["status"]:
+        return f"status {record['status']} -> {response.status_code}"
+    if "response" not in record:
+        return None
+    try:
+        expected = strip_keys(json.loads(record["response"]), ignore)
+        actual = strip_keys(response.json(), ignore)
+    except ValueError:
+        return None if response.text == record["response"] else "body text differs"
+    if expected == actual:
+        return None
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        keys = sorted(k for k in set(expected) | set(actual) if expected.get(k) != actual.get(k))
+        return f"json keys differ: {', '.join(keys[:8])}"
+    return "json body differs"
+
+
+class Replayer:
+    """Re-issues captured requests and accumulates latency and diff statistics."""
+
+    def __init__(self, target, concurrency, timeout, ignore_keys, max_diffs):
+        self.target = target.rstrip("/")
+        self.timeout = timeout
+        self.ignore = set(ignore_keys)
+        self.max_diffs = max_diffs
+        self.pool = ThreadPoolExecutor(max_workers=concurrency)
+        # Peticiones en cola acotadas: la captura se lee a medida que se envía, nunca entera
+        self.slots = threading.BoundedSemaphore(concurrency * 2)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.recorded = {}
+        self.replayed = {}
+        self.matches = 0
+        self.mismatches = 0
+        self.errors = 0
+        self.diffs = []
+
+    def _session(self):
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def _send(self, record):
+        url = f"{self.target}{record['path']}"
+        if record["query"]:
+            url += f"?{record['query']}"
+        started = time.perf_counter()
+        try:
+            response = self._session().request(
+                record["method"], url, data=record["body"] or None, headers=replay_headers(record), timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            with self.lock:
+                self.errors += 1
+                if len(self.diffs) < self.max_diffs:
+                    self.diffs.append({"seq": record["seq"], "path": record["path"], "diff": f"error: {e}"})
+            return
+        latency_ms = (time.perf_counter() - started) * 1000
+        diff = diff_response(record, response, self.ignore)
+        with self.lock:
+            self.recorded.setdefault(record["path"], LogHistogram()).record(record["latency_ms"])
+            self.replayed.setdefault(record["path"], LogHistogram()).record(latency_ms)
+            if diff is None:
+                self.matches += 1
+                return
+            self.mismatches += 1
+            if len(self.diffs) < self.max_diffs:
+                self.diffs.append({"seq": record["seq"], "path": record["path"], "diff": diff})
+
+    def run(self, records, speed):
+        skipped = 0
+        first_ts = None
+        start = time.perf_counter()
+        for record in records:
+            if record.get("body_truncated"):
+                skipped += 1
+                continue
+            first_ts = record["ts"] if first_ts is None else first_ts
+            if speed > 0:
+                delay = start + (record["ts"] - first_ts) / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            self.slots.acquire()
+            self.pool.submit(self._send, record).add_done_callback(lambda _: self.slots.release())
+        self.pool.shutdown(wait=True)
+        return skipped, time.perf_counter() - start
+
+    def report(self, skipped, elapsed):
+        paths = {}
+        for path in sorted(self.recorded):
+            paths[path] = {"recorded": self.recorded[path].summary(), "replayed": self.replayed[path].summary()}
+        return {
+            "target": self.target,
+            "replayed": self.matches + self.mismatches,
+            "matches": self.matches,
+            "mismatches": self.mismatches,
+            "errors": self.errors,
+            "skipped_truncated": skipped,
+            "duration_seconds": round(elapsed, 3),
+            "paths": paths,
+            "diffs": self.diffs,
+        }
+
+
+def print_report(report):
+    print(f"\n🔁 Replayed {report['replayed']} requests against {report['target']} in {report['duration_seconds']}s")
+    print(
+        f"✅ Matching responses: {report['matches']}   ⚠️  Differences: {report['mismatches']}   ❌ Errors: {report['errors']}"
+    )
+    if report["skipped_truncated"]:
+        print(f"⏭️  Skipped {report['skipped_truncated']} requests whose body was too large to capture")
+    print(f"\n{'path':<28}{'n':>6}  {'recorded p50/p95/p99 ms':>26}  {'replayed p50/p95/p99 ms':>26}")
+    for path, stats in report["paths"].items():
+        rec, rep = stats["recorded"], stats["replayed"]
+        rec_text = f"{rec['p50']:.1f}/{rec['p95']:.1f}/{rec['p99']:.1f}"
+        rep_text = f"{rep['p50']:.1f}/{rep['p95']:.1f}/{rep['p99']:.1f}"
+        print(f"{path:<28}{rec['count']:>6}  {rec_text:>26}  {rep_text:>26}")
+    for diff in report["diffs"]:
+        print(f"   • #{diff['seq']} {diff['path']}: {diff['diff']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay captured traffic and compare latency and responses")
+    parser.add_argument("paths", nargs="+", help="Capture files or directories")
+    parser.add_argument("--target", default="http://localhost:5002", help="Base URL of the instance under test")
+    parser.add_argument("--speed", type=float, default=1.0, help="Pace multiplier (0 = as fast as possible)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at most")
+    parser.add_argument("--timeout", type=float, default=10, help="Per-request timeout in seconds")
+    parser.add_argument("--ignore-keys", default=DEFAULT_IGNORE_KEYS, help="JSON keys ignored when diffing")
+    parser.add_argument("--max-diffs", type=int, default=20, help="Differences listed in the report")
+    parser.add_argument("--json", default=None, help="Write the full report to this JSON file")
+    args = parser.parse_args(argv)
+
+    replayer = Replayer(args.target, args.concurrency, args.timeout, args.ignore_keys.split(","), args.max_diffs)
+    skipped, elapsed = replayer.run(read_traffic(args.paths), args.speed)
+    report = replayer.report(skipped, elapsed)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 import pytest
 import sys
 import os
+import json
+import io
+import time
 import tempfile
 import shutil
 
@@ -96,8 +99,1130 @@ def test_publish_car_endpoint(client):
     assert "precio_recomendado_modelo" in data
 
 
+def test_publish_car_idempotency_key_replays_original_response(client):
+    """Test that a retried publish with the same Idempotency-Key does not create a new listing"""
+    vehicle_data = {
+        "model_year": 2019,
+        "age": 5,
+        "fuel_type": "Diesel",
+        "transmission": "Manual",
+        "clean_title": 1,
+        "precio": 18000,
+    }
+    headers = {"Idempotency-Key": "test-retry-key-1"}
+    first = client.post("/publish_car", json=vehicle_data, headers=headers)
+    with open(os.environ["DB_PATH"]) as f:
+        stored_after_first = len(json.load(f))
+
+    retry = client.post("/publish_car", json=vehicle_data, headers=headers)
+    with open(os.environ["DB_PATH"]) as f:
+        stored_after_retry = len(json.load(f))
+
+    assert first.status_code == 201
+    assert retry.status_code == 201
+    assert retry.headers.get("Idempotent-Replayed") == "true"
+    assert retry.get_json()["vehiculo_id"] == first.get_json()["vehiculo_id"]
+    assert stored_after_retry == stored_after_first
+
+
+def test_publish_car_idempotency_key_reused_with_other_payload(client):
+    """Test that reusing an Idempotency-Key with a different body is rejected"""
+    vehicle_data = {
+        "model_year": 2017,
+        "age": 7,
+        "fuel_type": "Gasoline",
+        "transmission": "Automatic",
+        "clean_title": 0,
+        "precio": 9000,
+    }
+    headers = {"Idempotency-Key": "test-retry-key-2"}
+    assert client.post("/publish_car", json=vehicle_data, headers=headers).status_code == 201
+
+    response = client.post("/publish_car", json=dict(vehicle_data, precio=9500), headers=headers)
+    assert response.status_code == 422
+    assert "error" in response.get_json()
+
+
+def test_publish_car_deduplicates_identical_payload_without_key(client):
+    """Test that an identical keyless retry returns the original listing"""
+    vehicle_data = {
+        "model_year": 2016,
+        "age": 8,
+        "fuel_type": "Hybrid",
+        "transmission": "Automatic",
+        "clean_title": 1,
+        "precio": 12345,
+    }
+    first = client.post("/publish_car", json=vehicle_data)
+    retry = client.post("/publish_car", json=vehicle_data)
+    assert retry.status_code == 201
+    assert retry.get_json()["vehiculo_id"] == first.get_json()["vehiculo_id"]
+
+
+def test_backfill_rescores_listings_and_resumes(tmp_path):
+    """Test the re-scoring backfill writes versioned prices and honors its checkpoint"""
+    from backfill import Checkpoint, run_backfill
+    from pricing import model_version
+
+    db_path = str(tmp_path / "vehiculos.json")
+    listings = [
+        {
+            "id": i,
+            "model_year": 2015 + i % 5,
+            "age": 10 - i % 5,
+            "fuel_type": "Gasoline",
+            "transmission": "Automatic",
+            "clean_title": 1,
+            "precio": 10000 + i,
+        }
+        for i in range(1, 26)
+    ]
+    with open(db_path, "w") as f:
+        json.dump(listings, f)
+
+    # Simulate an interrupted run that already committed the first 10 rows
+    version = model_version(os.environ["MODEL_PATH"])
+    Checkpoint(db_path, version).commit(list(range(1, 11)), [1.0] * 10, 10)
+
+    stats = run_backfill(db_path, os.environ["MODEL_PATH"], workers=2, chunk_size=4)
+    with open(db_path) as f:
+        stored = json.load(f)
+
+    assert stats["resumed_from"] == 10
+    assert stats["rows_scored"] == 15
+    assert all(v["modelo_version"] == version for v in stored)
+    assert stored[0]["precio_recomendado_modelo"] == 1.0
+    assert stored[-1]["precio_recomendado_modelo"] > 0
+    assert not os.path.exists(db_path + ".backfill.json")
+
+
+def _worker_n_jobs(module_name):
+    """Model n_jobs as configured by a pool worker's initializer"""
+    import importlib
+
+    return importlib.import_module(module_name)._worker_model.get_params()["model__n_jobs"]
+
+
+def test_backfill_workers_score_with_one_native_thread():
+    """Test each backfill pool process caps the model to one thread instead of all cores"""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    import backfill
+
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(
+        1, mp_context=context, initializer=backfill._init_worker, initargs=(os.environ["MODEL_PATH"],)
+    ) as pool:
+        assert pool.submit(_worker_n_jobs, "backfill").result() == 1
+
+
+def test_score_file_workers_score_with_one_native_thread():
+    """Test scoring pool processes cap the model (inherited by fork or loaded) to one thread"""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    import score_file
+
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(
+        1, mp_context=context, initializer=score_file._init_worker, initargs=(os.environ["MODEL_PATH"],)
+    ) as pool:
+        assert pool.submit(_worker_n_jobs, "score_file").result() == 1
+
+
+def _wait_for_batch_job(client, job_id, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = client.get(f"/batch_jobs/{job_id}").get_json()
+        if status["status"] in ("completed", "failed"):
+            return status
+        time.sleep(0.05)
+    raise AssertionError("batch job did not finish in time")
+
+
+def test_batch_job_csv_submit_poll_download(client):
+    """Test that an uploaded CSV is scored asynchronously and downloadable"""
+    rows = ["model_year,age,fuel_type,transmission,clean_title"]
+    rows += [f"{2010 + i % 10},{i % 10},Gasoline,Automatic,1" for i in range(250)]
+    upload = (io.BytesIO("\n".join(rows).encode()), "cars.csv")
+
+    response = client.post("/batch_jobs", data={"file": upload}, content_type="multipart/form-data")
+    assert response.status_code == 202
+    job_id = response.get_json()["job_id"]
+
+    status = _wait_for_batch_job(client, job_id)
+    assert status["status"] == "completed"
+    assert status["rows_processed"] == 250
+    assert status["progress"] == 1.0
+
+    result = client.get(f"/batch_jobs/{job_id}/result")
+    assert result.status_code == 200
+    lines = result.data.decode().strip().splitlines()
+    assert lines[0].endswith("current_value_market_estimado")
+    assert len(lines) == 251
+
+
+def test_batch_job_ndjson_output_and_unknown_job(client):
+    """Test NDJSON output from a raw-body upload and 404 for unknown jobs"""
+    body = "\n".join(
+        json.dumps({"model_year": 2018, "age": 6, "fuel_type": "Diesel", "transmission": "Manual", "clean_title": 0})
+        for _ in range(5)
+    )
+    response = client.post("/batch_jobs?output_format=ndjson", data=body, content_type="application/x-ndjson")
+    assert response.status_code == 202
+    job_id = response.get_json()["job_id"]
+    assert _wait_for_batch_job(client, job_id)["status"] == "completed"
+
+    result = client.get(f"/batch_jobs/{job_id}/result")
+    records = [json.loads(line) for line in result.data.decode().splitlines()]
+    assert len(records) == 5
+    assert all(r["current_value_market_estimado"] > 0 for r in records)
+
+    assert client.get("/batch_jobs/does-not-exist").status_code == 404
+
+
+def test_batch_job_scores_with_the_model_selected_at_submit(client, monkeypatch):
+    """Test X-Model picks the model for the whole job, not the default at run time"""
+    import app as backend_app
+
+    requested = []
+    monkeypatch.setattr(backend_app.batch_jobs, "model_getter", lambda name: requested.append(name))
+    body = json.dumps({"model_year": 2018, "age": 6, "fuel_type": "Diesel", "transmission": "Manual", "clean_title": 0})
+    response = client.post(
+        "/batch_jobs?output_format=ndjson", data=body, content_type="application/x-ndjson", headers={"X-Model": "modelo"}
+    )
+    assert response.status_code == 202
+    assert response.get_json()["model"] == "modelo"
+    assert _wait_for_batch_job(client, response.get_json()["job_id"])["status"] == "completed"
+    assert requested == ["modelo"]
+    assert client.post("/batch_jobs?model=regional-eu", data=body, content_type="application/x-ndjson").status_code == 404
+
+
+def test_score_file_cli_preserves_order_across_chunks(tmp_path):
+    """Test the offline scorer writes every row, in input order, with predictions"""
+    from score_file import main
+
+    input_path = tmp_path / "autos.csv"
+    output_path = tmp_path / "precios.ndjson"
+    rows = ["model_year,age,fuel_type,transmission,clean_title"]
+    rows += [f"{2000 + i},{i % 20},Gasoline,Manual,1" for i in range(23)]
+    input_path.write_text("\n".join(rows) + "\n")
+
+    main([str(input_path), str(output_path), "--model", os.environ["MODEL_PATH"], "--workers", "2", "--chunk-size", "5"])
+
+    records = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert [r["model_year"] for r in records] == [2000 + i for i in range(23)]
+    assert all(r["current_value_market_estimado"] > 0 for r in records)
+
+
+def test_what_if_two_feature_sweep_returns_matrix(client):
+    """Test the what-if endpoint scores a two-feature grid as a matrix"""
+    payload = {
+        "base": {"model_year": 2018, "age": 6, "fuel_type": "Gasoline", "transmission": "Automatic", "clean_title": 1},
+        "sweep": {"age": {"start": 0, "stop": 10, "step": 2}, "fuel_type": ["Gasoline", "Diesel", "Hybrid"]},
+    }
+    response = client.post("/what_if", json=payload)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["features"] == ["age", "fuel_type"]
+    assert data["axes"]["age"] == [0.0, 2.0, 4.0, 6.0, 8.0, 10.0]
+    assert len(data["values"]) == 6
+    assert all(len(row) == 3 for row in data["values"])
+    assert data["points"] == 18
+
+
+def test_what_if_rejects_oversized_grid(client):
+    """Test the what-if endpoint caps the grid size"""
+    payload = {
+        "base": {"fuel_type": "Gasoline", "transmission": "Automatic", "clean_title": 1},
+        "sweep": {"age": {"start": 0, "stop": 1000}, "model_year": {"start": 1000, "stop": 2024}},
+    }
+    response = client.post("/what_if", json=payload)
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_what_if_rejects_invalid_base_fields(client):
+    """Test a non-numeric base field is a 400, as in the single-vehicle endpoints"""
+    payload = {
+        "base": {"model_year": "abc", "fuel_type": "Gasoline", "transmission": "Automatic", "clean_title": 1},
+        "sweep": {"age": [1, 2, 3]},
+    }
+    response = client.post("/what_if", json=payload)
+    assert response.status_code == 400
+    assert "model_year" in response.get_json()["error"]
+
+    payload["base"]["model_year"] = "2019"  # Los números en texto siguen valiendo
+    assert client.post("/what_if", json=payload).status_code == 200
+
+
+def test_what_if_rejects_non_finite_ranges_and_non_object_bodies(client):
+    """Test overflowing sweep bounds and JSON bodies that are not objects are a 400, not a 500"""
+    base = '{"model_year": 2018, "fuel_type": "Gasoline", "transmission": "Automatic", "clean_title": 1}'
+    for sweep in (
+        '{"age": {"start": 0, "stop": 1e400}}',
+        '{"age": {"start": 0, "stop": 5, "step": NaN}}',
+        '{"age": [1, -1e400]}',
+    ):
+        body = f'{{"base": {base}, "sweep": {sweep}}}'
+        response = client.post("/what_if", data=body, content_type="application/json")
+        assert response.status_code == 400 and "error" in response.get_json()
+    for body in ([1, 2], "sweep", {"base": [], "sweep": {"age": [1]}}):
+        assert client.post("/what_if", json=body).status_code == 400
+
+
+def test_explain_price_contributions_sum_to_estimate(client):
+    """Test that per-feature contributions plus the base value reproduce the estimate"""
+    response = client.get("/explain_price?model_year=2020&age=4&fuel_type=Gasoline&transmission=Automatic&clean_title=1")
+    assert response.status_code == 200
+    data = response.get_json()
+    assert set(data["contribuciones"]) == {"model_year", "age", "fuel_type", "transmission", "clean_title"}
+    total = data["valor_base"] + sum(data["contribuciones"].values())
+    assert abs(total - data["precio_estimado"]) < 0.1
+
+
+def test_explain_price_batch(client):
+    """Test batch explanations are returned in request order"""
+    vehiculos = [
+        {"model_year": 2015, "age": 9, "fuel_type": "Diesel", "transmission": "Manual", "clean_title": 0},
+        {"model_year": 2021, "age": 3, "fuel_type": "Hybrid", "transmission": "Automatic", "clean_title": 1},
+        {"model_year": 2015, "age": 9, "fuel_type": "Diesel", "transmission": "Manual", "clean_title": 0},
+    ]
+    response = client.post("/explain_price", json={"vehiculos": vehiculos})
+    assert response.status_code == 200
+    explicaciones = response.get_json()["explicaciones"]
+    assert [e["datos"]["model_year"] for e in explicaciones] == [2015, 2021, 2015]
+    assert explicaciones[0]["precio_estimado"] == explicaciones[2]["precio_estimado"]
+
+    assert client.post("/explain_price", json={"vehiculos": [{"age": 3}]}).status_code == 400
+    # Cuerpos que no son un objeto (o 'vehiculos' que no es lista) son 400, no un AttributeError
+    for body in (vehiculos, "vehiculos", {"vehiculos": "abc"}, {"vehiculos": [1]}):
+        assert client.post("/explain_price", json=body).status_code == 400
+
+
+def test_metrics_aggregator_folds_events_and_bounds_labels():
+    """Test counters and histograms are folded per interval with bounded label cardinality"""
+    from metrics_aggregator import OTHER_LABEL, MetricsAggregator
+
+    sent = []
+    metrics = MetricsAggregator(sent.append, {"service": "test"}, label_allowlist=["endpoint"], top_k=2)
+    for i in range(50):
+        metrics.counter("hits", 1, {"endpoint": f"e{i % 5}", "user_ip": f"10.0.0.{i}"})
+    metrics.histogram("latency", 7, {"endpoint": "e0"}, buckets=(5, 10))
+    metrics.histogram("latency", 70, {"endpoint": "e0"}, buckets=(5, 10))
+    metrics.flush()
+
+    payload = sent[0]
+    hits = [p for p in payload["counter"] if p["metric"] == "hits"]
+    assert sum(p["value"] for p in hits) == 50
+    assert all("user_ip" not in p["dimensions"] for p in hits)
+    assert {p["dimensions"]["endpoint"] for p in hits} == {"e0", "e1", OTHER_LABEL}
+    buckets = {p["dimensions"]["le"]: p["value"] for p in payload["counter"] if p["metric"] == "latency.bucket"}
+    assert buckets == {"5": 0, "10": 1, "+Inf": 2}
+
+    metrics.flush()
+    assert len(sent) == 1  # empty intervals send nothing
+
+
+def test_timeseries_store_rings_and_downsampling():
+    """Test observations land in both resolutions and stale slots are not reported"""
+    from timeseries import TimeSeriesStore
+
+    store = TimeSeriesStore(resolutions=((1, 10), (60, 5)))
+    base = 1_000_020.0
+    for offset, value in [(0, 10), (0, 30), (1, 5), (2, 100)]:
+        store.record("http", value, timestamp=base + offset)
+
+    fine = store.query("http", step=1, window=3, now=base + 2)
+    assert fine["count"] == [2, 1, 1]
+    assert fine["mean"] == [20.0, 5.0, 100.0]
+    assert fine["max"] == [30.0, 5.0, 100.0]
+
+    coarse = store.query("http", step=60, window=60, now=base + 2)
+    assert coarse["count"] == [4]
+
+    # Ten seconds later the 1s ring has wrapped past those buckets
+    assert sum(store.query("http", step=1, window=10, now=base + 12)["count"]) == 0
+
+
+def test_metrics_timeseries_endpoint(client):
+    """Test the time-series endpoint serves request history"""
+    client.get("/")
+    response = client.get("/metrics/timeseries?series=http&resolution=1s&window=60")
+    assert response.status_code == 200
+    data = response.get_json()
+    assert len(data["count"]) == 60
+    assert sum(data["count"]) >= 1
+    assert client.get("/metrics/timeseries?series=http&resolution=5m").status_code == 404
+
+
+def test_metrics_broadcaster_shares_snapshot_and_sends_deltas():
+    """Test subscribers get a full snapshot first and then only changed keys"""
+    from live_metrics import MetricsBroadcaster
+
+    values = {"requests_total": 1, "cpu_percent": 10.0}
+    broadcaster = MetricsBroadcaster(lambda: dict(values), interval=3600, heartbeat=0.05)
+    first, second = broadcaster._events(), broadcaster._events()
+
+    snapshot = next(first).decode()
+    assert "event: snapshot" in snapshot and '"cpu_percent":10.0' in snapshot
+    assert "event: snapshot" in next(second).decode()
+    assert broadcaster.subscribers == 2
+
+    values["requests_total"] = 2
+    broadcaster.tick()
+    delta = next(first).decode()
+    assert "event: delta" in delta
+    assert '"requests_total":2' in delta and "cpu_percent" not in delta
+    assert next(second) == delta.encode()  # same pre-encoded bytes for every viewer
+    assert next(first) == b": keepalive\n\n"
+
+    first.close()
+    second.close()
+    assert broadcaster.subscribers == 0
+
+
+def test_dashboard_is_static_shell(client):
+    """Test the dashboard no longer meta-refreshes and subscribes to the stream"""
+    response = client.get("/dashboard")
+    assert response.status_code == 200
+    assert b'http-equiv="refresh"' not in response.data
+    assert b"/metrics/stream" in response.data
+    # Los gráficos se alimentan del mismo stream: nada de sondeo periódico a /metrics/timeseries
+    assert b"setInterval" not in response.data and b"/metrics/timeseries" not in response.data
+
+    import app as backend_app
+
+    client.get("/health")
+    snapshot = backend_app.live_snapshot()
+    assert len(snapshot["chart_rate"]) == len(snapshot["chart_latency"]) == 900
+    assert sum(snapshot["chart_rate"]) > 0
+
+
+def test_latency_sketches_merge_across_processes_and_windows(tmp_path):
+    """Test sketches stay within accuracy, merge across workers and age out of windows"""
+    import random
+    from sketches import LogHistogram, RollingQuantiles
+
+    rng = random.Random(7)
+    values = sorted(rng.lognormvariate(3, 1) for _ in range(20000))
+    sketch = LogHistogram(relative_accuracy=0.01)
+    for v in values:
+        sketch.record(v)
+    true_p99 = values[int(0.99 * (len(values) - 1))]
+    assert abs(sketch.quantile(0.99) - true_p99) / true_p99 <= 0.011
+
+    now = time.time()
+    worker_a = RollingQuantiles(shared_dir=str(tmp_path), prefix="backend")
+    worker_b = RollingQuantiles(shared_dir=str(tmp_path), prefix="backend")
+    worker_a.record("predict", 10.0, now=now)
+    worker_a.record("predict", 20.0, now=now - 4 * 60)
+    worker_b.record("predict", 1000.0, now=now - 10 * 60)
+    worker_b.publish()
+    # Distinto pid simulado: el archivo del worker B se renombra
+    os.replace(os.path.join(tmp_path, f"backend-{os.getpid()}.json"), os.path.join(tmp_path, "backend-999999.json"))
+
+    report = worker_a.report(now=now)["predict"]
+    assert [report[w]["count"] for w in ("1m", "5m", "15m")] == [1, 2, 3]
+    assert report["15m"]["max"] == 1000.0
+    assert abs(report["1m"]["p99"] - 10.0) <= 0.1
+
+    # Recién empezado un minuto, "1m" sigue cubriendo el minuto anterior (slots de 10 s, no de 60 s)
+    minute_start = (int(now) // 60 + 1) * 60 + 1
+    sliding = RollingQuantiles()
+    for seconds_ago in (0, 30, 45, 75):
+        sliding.record("predict", 10.0 + seconds_ago, now=minute_start - seconds_ago)
+    windows = sliding.report(now=minute_start)["predict"]
+    assert windows["1m"]["count"] == 3 and windows["1m"]["max"] == 55.0
+    assert windows["5m"]["count"] == 4
+
+
+def test_metrics_json_reports_latency_percentiles(client):
+    """Test /metrics/json exposes per-endpoint percentiles for every window"""
+    client.get("/")
+    data = client.get("/metrics/json").get_json()
+    assert set(data["latency_ms"]["home"]) == {"1m", "5m", "15m"}
+    assert data["latency_ms"]["home"]["1m"]["count"] >= 1
+    assert "p99" in data["latency_ms"]["home"]["15m"]
+
+
+def test_traffic_recorder_captures_and_reads_back_requests(client, tmp_path, monkeypatch):
+    """Test sampled requests are written off-thread and read back in order, with rotation"""
+    import app as backend_app
+    from traffic_recorder import TrafficRecorder, read_traffic
+
+    recorder = TrafficRecorder(str(tmp_path), sample_rate=1.0, prefix="backend", max_file_bytes=1, max_files=2)
+    monkeypatch.setattr(backend_app, "traffic_recorder", recorder)
+    params = "model_year=2020&age=4&fuel_type=Gasoline&transmission=Automatic&clean_title=1"
+    client.get(f"/current_value_market?{params}")
+    client.post("/what_if", json={"base": {"model_year": 2018}, "sweep": {}})
+    client.get("/metrics/json")  # Tráfico de monitoreo: nunca se captura
+    recorder.stop()
+
+    records = list(read_traffic([str(tmp_path)]))
+    assert [r["path"] for r in records] == ["/current_value_market", "/what_if"]
+    assert records[0]["query"] == params
+    assert "current_value_market_estimado" in json.loads(records[0]["response"])
+    assert json.loads(records[1]["body"]) == {"base": {"model_year": 2018}, "sweep": {}}
+    assert records[1]["headers"]["Content-Type"] == "application/json"
+    assert len(list(tmp_path.glob("backend-*.bin.gz"))) == 2
+
+
+def test_model_registry_lazy_loading_sharing_and_budget(tmp_path):
+    """Test models load on first use, identical artifacts share one object and cold ones are unloaded"""
+    from model_registry import ModelRegistry, UnknownModel
+
+    class DummyModel:
+        def predict(self, frame):
+            return [1.0] * len(frame)
+
+    loads = []
+
+    def loader(path, mmap_mode=None):
+        loads.append(os.path.basename(path))
+        return DummyModel()
+
+    for name, fill in [("a", b"a"), ("b", b"b"), ("c", b"c"), ("a_copy", b"a")]:
+        (tmp_path / f"{name}.joblib").write_bytes(fill * (1024 * 1024))
+    registry = ModelRegistry.from_directory(
+        str(tmp_path), default="a", memory_budget_bytes=int(2.5 * 1024 * 1024), loader=loader
+    )
+    assert loads == []
+
+    assert registry.get("a_copy").model is registry.get("a").model
+    assert loads == ["a_copy.joblib"]
+    registry.get("b")
+    registry.get("c")  # Supera el presupuesto: se descarga el modelo frío que no es el por defecto
+    stats = registry.stats()["models"]
+    assert stats["a"]["loaded"] and stats["c"]["loaded"]
+    assert not stats["b"]["loaded"]
+    # a_copy también se descarta, pero su memoria sigue contando a nombre de "a"
+    assert not stats["a_copy"]["loaded"] and stats["a"]["memory_mb"] >= 1
+    assert registry.loaded_bytes() <= registry.memory_budget_bytes
+    with pytest.raises(UnknownModel):
+        registry.get("missing")
+
+    # Un modelo arrendado por una petición en curso no se descarga aunque se pase del presupuesto
+    leased = registry.acquire("c")
+    model = leased.model
+    registry.get("b")
+    assert leased.loaded and leased.model is model
+    registry.release(leased)
+    registry.get("a_copy")
+    assert not registry.entries["c"].loaded and registry.evictions >= 3
+
+
+def test_model_selection_by_header_and_query(client):
+    """Test requests route to a named model and per-model stats reach /metrics/json"""
+    params = "model_year=2020&age=4&fuel_type=Gasoline&transmission=Automatic&clean_title=1"
+    assert client.get(f"/current_value_market?{params}", headers={"X-Model": "modelo"}).status_code == 200
+    unknown = client.get(f"/current_value_market?{params}&model=regional-eu")
+    assert unknown.status_code == 404
+    assert unknown.get_json()["disponibles"] == ["modelo"]
+
+    models = client.get("/metrics/json").get_json()["models"]
+    assert models["default"] == "modelo"
+    assert models["models"]["modelo"]["requests"] >= 1
+    assert models["models"]["modelo"]["latency_ms"]["1m"]["count"] >= 1
+
+
+def test_expired_deadline_is_shed_before_parse(client):
+    """Test an already expired deadline gets 504 and is counted as shed"""
+    params = "model_year=2020&age=4&fuel_type=Gasoline&transmission=Automatic&clean_title=1"
+    before = client.get("/metrics/json").get_json()["requests_shed"]["parse"]
+
+    expired = {"X-Request-Deadline": str(int((time.time() - 1) * 1000))}
+    response = client.get(f"/current_value_market?{params}", headers=expired)
+    assert response.status_code == 504
+    assert response.get_json()["etapa"] == "parse"
+    assert client.get("/metrics/json").get_json()["requests_shed"]["parse"] == before + 1
+
+    alive = {"X-Request-Deadline": str(int((time.time() + 30) * 1000))}
+    assert client.get(f"/current_value_market?{params}", headers=alive).status_code == 200
+
+
+def test_deadline_expiring_before_storage_skips_write(client, monkeypatch):
+    """Test work that expires after predicting is not stored and can be retried"""
+    import app as backend_app
+    from flask import g
+
+    def slow_prediction(data):
+        g.deadline = time.time() - 0.001  # El llamador se rindió mientras se predecía
+        return 1.0
+
+    monkeypatch.setattr(backend_app, "predict_price", slow_prediction)
+    payload = {"model_year": 2019, "age": 5, "fuel_type": "Hybrid", "transmission": "CVT", "clean_title": 1, "precio": 12345}
+    stored = len(backend_app.vehicle_store.load())
+    response = client.post("/publish_car", json=payload, headers={"Idempotency-Key": "deadline-storage"})
+    assert response.status_code == 504
+    assert response.get_json()["etapa"] == "storage"
+    assert len(backend_app.vehicle_store.load()) == stored
+
+    monkeypatch.undo()
+    retry = client.post("/publish_car", json=payload, headers={"Idempotency-Key": "deadline-storage"})
+    assert retry.status_code == 201
+
+
+def test_admission_controller_rate_capacity_and_priorities():
+    """Test token buckets answer 429, the concurrency limit 503 and batch traffic gets a reduced share"""
+    from admission import BATCH, AdmissionController, Rejected
+
+    controller = AdmissionController(rate=1.0, burst=2, initial_limit=8, min_limit=1, batch_share=0.25)
+    tickets = [controller.admit("client-a", now=0.0), controller.admit("client-a", now=0.0)]
+    with pytest.raises(Rejected) as rate_limited:
+        controller.admit("client-a", now=0.0)
+    assert (rate_limited.value.status, rate_limited.value.retry_after) == (429, 1)
+    tickets.append(controller.admit("client-a", now=1.0))  # Un token repuesto tras 1 s
+
+    with pytest.raises(Rejected):
+        controller.admit("client-a", BATCH, now=1.0, rate_limited=True)  # Bajar a batch no esquiva la cubeta
+    tickets += [controller.admit("batch-job", BATCH, now=1.0) for _ in range(2)]
+    with pytest.raises(Rejected) as over_share:
+        controller.admit("batch-job", BATCH, now=1.0)  # Batch: máximo 2 de 8 plazas
+    assert over_share.value.status == 503
+
+    tickets += [controller.admit(f"client-{i}", now=1.0) for i in range(3)]
+    # Sin plazas libres: un cliente nuevo recibe 503 al instante en vez de esperar en cola
+    with pytest.raises(Rejected) as full:
+        controller.admit("client-z", now=1.0)
+    assert full.value.status == 503
+
+    for ticket in tickets:
+        controller.release(ticket, 0.01)
+    limit_before = controller.limiter.limit
+    for _ in range(50):
+        controller.limiter.update(0.5, inflight=int(controller.limiter.limit))
+    assert controller.limiter.limit < limit_before
+
+
+def test_admission_rejects_fast_with_retry_after_but_not_health(client, monkeypatch):
+    """Test guarded routes get 429 + Retry-After while /health bypasses admission"""
+    import app as backend_app
+    from admission import AdmissionController
+
+    monkeypatch.setattr(backend_app, "admission", AdmissionController(rate=0.5, burst=1))
+    params = "model_year=2020&age=4&fuel_type=Gasoline&transmission=Automatic&clean_title=1"
+    assert client.get(f"/current_value_market?{params}").status_code == 200
+    rejected = client.get(f"/current_value_market?{params}")
+    assert rejected.status_code == 429
+    assert rejected.headers["Retry-After"] == "2"
+    assert client.get("/health").status_code == 200
+    stats = client.get("/metrics/json").get_json()["admission"]
+    assert stats["rejected"]["rate_limited"] == 1
+    assert stats["inflight"] == {"interactive": 0, "batch": 0}
+
+
+def test_admission_buckets_follow_forwarded_users_and_ignore_batch_header(client, monkeypatch):
+    """Test users behind the frontend get their own bucket and X-Traffic-Class: batch still pays for it"""
+    import app as backend_app
+    from admission import AdmissionController
+
+    monkeypatch.setattr(backend_app, "admission", AdmissionController(rate=0.5, burst=1))
+    params = "model_year=2020&age=4&fuel_type=Gasoline&transmission=Automatic&clean_title=1"
+    user_a, user_b = {"X-Forwarded-For": "203.0.113.7"}, {"X-Forwarded-For": "203.0.113.8"}
+    assert client.get(f"/current_value_market?{params}", headers=user_a).status_code == 200
+    # El test client llega desde 127.0.0.1 (proxy de confianza): cada usuario reenviado tiene su cubeta
+    assert client.get(f"/current_value_market?{params}", headers=user_b).status_code == 200
+    downgraded = client.get(f"/current_value_market?{params}", headers={**user_a, "X-Traffic-Class": "batch"})
+    assert downgraded.status_code == 429
+
+    # Un cliente de la LAN no es proxy de confianza: inventar X-Forwarded-For no le da cubetas nuevas
+    peer = {"REMOTE_ADDR": "192.168.1.50"}
+    spoofed = [{"X-Forwarded-For": f"203.0.113.{i}"} for i in (20, 21)]
+    assert client.get(f"/current_value_market?{params}", headers=spoofed[0], environ_base=peer).status_code == 200
+    assert client.get(f"/current_value_market?{params}", headers=spoofed[1], environ_base=peer).status_code == 429
+    with client.application.test_request_context(headers=spoofed[1], environ_base=peer):
+        assert backend_app.client_id() == "192.168.1.50"
+
+    # Detrás del proxy se toma el primer salto no confiable por la derecha, no el que escribe el cliente
+    chained = {"X-Forwarded-For": "10.9.9.9, 198.51.100.4, 127.0.0.1"}
+    with client.application.test_request_context(headers=chained, environ_base={"REMOTE_ADDR": "127.0.0.1"}):
+        assert backend_app.client_id() == "198.51.100.4"
+
+
+def test_compression_streams_large_bodies_and_skips_small_ones(client):
+    """Test large responses are gzipped chunk by chunk while small or SSE ones pass through"""
+    import gzip
+    import zlib
+    from compression import CompressionMiddleware
+
+    rows = [json.dumps({"id": i, "fuel_type": "Gasoline", "precio": 20000 + i}).encode() + b"\n" for i in range(200)]
+
+    def streaming_app(environ, start_response):
+        content_type = environ.get("QUERY_STRING") or "application/x-ndjson"
+        start_response("200 OK", [("Content-Type", content_type)])
+        return iter(rows)
+
+    middleware = CompressionMiddleware(streaming_app, level=6, min_size=512)
+    captured = {}
+
+    def start_response(status, headers, exc_info=None):
+        captured["headers"] = dict(headers)
+
+    environ = {"REQUEST_METHOD": "GET", "HTTP_ACCEPT_ENCODING": "gzip, deflate"}
+    chunks = list(middleware(environ, start_response))
+    assert captured["headers"]["Content-Encoding"] == "gzip"
+    assert len(chunks) > 2  # sigue en streaming: un trozo comprimido por trozo de la app
+    # Cada trozo es decodificable al llegar, sin esperar al final
+    assert zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(chunks[0]).startswith(rows[0])
+    assert gzip.decompress(b"".join(chunks)) == b"".join(rows)
+    assert middleware.stats()["ratio"] < 0.5
+
+    list(middleware(dict(environ, QUERY_STRING="text/event-stream"), start_response))
+    assert "Content-Encoding" not in captured["headers"]
+
+    compressed = client.get("/metrics/json", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in compressed.headers["Vary"]
+    assert "service" in json.loads(gzip.decompress(compressed.data))
+    small = client.get("/health", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in small.headers
+
+
+def test_sharded_store_allocates_unique_ids_and_rebalances(tmp_path):
+    """Test sharded publishes get globally unique ids that survive a change in shard count"""
+    import threading
+    from vehicle_store import ShardedVehicleStore, open_store, rebalance
+
+    db_path = str(tmp_path / "vehiculos.json")
+    with open(db_path, "w") as f:
+        json.dump([{"id": i, "fuel_type": "Diesel" if i % 3 == 0 else "Gasoline"} for i in range(1, 13)], f)
+
+    store = open_store(db_path, shards=4)
+    assert isinstance(store, ShardedVehicleStore)
+    assert len(store.load()) == 12  # el archivo único se importa al crear los shards
+
+    def publish_many():
+        for _ in range(25):
+            store.publish({"fuel_type": "Hybrid"})
+
+    threads = [threading.Thread(target=publish_many) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    ids = [v["id"] for v in store.load()]
+    assert len(ids) == len(set(ids)) == 112
+    assert all(store.get(i)["id"] == i for i in ids[::7])
+
+    # Scatter-gather: páginas ordenadas por id y filtradas en todos los shards
+    page = store.query(lambda v: v["fuel_type"] == "Diesel", limit=3)
+    assert [v["id"] for v in page] == [3, 6, 9]
+    assert [v["id"] for v in store.query(after_id=9, limit=2)] == [10, 11]
+
+    stats = rebalance(store.directory, 7)
+    assert stats["listings"] == 112 and stats["shards_after"] == 7
+    assert store.shards == 7
+    assert sorted(v["id"] for v in store.load()) == sorted(ids)
+    nuevos = [store.publish({"fuel_type": "Electric"}) for _ in range(14)]
+    assert not set(nuevos) & set(ids)
+    assert store.update_many({nuevos[0]: {"precio": 1}, ids[0]: {"precio": 2}}) == 2
+    assert store.get(nuevos[0])["precio"] == 1
+
+    # Un rebalanceo espera a que termine un recorrido en curso en vez de borrarle la generación
+    scan = store.iter_listings()
+    first = next(scan)
+    rebalancing = threading.Thread(target=rebalance, args=(store.directory, 3))
+    rebalancing.start()
+    rebalancing.join(0.3)
+    assert rebalancing.is_alive()
+    assert 1 + sum(1 for _ in scan) == len(ids) + len(nuevos) and first["id"] in ids + nuevos
+    rebalancing.join(5)
+    assert not rebalancing.is_alive() and store.shards == 3
+
+
+def test_list_vehicles_pages_by_id(client):
+    """Test /vehicles returns id-ordered pages with a cursor and validates limit"""
+    client.post(
+        "/publish_car",
+        json={"model_year": 2019, "age": 5, "fuel_type": "Diesel", "transmission": "Manual", "clean_title": 1, "precio": 9000},
+    )
+    first = client.get("/vehicles?limit=1").get_json()
+    assert first["cantidad"] == 1
+    second = client.get(f"/vehicles?limit=1&after_id={first['siguiente_after_id']}").get_json()
+    assert second["vehiculos"][0]["id"] > first["vehiculos"][0]["id"]
+    diesel = client.get("/vehicles?fuel_type=Diesel&limit=500").get_json()["vehiculos"]
+    assert diesel and all(v["fuel_type"] == "Diesel" for v in diesel)
+    assert client.get("/vehicles?limit=0").status_code == 400
+
+
+def test_backfill_updates_reach_vehicles_and_market_stats(client):
+    """Test a backfill's rewritten prices show up in /vehicles and /market/stats without a restart"""
+    import app as backend_app
+    from backfill import run_backfill
+
+    vehicle = {"brand_model": "Quill Ember", "model_year": 2023, "age": 2, "fuel_type": "Ammonia", "transmission": "Manual"}
+    vehiculo_id = client.post("/publish_car", json=dict(vehicle, clean_title=1, precio=41000)).get_json()["vehiculo_id"]
+    scored = client.get("/vehicles?fuel_type=Ammonia").get_json()["vehiculos"][0]
+
+    # Un backfill anterior dejó otro precio: el almacén y el feed lo registran, la tabla lo aplica por id
+    stale = {"precio_recomendado_modelo": 1.0, "modelo_version": "viejo"}
+    backend_app.vehicle_store.update_many({vehiculo_id: stale})
+    backend_app.change_feed.append("update", vehiculo_id, stale)
+    row = client.get("/vehicles?fuel_type=Ammonia").get_json()["vehiculos"][0]
+    assert row["precio_recomendado_modelo"] == 1.0 and row["modelo_version"] == "viejo" and row["precio"] == 41000
+    assert client.get("/market/stats?fuel_type=Ammonia").get_json()["precio_recomendado_modelo"]["min"] == 1.0
+
+    stats = run_backfill(backend_app.DB_FILE, os.environ["MODEL_PATH"], workers=1, chunk_size=50, force=True)
+    assert stats["rows_updated"] >= 1
+    row = client.get("/vehicles?fuel_type=Ammonia").get_json()["vehiculos"][0]
+    assert row["modelo_version"] == stats["modelo_version"]
+    assert row["precio_recomendado_modelo"] == scored["precio_recomendado_modelo"]
+    market = client.get("/market/stats?fuel_type=Ammonia").get_json()
+    assert market["precio_recomendado_modelo"]["min"] == pytest.approx(scored["precio_recomendado_modelo"], rel=0.02)
+    assert market["precio"]["count"] == 1
+
+
+def test_change_feed_resumes_from_offset_and_long_polls(client):
+    """Test publishes land in the change log and consumers resume from their last offset"""
+    import threading
+
+    since = client.get("/vehicles/changes?wait=0").get_json()["ultimo_offset"]
+    vehicle = {"model_year": 2021, "age": 3, "fuel_type": "Electric", "transmission": "Automatic", "clean_title": 1}
+    ids = [client.post("/publish_car", json=dict(vehicle, precio=30000 + i)).get_json()["vehiculo_id"] for i in range(3)]
+
+    page = client.get(f"/vehicles/changes?since={since}&limit=2&wait=0").get_json()
+    assert [c["id"] for c in page["cambios"]] == ids[:2]
+    assert [c["offset"] for c in page["cambios"]] == [since + 1, since + 2]
+    rest = client.get(f"/vehicles/changes?since={page['siguiente_since']}&wait=0").get_json()
+    assert [c["id"] for c in rest["cambios"]] == ids[2:]
+    assert rest["cambios"][0]["vehiculo"]["precio"] == 30002
+
+    # Long-poll: la respuesta llega en cuanto se publica, sin esperar al timeout
+    from app import change_feed
+
+    timer = threading.Timer(0.2, change_feed.append, args=("publish", -1, {"precio": 1}))
+    timer.start()
+    started = time.time()
+    waited = client.get(f"/vehicles/changes?since={rest['siguiente_since']}&wait=10").get_json()
+    assert [c["id"] for c in waited["cambios"]] == [-1]
+    assert time.time() - started < 5
+
+    stream = client.get(f"/vehicles/changes?since={since}", headers={"Accept": "text/event-stream"}, buffered=False)
+    chunks = stream.response
+    assert next(chunks).startswith(b"retry:")
+    assert next(chunks).startswith(f"id: {since + 1}\nevent: publish\n".encode())
+    stream.close()
+    assert change_feed.streams == 0
+    # Un cliente que se va antes del primer evento también libera su plaza
+    client.get("/vehicles/changes?stream=sse", buffered=False).close()
+    assert change_feed.streams == 0
+    assert client.get("/vehicles/changes?since=-1").status_code == 400
+
+
+def test_vehicle_table_round_trips_listings_and_filters_vectorized(tmp_path):
+    """Test the columnar table reproduces listings, keeps odd values and catches up from the feed"""
+    from change_feed import ChangeFeed
+    from vehicle_store import JsonVehicleStore
+    from vehicle_table import VehicleTable
+
+    listings = [
+        {"id": 1, "brand_model": "Toyota Corolla", "model_year": 2018, "kilometers_driven": 60000, "fuel_type": "Petrol"},
+        {"id": 2, "model_year": 2020, "age": 4, "fuel_type": "Diesel", "transmission": "Manual", "clean_title": "1"},
+        {"id": 3, "model_year": 2021, "fuel_type": "Diesel", "precio": 12345.67, "color": "rojo", "mileage": 18.3},
+    ]
+    store = JsonVehicleStore(str(tmp_path / "vehiculos.json"))
+    for listing in listings:
+        store.publish(dict(listing))
+    feed = ChangeFeed(str(tmp_path / "changes.jsonl"))
+    table = VehicleTable.from_store(store, feed)
+
+    assert [row.to_dict() for row in table] == listings
+    assert table[1]["clean_title"] == "1"  # tipo inesperado: se conserva tal cual
+    assert "age" not in table[0] and table[2]["color"] == "rojo"
+    codes, categories = table.categorical("fuel_type")
+    assert categories == ["Petrol", "Diesel"] and codes.tolist() == [0, 1, 1]
+    assert table.mask(fuel_type="Diesel", model_year=2021).tolist() == [False, False, True]
+    assert [v["id"] for v in table.query(fuel_type="Diesel", limit=1)] == [2]
+    assert table.query(fuel_type="Electric") == []
+
+    # Lo publicado tras la carga llega por el feed; lo ya cargado no se duplica
+    feed.append("publish", 3, listings[2])
+    feed.append("publish", 4, {"model_year": 2022, "fuel_type": "Electric"})
+    assert table.catch_up(feed) == 1
+    assert table.query(after_id=3)[0] == {"id": 4, "model_year": 2022, "fuel_type": "Electric"}
+    assert table.nbytes() < 100 * len(table)
+
+
+def test_suggest_index_ranks_prefix_matches_by_count():
+    """Test the trie matches any word prefix case-insensitively and keeps top-K exact on updates"""
+    from suggest_index import SuggestIndex
+
+    index = SuggestIndex.from_counts(
+        [("Toyota Corolla", 5), ("Toyota Camry", 3), ("Tesla Model 3", 4), ("Honda Civic", 9)], top_k=2
+    )
+    assert index.suggest("toy") == [{"brand_model": "Toyota Corolla", "count": 5}, {"brand_model": "Toyota Camry", "count": 3}]
+    assert [s["brand_model"] for s in index.suggest("T")] == ["Toyota Corolla", "Tesla Model 3"]
+    assert [s["brand_model"] for s in index.suggest("  COR")] == ["Toyota Corolla"]  # inicio de la segunda palabra
+    assert index.suggest("toyota c", limit=1)[0]["brand_model"] == "Toyota Corolla"
+    assert index.suggest("zz") == []
+
+    # Camry supera a Corolla y a Tesla: entra en el top-K de cada nodo de su camino
+    index.add("toyota camry", 4)
+    assert [s["brand_model"] for s in index.suggest("t")] == ["Toyota Camry", "Toyota Corolla"]
+    assert index.suggest("")[0] == {"brand_model": "Honda Civic", "count": 9}
+
+
+class RacingStore:
+    """Store whose scan lets a publish already in storage reach the change feed mid-load."""
+
+    def __init__(self, store, feed, racing_id):
+        self.store, self.feed, self.racing_id = store, feed, racing_id
+
+    def iter_listings(self):
+        for i, listing in enumerate(self.store.iter_listings()):
+            if i == 1:
+                racing = self.store.get(self.racing_id)
+                self.feed.append("publish", self.racing_id, racing)
+            yield listing
+
+
+def test_suggest_index_from_store_skips_listings_already_loaded(tmp_path):
+    """Test a publish that races the store load is counted once, not again from the feed"""
+    from change_feed import ChangeFeed
+    from suggest_index import SuggestIndex
+    from vehicle_store import JsonVehicleStore
+
+    store = JsonVehicleStore(str(tmp_path / "vehiculos.json"))
+    for model in ("Toyota Corolla", "Toyota Camry"):
+        store.publish({"brand_model": model})
+    feed = ChangeFeed(str(tmp_path / "changes.jsonl"))
+    # El id 2 ya estaba en el almacén al cargar, pero su entrada llegó al feed después del offset inicial
+    index = SuggestIndex.from_store(RacingStore(store, feed, 2), feed)
+    assert index.offset == 0 and index.loaded.ids == {2} and index.loaded.until == 1
+
+    feed.append("publish", 3, {"id": 3, "brand_model": "Toyota Camry"})
+    assert index.catch_up(feed) == 1
+    assert index.suggest("toyota") == [
+        {"brand_model": "Toyota Camry", "count": 2},
+        {"brand_model": "Toyota Corolla", "count": 1},
+    ]
+    # Pasado el fin de la carga no queda ningún id retenido
+    assert index.loaded.ids == set()
+
+
+def test_suggest_endpoint_sees_new_publishes(client):
+    """Test /vehicles/suggest picks up a publish through the change feed"""
+    vehicle = {"model_year": 2022, "age": 2, "fuel_type": "Electric", "transmission": "Automatic", "clean_title": 1}
+    client.post("/publish_car", json=dict(vehicle, brand_model="Zentrix Volt", precio=41000))
+    response = client.get("/vehicles/suggest?q=zen")
+    assert response.status_code == 200
+    assert response.get_json()["sugerencias"] == [{"brand_model": "Zentrix Volt", "count": 1}]
+    assert client.get("/vehicles/suggest?q=volt&limit=0").status_code == 400
+
+
+def test_market_stats_rollups_and_merge_match_exact_statistics():
+    """Test segment aggregates equal the exact moments and merging partial views loses nothing"""
+    import statistics
+
+    from market_stats import MarketStats
+
+    listings = [
+        {"fuel_type": f, "transmission": t, "model_year": y, "precio": p, "precio_recomendado_modelo": p * 0.9}
+        for f, t, y, p in [
+            ("Petrol", "Manual", 2018, 9000),
+            ("Petrol", "Manual", 2018, 11000),
+            ("Petrol", "Automatic", 2018, 15000),
+            ("Diesel", "Manual", 2020, 18000),
+            ("Diesel", "Manual", "2020", 20000),
+        ]
+    ]
+    listings.append({"fuel_type": "Petrol", "transmission": "Manual", "precio": 7000})  # sin año: sólo en agregados
+    market = MarketStats.from_listings(listings)
+
+    petrol = market.get(fuel_type="Petrol")
+    precios = [9000, 11000, 15000, 7000]
+    assert petrol["precio"]["count"] == 4
+    assert petrol["precio"]["mean"] == statistics.mean(precios)
+    assert petrol["precio"]["std"] == round(statistics.stdev(precios), 2)
+    assert abs(petrol["precio"]["p50"] - statistics.median(precios)) / statistics.median(precios) < 0.2
+    assert petrol["precio_recomendado_modelo"]["count"] == 3
+    assert market.get(fuel_type="Diesel", model_year=2020)["precio"]["count"] == 2
+    assert market.get(fuel_type="Petrol", model_year=2020) is None
+
+    years = market.breakdown(["model_year"], fuel_type="Petrol")
+    assert [(s["segmento"]["model_year"], s["precio"]["count"]) for s in years] == [(2018, 3)]
+
+    halves = MarketStats.from_listings(listings[:3]).merge(MarketStats.from_listings(listings[3:]))
+    assert halves.get() == market.get()
+
+
+def test_market_stats_from_store_skips_listings_already_loaded(tmp_path):
+    """Test a publish that races the store load is aggregated once, not again from the feed"""
+    from change_feed import ChangeFeed
+    from market_stats import MarketStats
+    from vehicle_store import JsonVehicleStore
+
+    store = JsonVehicleStore(str(tmp_path / "vehiculos.json"))
+    for price in (9000, 11000):
+        store.publish({"fuel_type": "Petrol", "transmission": "Manual", "model_year": 2018, "precio": price})
+    feed = ChangeFeed(str(tmp_path / "changes.jsonl"))
+    # El id 2 ya estaba en el almacén al cargar, pero su entrada llegó al feed después del offset inicial
+    market = MarketStats.from_store(RacingStore(store, feed, 2), feed)
+    assert market.loaded.ids == {2}
+
+    feed.append("publish", 3, {"id": 3, "fuel_type": "Petrol", "transmission": "Manual", "model_year": 2018, "precio": 13000})
+    assert market.catch_up(feed) == 1
+    assert market.get()["precio"]["count"] == 3
+    assert market.get()["precio"]["mean"] == 11000
+    assert market.loaded.ids == set()
+
+
+def test_market_stats_endpoint_sees_new_publishes(client):
+    """Test /market/stats picks up a publish through the change feed and validates its parameters"""
+    vehicle = {"brand_model": "Zentrix Volt", "age": 1, "fuel_type": "Hydrogen", "transmission": "Automatic", "clean_title": 1}
+    client.post("/publish_car", json=dict(vehicle, model_year=2024, precio=52000))
+    response = client.get("/market/stats?fuel_type=Hydrogen&group_by=model_year")
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["segmento"] == {"fuel_type": "Hydrogen", "transmission": "*", "model_year": "*"}
+    assert data["precio"]["count"] == 1 and data["precio"]["mean"] == 52000
+    assert [s["segmento"]["model_year"] for s in data["segmentos"]] == [2024]
+    assert client.get("/market/stats?fuel_type=Steam").status_code == 404
+    assert client.get("/market/stats?group_by=color").status_code == 400
+    assert client.get("/market/stats?model_year=new").status_code == 400
+
+
+def test_drift_monitor_scores_shifted_inputs_against_reference_profile():
+    """Test a matching stream scores stable while a shifted one is flagged, including unseen categories"""
+    import pandas as pd
+
+    from drift_monitor import CountMinSketch, DriftMonitor, build_profile
+
+    reference = pd.DataFrame(
+        {
+            "model_year": [2010 + i % 12 for i in range(1200)],
+            "age": [i % 12 for i in range(1200)],
+            "fuel_type": ["Gasoline", "Diesel", "Hybrid"] * 400,
+            "transmission": ["Automatic", "Manual"] * 600,
+            "clean_title": [1, 1, 0] * 400,
+        }
+    )
+    profile = build_profile([reference.iloc[:500], reference.iloc[500:]], bins=4)
+    assert profile["rows"] == 1200
+    assert len(profile["numeric"]["model_year"]["edges"]) == 3
+    assert profile["categorical"]["clean_title"] == {"1": pytest.approx(2 / 3, abs=1e-5), "0": pytest.approx(1 / 3, abs=1e-5)}
+
+    stable = DriftMonitor(profile, min_samples=100)
+    assert stable.evaluate()["status"] == "warming_up"
+    for record in reference.to_dict("records"):
+        stable.observe(record)
+    report = stable.evaluate()
+    assert report["status"] == "stable" and report["psi_max"] < 0.01
+    assert report["features"]["model_year"]["ks"] < 0.01
+
+    shifted = DriftMonitor(profile, min_samples=100)
+    for i in range(600):
+        shifted.observe(
+            {"model_year": 2021, "age": 1, "fuel_type": "Electric", "transmission": "Automatic", "clean_title": 1.0}
+        )
+    features = shifted.evaluate()["features"]
+    assert features["model_year"]["severity"] == "significant" and features["model_year"]["ks"] > 0.5
+    assert features["fuel_type"]["unseen_share"] == 1.0
+    assert features["clean_title"]["unseen_share"] == 0.0  # 1.0 y 1 son la misma categoría
+
+    sketch = CountMinSketch(width=64, depth=4)
+    for i in range(1000):
+        sketch.add(f"k{i % 50}")
+    assert all(20 <= sketch.estimate(f"k{i}") <= 20 + 1000 * 2.72 / 64 for i in range(50))
+
+
+def test_current_value_market_feeds_drift_monitor(client, monkeypatch):
+    """Test predictions are observed by the drift monitor and its report reaches /metrics/json"""
+    import app as backend_app
+    from drift_monitor import DriftMonitor
+
+    profile = {
+        "version": 1,
+        "rows": 10,
+        "numeric": {"age": {"edges": [5.0], "shares": [0.5, 0.5]}},
+        "categorical": {"fuel_type": {"Gasoline": 1.0}},
+    }
+    monitor = DriftMonitor(profile, min_samples=1)
+    monkeypatch.setattr(backend_app, "drift_monitor", monitor)
+    client.get("/current_value_market?model_year=2020&age=4&fuel_type=Gasoline&transmission=Automatic&clean_title=1")
+    monitor.evaluate()
+    drift = client.get("/metrics/json").get_json()["drift"]
+    assert drift["samples"] == 1
+    assert drift["features"]["fuel_type"]["unseen_share"] == 0.0
+    assert drift["features"]["age"]["samples"] == 1
+
+
+def test_thread_budget_splits_cgroup_quota_and_caps_model_threads(tmp_path, monkeypatch):
+    """Test the budget honours the cgroup quota, divides it across workers and sets n_jobs on every estimator"""
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    import thread_budget
+    from thread_budget import ThreadBudget
+
+    cpu_max = tmp_path / "cpu.max"
+    monkeypatch.setattr(thread_budget, "CGROUP_V2_CPU_MAX", str(cpu_max))
+    monkeypatch.setattr(thread_budget, "affinity_cpus", lambda: list(range(16)))
+    cpu_max.write_text("max 100000\n")
+    assert thread_budget.cgroup_cpu_limit() is None
+    cpu_max.write_text("350000 100000\n")
+    assert thread_budget.cgroup_cpu_limit() == 3.5
+
+    budget = ThreadBudget(workers=2)
+    assert budget.layout()["cpus"] == 4 and budget.layout()["source"] == "cgroup_quota"
+    assert budget.native_threads == 2 and not budget.oversubscribed
+    assert ThreadBudget(workers=8).native_threads == 1 and ThreadBudget(workers=8).oversubscribed
+
+    model = Pipeline([("scale", StandardScaler()), ("forest", RandomForestRegressor(n_jobs=-1))])
+    budget.configure_model(model)
+    assert model.named_steps["forest"].n_jobs == 2
+
+
+def test_health_reports_thread_layout(client):
+    """Test /health exposes the thread budget chosen at startup"""
+    import app as backend_app
+
+    threads = client.get("/health").get_json()["threads"]
+    assert threads["native_threads_per_worker"] == backend_app.thread_budget.native_threads
+    assert threads["web_workers"] >= 1 and threads["cpus"] >= 1
+
+
+def test_model_artifact_matches_pipeline_and_rejects_tampering(tmp_path):
+    """Test the exported artifact predicts exactly like the pipeline and fails to load once a file changes"""
+    import joblib
+    import numpy as np
+
+    from model_artifact import ArtifactIntegrityError, FastPricingModel, export
+    from pricing import load_model, model_version, to_feature_frame
+
+    artifact = export(os.environ["MODEL_PATH"], str(tmp_path / "modelo.artifact"))
+    fast = load_model(artifact)
+    assert isinstance(fast, FastPricingModel)
+    assert model_version(artifact) != model_version(os.environ["MODEL_PATH"])
+
+    records = [
+        {"model_year": 2020, "age": 4, "fuel_type": "Gasoline", "transmission": "Automatic", "clean_title": 1},
+        {"model_year": 2012, "age": 11, "fuel_type": "Diesel", "transmission": "6-Speed M/T", "clean_title": 0},
+        {"model_year": None, "age": 2, "fuel_type": "Rocket", "transmission": None, "clean_title": 1},
+    ]
+    frame = to_feature_frame(records)
+    pipeline = joblib.load(os.environ["MODEL_PATH"])
+    expected = pipeline.steps[-1][1].get_booster().inplace_predict(pipeline.steps[0][1].transform(frame))
+    np.testing.assert_array_equal(fast.predict(frame), expected)
+    assert isinstance(fast.arrays["mean"], np.memmap)
+
+    with open(os.path.join(artifact, "num_scale.npy"), "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        f.write(b"\x01")
+    with pytest.raises(ArtifactIntegrityError):
+        FastPricingModel(artifact)
+
+
 def teardown_module():
     """Clean up temporary file after tests"""
     temp_file = os.environ.get("DB_PATH")
     if temp_file and os.path.exists(temp_file):
         os.unlink(temp_file)
+    from app import change_feed
+
+    for path in (change_feed.path, change_feed.lock_path):
+        if os.path.exists(path):
+            os.unlink(path)
@@ -30,6 +30,115 @@ class TestFlaskApp(unittest.TestCase):
         # Should return 200 even if backend is down (error handling)
         self.assertEqual(response.status_code, 200)
 
+    def test_predict_metrics_are_aggregated_without_user_ip(self):
+        """Test that /predict folds into a counter and never passes a user_ip label"""
+        from unittest import mock
+
+        from app import metrics
+
+        metrics.collect()
+        # Even an allow-list that admits user_ip must not see it: the route no longer sends it
+        with mock.patch.object(metrics, "label_allowlist", metrics.label_allowlist | {"user_ip"}):
+            for _ in range(3):
+                self.client.post("/predict", data={"model_year": "2020"})
+            payload = metrics.collect()
+
+        predictions = [p for p in payload["counter"] if p["metric"] == "car_price.frontend.predictions"]
+        self.assertEqual(sum(p["value"] for p in predictions), 3)
+        self.assertTrue(all("user_ip" not in p["dimensions"] for p in predictions))
+
+    def test_metrics_timeseries_records_requests(self):
+        """Test that page views feed the in-process time-series store"""
+        self.client.get("/")
+        response = self.client.get("/metrics/timeseries?series=http&resolution=1m&window=600")
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(sum(response.get_json()["count"]), 1)
+
+    def test_metrics_stream_starts_with_snapshot(self):
+        """Test the SSE endpoint opens with a full metrics snapshot"""
+        response = self.client.get("/metrics/stream", buffered=False)
+        self.assertEqual(response.mimetype, "text/event-stream")
+        first_event = next(iter(response.response)).decode()
+        response.close()
+        self.assertIn("event: snapshot", first_event)
+        self.assertIn("publish_requests", first_event)
+
+    def test_metrics_json_reports_latency_percentiles(self):
+        """Test /metrics/json exposes per-endpoint p50/p95/p99 windows"""
+        self.client.get("/")
+        latency = self.client.get("/metrics/json").get_json()["latency_ms"]
+        self.assertEqual(set(latency["index"]), {"1m", "5m", "15m"})
+        self.assertGreaterEqual(latency["index"]["1m"]["count"], 1)
+
+    def test_backend_calls_carry_deadline_header(self):
+        """Test backend calls send an absolute deadline and honour an earlier upstream one"""
+        import time
+        from unittest import mock
+        import app as frontend_app
+
+        with mock.patch.object(frontend_app.requests, "get") as fake_get:
+            fake_get.return_value.ok = True
+            fake_get.return_value.json.return_value = {"current_value_market_estimado": 1.0}
+            with app.test_request_context("/predict"):
+                frontend_app.call_backend_api("current_value_market", {"age": 4})
+            deadline_ms = int(fake_get.call_args.kwargs["headers"]["X-Request-Deadline"])
+            self.assertAlmostEqual(deadline_ms / 1000.0, time.time() + frontend_app.API_TIMEOUT, delta=2)
+
+            upstream = int((time.time() + 1) * 1000)
+            with app.test_request_context("/predict", headers={"X-Request-Deadline": str(upstream)}):
+                frontend_app.call_backend_api("current_value_market", {"age": 4})
+            self.assertEqual(int(fake_get.call_args.kwargs["headers"]["X-Request-Deadline"]), upstream)
+            self.assertLessEqual(fake_get.call_args.kwargs["timeout"], 1)
+
+            expired = str(int((time.time() - 1) * 1000))
+            fake_get.reset_mock()
+            with app.test_request_context("/predict", headers={"X-Request-Deadline": expired}):
+                result, error = frontend_app.call_backend_api("current_value_market", {"age": 4})
+            self.assertIsNone(result)
+            self.assertIn("deadline", error)
+            fake_get.assert_not_called()
+
+    def test_admission_rejects_with_retry_after(self):
+        """Test a client over its rate limit gets 429 with Retry-After"""
+        from unittest import mock
+        import app as frontend_app
+        from admission import AdmissionController
+
+        form = {"model_year": "2020", "age": "4", "fuel_type": "Gasoline", "transmission": "Automatic", "clean_title": "1"}
+        with mock.patch.object(frontend_app, "admission", AdmissionController(rate=0.5, burst=1)):
+            self.assertEqual(self.client.post("/predict", data=form).status_code, 200)
+            response = self.client.post("/predict", data=form)
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response.headers["Retry-After"], "2")
+            self.assertEqual(self.client.get("/health").status_code, 200)
+
+    def test_fingerprinted_assets_are_served_precompressed(self):
+        """Test built assets are linked by hash and served gzipped with immutable caching"""
+        import gzip
+        import re
+        import tempfile
+        from unittest import mock
+        import app as frontend_app
+        from build_static import build
+        from static_assets import STATIC_DIR, AssetManifest
+
+        with tempfile.TemporaryDirectory() as dist_dir:
+            build(STATIC_DIR, dist_dir)
+            with mock.patch.object(frontend_app, "asset_manifest", AssetManifest(dist_dir)):
+                page = self.client.get("/").data.decode()
+                url = re.search(r'href="(/assets/css/style\.[0-9a-f]{10}\.css)"', page).group(1)
+
+                response = self.client.get(url, headers={"Accept-Encoding": "gzip, deflate"})
+                self.assertEqual(response.headers["Content-Encoding"], "gzip")
+                self.assertIn("immutable", response.headers["Cache-Control"])
+                self.assertEqual(response.headers["Vary"], "Accept-Encoding")
+                with open(f"{STATIC_DIR}/css/style.css", "rb") as f:
+                    self.assertEqual(gzip.decompress(response.data), f.read())
+
+                plain = self.client.get(url, headers={"Accept-Encoding": "gzip;q=0"})
+                self.assertNotIn("Content-Encoding", plain.headers)
+                self.assertEqual(self.client.get("/assets/app.py").status_code, 404)
+
 
 if __name__ == "__main__":
     unittest.main()
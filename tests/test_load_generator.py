@@ -0,0 +1,107 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+# Add the repository root to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from load_generator import LatencyHistogram, LoadGenerator, LoadReport, build_parser, parse_mix  # noqa: E402
+
+
+class StalledPool:
+    """Fake connection pool: every answer takes ``service_seconds`` (or never comes)."""
+
+    def __init__(self, service_seconds, hang=False):
+        self.service_seconds = service_seconds
+        self.hang = hang
+        self.sent = 0
+
+    async def request(self, method, target, body=b"", content_type=""):
+        self.sent += 1
+        await asyncio.sleep(3600 if self.hang else self.service_seconds)
+        return 200, b"{}"
+
+    def close(self):
+        pass
+
+
+def run_generator(argv, pool):
+    generator = LoadGenerator(build_parser().parse_args(argv + ["--mix", "current=1", "--seed", "7"]))
+    generator.backend = generator.frontend = pool
+    return asyncio.run(generator.run())
+
+
+def test_histogram_percentiles_are_exact_to_three_digits():
+    """Test the percentile report of the log-linear histogram"""
+    histogram = LatencyHistogram()
+    for ms in range(1, 1001):
+        histogram.record(ms / 1000.0)
+    summary = histogram.summary()
+    assert summary["count"] == 1000
+    assert summary["min"] == 1.0 and summary["max"] == 1000.0
+    assert summary["mean"] == pytest.approx(500.5)
+    for pct, expected in [(50, 500.0), (90, 900.0), (99, 990.0), (99.9, 999.0)]:
+        assert summary[f"p{pct:g}"] == pytest.approx(expected, rel=1e-3)
+
+    other = LatencyHistogram()
+    other.record(5.0)
+    histogram.merge(other)
+    assert histogram.percentile(100) == pytest.approx(5000.0, rel=1e-3)
+    assert LatencyHistogram().summary()["p99"] == 0.0
+
+
+def test_corrected_latency_counts_the_time_queued_behind_the_schedule():
+    """Test the corrected histogram measures from the intended start, the raw one from the send"""
+    report = LoadReport()
+    report.record("current", intended=0.0, sent=0.9, done=1.0, status=200)
+    report.record("current", intended=1.0, sent=1.0, done=1.1, status=200)
+    result = report.to_dict({})
+    assert result["latency_ms"]["raw"]["max"] == pytest.approx(100.0, rel=1e-3)
+    assert result["latency_ms"]["corrected"]["max"] == pytest.approx(1000.0, rel=1e-3)
+    assert result["status_codes"] == {"200": 2}
+
+
+def test_open_loop_keeps_the_schedule_when_the_service_stalls():
+    """Test open mode keeps sending at the target rate instead of waiting for slow answers"""
+    pool = StalledPool(service_seconds=0.2)
+    report = run_generator(["--mode", "open", "--rate", "100", "--duration", "0.3", "--timeout", "5"], pool)
+    # 30 llegadas programadas aunque cada respuesta tarde 200 ms
+    assert report["requests_completed"] == pool.sent == 30
+    corrected = report["latency_ms"]["corrected"]
+    assert corrected["count"] == 30 and corrected["p50"] >= 200
+    assert report["duration_seconds"] < 1.0
+
+
+def test_closed_loop_paced_schedule_corrects_for_coordinated_omission():
+    """Test paced closed workers keep advancing the intended start while they wait on the service"""
+    pool = StalledPool(service_seconds=0.1)
+    report = run_generator(
+        ["--mode", "closed", "--concurrency", "1", "--rate", "50", "--duration", "0.35", "--timeout", "5"], pool
+    )
+    raw, corrected = report["latency_ms"]["raw"], report["latency_ms"]["corrected"]
+    assert raw["max"] < 150
+    # Cada respuesta llega 80 ms más tarde respecto al horario de 20 ms
+    assert corrected["max"] > raw["max"] + 150
+
+
+def test_timeouts_are_recorded_in_the_latency_tail():
+    """Test timed-out requests count as errors and as latency at the timeout"""
+    report = run_generator(
+        ["--mode", "open", "--rate", "20", "--duration", "0.1", "--timeout", "0.2"], StalledPool(0, hang=True)
+    )
+    assert report["requests_completed"] == 0
+    assert report["errors"] == 2 and report["error_breakdown"] == {"current: TimeoutError": 2}
+    corrected = report["per_endpoint"]["current"]["corrected"]
+    assert corrected["count"] == 2
+    assert corrected["p50"] >= 200
+
+
+def test_parse_mix_validates_endpoints():
+    """Test the endpoint mix parser"""
+    assert parse_mix("current=70,future=30") == {"current": 70.0, "future": 30.0}
+    with pytest.raises(ValueError):
+        parse_mix("checkout=1")
+    with pytest.raises(ValueError):
+        parse_mix("current=0")
@@ -0,0 +1,148 @@
+import gzip
+import importlib.util
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# Load the replay script (hyphenated file name) as a module; it puts backend/ on the path itself
+script_path = os.path.join(os.path.dirname(__file__), "..", "scripts", "replay-traffic.py")
+spec = importlib.util.spec_from_file_location("replay_traffic", script_path)
+replay_traffic = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(replay_traffic)
+
+from traffic_recorder import FRAME_HEADER, RECORDED_HEADERS, read_traffic  # noqa: E402
+
+
+def write_capture(path, records):
+    """Write records in the recorder's frame format, in the given (file) order."""
+    with gzip.open(path, "wb") as f:
+        for meta in records:
+            meta = dict(meta)
+            body = meta.pop("body", b"")
+            encoded = json.dumps(meta).encode("utf-8")
+            f.write(FRAME_HEADER.pack(len(encoded), len(body)) + encoded + body)
+
+
+def record(seq, ts, path="/current_value_market", **fields):
+    meta = {"seq": seq, "ts": ts, "method": "GET", "path": path, "query": "", "headers": {}, "status": 200}
+    meta.update({"latency_ms": 5.0, "body": b""}, **fields)
+    return meta
+
+
+class PricingHandler(BaseHTTPRequestHandler):
+    """Stand-in service: prices depend on the X-Model header, /gone always answers 404, expired deadlines 504."""
+
+    def _answer(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        deadline = self.headers.get("X-Request-Deadline")
+        if deadline is not None and float(deadline) <= time.time() * 1000:
+            self._answer(504, {"error": "deadline"})
+            return
+        if self.path.startswith("/gone"):
+            self._answer(404, {"error": "not found"})
+            return
+        model = self.headers.get("X-Model", "default")
+        self._answer(200, {"precio": 20000 if model == "candidate" else 18000, "modelo": model, "timestamp": "now"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self._answer(201, {"recibido": json.loads(self.rfile.read(length))})
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def service():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PricingHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_recorded_headers_cover_model_class_and_deadline():
+    """Test the headers that change a response or its cost are captured for replay"""
+    for name in ("X-Model", "X-Traffic-Class", "X-Request-Deadline", "Idempotency-Key"):
+        assert name in RECORDED_HEADERS
+
+
+def test_read_traffic_streams_files_merged_in_capture_order(tmp_path):
+    """Test records from several files come out lazily, merged and reordered by capture time"""
+    write_capture(tmp_path / "backend-a.bin.gz", [record(0, 1.0), record(2, 3.0), record(1, 2.5), record(3, 5.0)])
+    write_capture(tmp_path / "backend-b.bin.gz", [record(0, 2.0), record(1, 4.0)])
+
+    records = read_traffic([str(tmp_path)])
+    assert not isinstance(records, list)
+    first = next(records)  # Se lee a demanda, sin cargar la captura entera
+    assert first["ts"] == 1.0
+    assert [r["ts"] for r in records] == [2.0, 2.5, 3.0, 4.0, 5.0]
+
+    # Con ventana 0 sólo se mezclan los archivos: la inversión interna queda a la vista
+    unordered = [r["ts"] for r in read_traffic([str(tmp_path)], reorder_window=0)]
+    assert sorted(unordered) != unordered and len(unordered) == 6
+
+
+def test_replayer_reports_matches_diffs_and_latency(service):
+    """Test replayed responses are diffed against the capture, ignoring volatile keys"""
+    json_headers = {"Content-Type": "application/json"}
+    captured = [
+        record(0, 1.0, headers={"X-Model": "candidate"}, response=json.dumps({"precio": 20000, "modelo": "candidate"})),
+        record(1, 1.1, response=json.dumps({"precio": 17000, "modelo": "default", "timestamp": "then"})),
+        record(2, 1.2, path="/gone", status=200),
+        record(3, 1.3, method="POST", path="/publish_car", status=201, body=b'{"precio": 1}', headers=json_headers),
+        record(4, 1.4, method="POST", path="/publish_car", body_truncated=True),
+    ]
+    replayer = replay_traffic.Replayer(service, concurrency=2, timeout=5, ignore_keys=["timestamp"], max_diffs=10)
+    skipped, elapsed = replayer.run(iter(captured), speed=0)
+    report = replayer.report(skipped, elapsed)
+
+    assert report["replayed"] == 4 and report["errors"] == 0 and report["skipped_truncated"] == 1
+    # X-Model se reenvía: la respuesta del modelo candidato coincide con la capturada
+    assert report["matches"] == 2 and report["mismatches"] == 2
+    diffs = {d["seq"]: d["diff"] for d in report["diffs"]}
+    assert diffs == {1: "json keys differ: precio", 2: "status 200 -> 404"}
+    assert report["paths"]["/current_value_market"]["recorded"]["count"] == 2
+    assert report["paths"]["/current_value_market"]["replayed"]["p50"] > 0
+
+
+def test_replayer_rebases_captured_deadlines(service):
+    """Test a captured absolute deadline keeps its original budget instead of arriving expired"""
+    captured_at = float(int(time.time()) - 3600)
+    headers = {"X-Request-Deadline": str(int(captured_at * 1000 + 2000))}
+    captured = [
+        record(0, captured_at + 0.005, headers=headers),
+        record(1, captured_at + 1.0, headers={"X-Request-Deadline": "soon"}),
+    ]
+
+    rebased = replay_traffic.replay_headers(captured[0], now=100.0)
+    assert rebased["X-Request-Deadline"] == "102000"  # 2 s de margen desde la llegada (ts - latencia)
+    assert "X-Request-Deadline" not in replay_traffic.replay_headers(captured[1])
+
+    replayer = replay_traffic.Replayer(service, concurrency=1, timeout=5, ignore_keys=[], max_diffs=10)
+    skipped, elapsed = replayer.run(iter(captured), speed=0)
+    report = replayer.report(skipped, elapsed)
+    assert report["matches"] == 2 and report["diffs"] == []
+
+
+def test_replay_cli_writes_json_report(service, tmp_path, capsys):
+    """Test the command line reads a capture directory and writes the JSON report"""
+    write_capture(tmp_path / "backend-a.bin.gz", [record(i, float(i)) for i in range(5)])
+    output = tmp_path / "replay.json"
+    replay_traffic.main([str(tmp_path), "--target", service, "--speed", "0", "--concurrency", "1", "--json", str(output)])
+
+    report = json.loads(output.read_text())
+    assert report["replayed"] == 5 and report["matches"] == 5
+    assert "Replayed 5 requests" in capsys.readouterr().out